@@ -0,0 +1,234 @@
+# asgi_app.py - Async serving mode: uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+#
+# A slow upstream call holds a suspended coroutine here instead of a WSGI
+# thread, so one process keeps thousands of questions in flight. Memory
+# search and store writes run on worker threads: a search takes about 2 ms
+# at p50 and up to ~80 ms at p99 on 100k facts, which would stall every
+# coroutine if run on the loop. Needs the optional packages in
+# requirements-async.txt.
+import asyncio
+import json
+import os
+import time
+from urllib.parse import parse_qsl
+from clipix_core import ClipixAI
+from clipix_metrics import REGISTRY, SampledLog
+
+READY_TIMEOUT = float(os.environ.get('CLIPIX_READY_TIMEOUT', 20))
+MAX_BODY = int(os.environ.get('CLIPIX_MAX_BODY', 1024 * 1024))
+log = SampledLog(float(os.environ.get('CLIPIX_LOG_SAMPLE', 0.01)))
+
+HTTP_SECONDS = REGISTRY.histogram('clipix_http_request_seconds', 'HTTP request latency by route', ('route',))
+HTTP_REQUESTS = REGISTRY.counter('clipix_http_requests_total', 'HTTP requests by route and status', ('route', 'status'))
+
+print("🚀 Initializing Clipix AI (async server)...")
+ai = ClipixAI(load=False)
+if os.environ.get('CLIPIX_LAZY_LOAD', '1') == '0':
+    ai.load_knowledge()
+else:
+    ai.start_loading()
+ai.start_expiry_sweeper()
+
+
+class BadRequest(Exception):
+    pass
+
+
+async def read_body(receive):
+    body = bytearray()
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if len(body) > MAX_BODY:
+            raise BadRequest('request body too large')
+        if not message.get('more_body'):
+            return bytes(body)
+
+
+async def read_json(receive):
+    body = await read_body(receive)
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except ValueError:
+        raise BadRequest('body must be JSON')
+    if not isinstance(data, dict):
+        raise BadRequest('body must be a JSON object')
+    return data
+
+
+async def wait_ready():
+    # Requests that need knowledge wait for the load without holding the loop
+    if ai.ready.is_set():
+        return True
+    return await asyncio.to_thread(ai.ready.wait, READY_TIMEOUT)
+
+
+async def chat(scope, receive):
+    if not await wait_ready():
+        return 503, {'response': '🤖 Still waking up, please try again in a moment',
+                     'error': 'Knowledge is still loading, try again shortly'}
+    data = await read_json(receive)
+    user_message = data.get('message', '')
+    try:
+        response = await ai.achat(user_message)
+    except Exception as e:
+        log.error(f"❌ Chat error: {e}")
+        return 200, {'response': '🤖 Sorry, I encountered an error'}
+    log.info(f"📨 {data.get('userId', 'default')}: {user_message} -> 🤖 {response}")
+    return 200, {'response': response}
+
+
+async def search(scope, receive):
+    if not await wait_ready():
+        return 503, {'query': '', 'results': [], 'error': 'Knowledge is still loading, try again shortly'}
+    data = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+    if scope['method'] == 'POST':
+        data.update(await read_json(receive))
+    query = data.get('q', '') or data.get('message', '')
+    try:
+        k = int(data.get('k', ai.search_k))
+    except ValueError:
+        raise BadRequest('k must be an integer')
+    return 200, {'query': query, 'results': await asyncio.to_thread(ai.search, query, k)}
+
+
+async def teach(scope, receive):
+    if not await wait_ready():
+        return 503, {'success': False, 'error': 'Knowledge is still loading, try again shortly'}
+    data = await read_json(receive)
+    topic = str(data.get('topic', 'general')).strip()
+    fact = str(data.get('fact', '')).strip()
+    if not fact:
+        return 200, {'success': False, 'error': 'No fact provided'}
+    try:
+        # The store write (journal fsync, index fork) must not stall every chat on the loop
+        added = await asyncio.to_thread(ai.add_knowledge, topic, fact)
+    except ValueError as e:
+        return 200, {'success': False, 'error': str(e)}
+    return 200, {'success': True, 'added': added, 'topic': topic, 'total_facts': ai.get_stats()['total_facts']}
+
+
+async def stats(scope, receive):
+    if not await wait_ready():
+        return 503, {'total_facts': 0, 'error': 'Knowledge is still loading, try again shortly'}
+    stats = ai.get_stats()
+    return 200, {
+        'total_facts': stats['total_facts'],
+        'total_topics': len(stats['topics']),
+        'topics': stats['topics'],
+        'google_enabled': stats['google_enabled'],
+        'deepseek_enabled': stats['deepseek_enabled'],
+        'store': stats['store'],
+        'cache': stats['cache'],
+        'coalescing': stats['coalescing'],
+        'async': stats['async'],
+        'learning': stats['learning'],
+        'load_phases': stats['load_phases']
+    }
+
+
+async def home(scope, receive):
+    if not ai.ready.is_set():
+        return 200, {'message': 'Clipix AI Mobile API', 'status': 'loading', 'load_phases': ai.get_load_phases()}
+    stats = ai.get_stats()
+    return 200, {
+        'message': 'Clipix AI Mobile API',
+        'status': 'running',
+        'facts': stats['total_facts'],
+        'load_time': f"{stats['load_phases'].get('total', 0):.2f}s",
+        'load_phases': stats['load_phases']
+    }
+
+
+async def health(scope, receive):
+    # Always 200 so platform health checks pass while the index is still loading
+    ready = ai.ready.is_set()
+    health = {
+        'status': 'healthy' if ready else 'starting',
+        'service': 'Clipix AI Mobile API (async)',
+        'ready': ready,
+        'load_phases': ai.get_load_phases(),
+        'providers': ai.get_provider_health(),
+        'timestamp': time.time()
+    }
+    if ready:
+        health['facts'] = ai.get_stats()['total_facts']
+    return 200, health
+
+
+ROUTES = {
+    ('POST', '/api/chat'): chat,
+    ('GET', '/api/search'): search,
+    ('POST', '/api/search'): search,
+    ('POST', '/api/teach'): teach,
+    ('GET', '/api/stats'): stats,
+    ('GET', '/health'): health,
+    ('GET', '/'): home,
+}
+# Route labels for metrics; anything else is counted as 'unmatched'
+PATHS = {path for _, path in ROUTES} | {'/metrics'}
+
+
+async def send_response(send, status, body, content_type):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'content-length', str(len(body)).encode('latin-1')),
+            (b'access-control-allow-origin', b'*'),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await ai.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    started = time.perf_counter()
+    method, path = scope['method'], scope['path']
+    if method == 'OPTIONS':
+        route, status = path if path in PATHS else 'unmatched', 204
+        await send({'type': 'http.response.start', 'status': 204, 'headers': [
+            (b'access-control-allow-origin', b'*'),
+            (b'access-control-allow-methods', b'GET, POST, OPTIONS'),
+            (b'access-control-allow-headers', b'content-type'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b''})
+    elif (method, path) == ('GET', '/metrics'):
+        route, status = path, 200
+        await send_response(send, 200, REGISTRY.render().encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+    else:
+        handler = ROUTES.get((method, path))
+        route = path if handler else 'unmatched'
+        if handler is None:
+            status, payload = 404, {'error': f'no route for {method} {path}'}
+        else:
+            try:
+                status, payload = await handler(scope, receive)
+            except BadRequest as e:
+                status, payload = 400, {'error': str(e)}
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await send_response(send, status, body, 'application/json')
+    HTTP_SECONDS.observe(time.perf_counter() - started, route=route)
+    HTTP_REQUESTS.inc(route=route, status=status)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,107 @@
+# benchmarks/corpus.py - Synthetic knowledge bases, documents and questions
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+CATEGORIES = ['general', 'technology', 'science', 'history', 'mathematics', 'sports', 'news', 'literature']
+# Mixed into some facts so time-sensitive flags and expiry see realistic traffic
+TIMELY_WORDS = ['coach', 'manager', 'appointed', 'contract', '2023', '2024']
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'te', 'vi', 'zo', 'ba', 'de', 'fu', 'ga', 'hi', 'jo', 'pe']
+
+
+def vocabulary(size=20000, seed=7):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 5))))
+    return sorted(words)
+
+
+class FactGenerator:
+    """Deterministic facts whose word frequencies follow a Zipf-like curve."""
+
+    def __init__(self, seed=1, vocabulary_size=20000, timely_rate=0.05):
+        self.rng = random.Random(seed)
+        self.words = vocabulary(vocabulary_size)
+        self.weights = [1 / (rank + 1) for rank in range(len(self.words))]
+        self.timely_rate = timely_rate
+
+    def sentence(self, min_words=8, max_words=30):
+        words = self.rng.choices(self.words, self.weights, k=self.rng.randint(min_words, max_words))
+        if self.rng.random() < self.timely_rate:
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(TIMELY_WORDS))
+        return ' '.join(words).capitalize()
+
+    def facts(self, count):
+        for _ in range(count):
+            yield self.rng.choice(CATEGORIES), self.sentence()
+
+    def question(self, known=None):
+        # Questions about a known fact reuse a few of its words so memory search can hit
+        if known is not None:
+            words = [w for w in known.lower().split() if len(w) > 3]
+            picked = self.rng.sample(words, min(3, len(words)))
+            return f"What is {' '.join(picked)}?"
+        return f"Tell me about {' '.join(self.rng.choices(self.words, k=3))}?"
+
+
+def write_knowledge_file(path, count, seed=1, sample_size=1000):
+    """Stream count facts into an ai_knowledge.json without holding them all in memory.
+
+    Returns an evenly spaced sample of the written facts to build questions from.
+    """
+    generator = FactGenerator(seed)
+    start = datetime.now() - timedelta(days=60)
+    every = max(1, count // sample_size)
+    sample = []
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Category lists are streamed one at a time, so facts are generated per category
+        per_category = [count // len(CATEGORIES) + (1 if i < count % len(CATEGORIES) else 0)
+                        for i in range(len(CATEGORIES))]
+        f.write('{"knowledge_base": {')
+        stamps = []
+        for i, (category, n) in enumerate(zip(CATEGORIES, per_category)):
+            f.write(f'{"," if i else ""}{json.dumps(category)}: [')
+            for j in range(n):
+                fact = generator.sentence()
+                f.write(("," if j else "") + json.dumps(fact, ensure_ascii=False))
+                if j % every == 0:
+                    sample.append(fact)
+                if j % 10 == 0:
+                    stamp = start + timedelta(seconds=generator.rng.randint(0, 60 * 86400))
+                    stamps.append((f"{category}_{fact[:50]}", stamp.isoformat()))
+            f.write(']')
+        f.write('}, "fact_timestamps": {')
+        f.write(','.join(f"{json.dumps(key)}: {json.dumps(value)}" for key, value in stamps))
+        f.write('}, "metadata": ')
+        json.dump({'total_facts': count, 'total_topics': len(CATEGORIES),
+                   'last_updated': datetime.now().isoformat()}, f)
+        f.write('}')
+    os.replace(tmp_path, path)
+    return sample
+
+
+def write_documents(folder, documents=20, paragraphs=50, seed=3):
+    """Plain-text training documents spread over the category folders."""
+    generator = FactGenerator(seed)
+    written = 0
+    for i in range(documents):
+        category = CATEGORIES[i % len(CATEGORIES)]
+        os.makedirs(os.path.join(folder, category), exist_ok=True)
+        with open(os.path.join(folder, category, f"doc_{i:04d}.txt"), 'w', encoding='utf-8') as f:
+            for _ in range(paragraphs):
+                sentences = [generator.sentence(8, 16) for _ in range(generator.rng.randint(1, 4))]
+                f.write('. '.join(sentences) + '.\n\n')
+        written += 1
+    return written
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    path = sys.argv[2] if len(sys.argv) > 2 else "ai_knowledge.json"
+    print(f"🧪 Writing {count} synthetic facts to {path}...")
+    write_knowledge_file(path, count)
+    print("✅ Done")
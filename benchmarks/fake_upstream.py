@@ -0,0 +1,117 @@
+# benchmarks/fake_upstream.py - Local stand-in for Google CSE and DeepSeek
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class UpstreamProfile:
+    """Latency (seconds, with uniform jitter) and failure rate for one provider."""
+
+    def __init__(self, latency=0.2, jitter=0.1, failure_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+
+    def wait(self):
+        time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def fails(self):
+        return random.random() < self.failure_rate
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    # GET answers like Google Custom Search, POST like DeepSeek chat completions
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        profile = self.server.profiles['google']
+        self.server.count('google')
+        profile.wait()
+        if profile.fails():
+            return self._send_json(503, {'error': 'backend unavailable'})
+        year = time.localtime().tm_year
+        self._send_json(200, {'items': [
+            {'title': f'Result {i} ({year})', 'snippet': f'Synthetic search snippet number {i} with enough words to learn from'}
+            for i in range(5)
+        ]})
+
+    def do_POST(self):
+        profile = self.server.profiles['deepseek']
+        self.server.count('deepseek')
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        profile.wait()
+        if profile.fails():
+            return self._send_json(503, {'error': 'backend unavailable'})
+        answer = 'This is a synthetic DeepSeek answer that is long enough to be learned as a fact'
+        if not request.get('stream'):
+            return self._send_json(200, {'choices': [{'message': {'content': answer}}]})
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for word in answer.split(' '):
+            chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The socketserver default of 5 resets connections under async-server load
+    request_queue_size = 1024
+
+    def __init__(self, address, google=None, deepseek=None):
+        super().__init__(address, FakeUpstreamHandler)
+        self.profiles = {'google': google or UpstreamProfile(), 'deepseek': deepseek or UpstreamProfile()}
+        self.lock = threading.Lock()
+        self.requests = {'google': 0, 'deepseek': 0}
+
+    def count(self, provider):
+        with self.lock:
+            self.requests[provider] += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+
+def start_server(google=None, deepseek=None, port=0):
+    """Serve on a background thread; returns the server (see server.url)."""
+    server = FakeUpstreamServer(('127.0.0.1', port), google=google, deepseek=deepseek)
+    threading.Thread(target=server.serve_forever, name='fake-upstream', daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Google CSE / DeepSeek server for benchmarks")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--google-latency', type=float, default=0.2)
+    parser.add_argument('--deepseek-latency', type=float, default=0.8)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeUpstreamServer(
+        ('127.0.0.1', args.port),
+        google=UpstreamProfile(args.google_latency, args.jitter, args.failure_rate),
+        deepseek=UpstreamProfile(args.deepseek_latency, args.jitter, args.failure_rate),
+    )
+    print(f"🧪 Fake upstream on {server.url} (set GOOGLE_API_URL and DEEPSEEK_API_URL to it)")
+    server.serve_forever()
@@ -0,0 +1,313 @@
+# benchmarks/run.py - Latency, throughput and memory benchmarks for Clipix
+#
+#   python benchmarks/run.py --facts 100000                  # run everything, compare with baseline.json
+#   python benchmarks/run.py --scenarios memory_search,save  # a subset
+#   python benchmarks/run.py --save-baseline                 # record the current numbers as the baseline
+#
+# Every scenario runs in its own child process inside a scratch directory, so
+# peak RSS is per scenario and the repo's knowledge files are never touched.
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import FactGenerator, write_documents, write_knowledge_file  # noqa: E402
+from fake_upstream import UpstreamProfile, start_server  # noqa: E402
+
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+RESULT_MARKER = 'BENCH_RESULT '
+SCENARIOS = {}
+
+
+def scenario(func):
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+def percentile(sorted_samples, q):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(q * len(sorted_samples)))]
+
+
+def summarize(latencies, wall_time):
+    samples = sorted(latencies)
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'throughput_per_s': round(len(samples) / wall_time, 1) if wall_time else 0.0,
+    }
+
+
+def timed(func, items):
+    latencies = []
+    started = time.perf_counter()
+    for item in items:
+        t = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - t)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def questions(generator, sample, count, hit_rate):
+    return [
+        generator.question(generator.rng.choice(sample)) if generator.rng.random() < hit_rate else generator.question()
+        for _ in range(count)
+    ]
+
+
+def make_ai():
+    from clipix_core import ClipixAI
+    return ClipixAI()
+
+
+@scenario
+def memory_search(args, sample):
+    ai = make_ai()
+    generator = FactGenerator(seed=11)
+    metrics = timed(ai._instant_memory_search, questions(generator, sample, args.queries, args.hit_rate))
+    metrics['store_memory'] = ai.get_stats()['memory']
+    return metrics
+
+
+@scenario
+def chat(args, sample):
+    ai = make_ai()
+    generator = FactGenerator(seed=12)
+    metrics = timed(ai.chat, questions(generator, sample, args.chat_queries, args.hit_rate))
+    metrics['providers'] = ai.get_stats()['providers']
+    return metrics
+
+
+@scenario
+def train(args, sample):
+    ai = make_ai()
+    write_documents(ai.documents_folder, documents=args.documents, paragraphs=args.paragraphs)
+    started = time.perf_counter()
+    learned = ai.train_from_documents()
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    ai.train_from_documents()
+    unchanged = time.perf_counter() - started
+    metrics = summarize([cold], cold)
+    metrics.update({
+        'documents': args.documents,
+        'facts_learned': learned,
+        'facts_per_s': round(learned / cold, 1) if cold else 0.0,
+        'cold_s': round(cold, 3),
+        'unchanged_s': round(unchanged, 3),
+    })
+    return metrics
+
+
+@scenario
+def save(args, sample):
+    ai = make_ai()
+    generator = FactGenerator(seed=13)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.save_rounds):
+        ai.store.add_many(list(generator.facts(args.save_batch)))
+        t = time.perf_counter()
+        ai.save_knowledge()
+        latencies.append(time.perf_counter() - t)
+    metrics = summarize(latencies, time.perf_counter() - started)
+    metrics['file_mb'] = round(os.path.getsize(ai.knowledge_file) / 1e6, 2)
+    return metrics
+
+
+@scenario
+def api_chat(args, sample):
+    import requests
+    from werkzeug.serving import make_server
+    import render_app
+    render_app.ai.ready.wait()
+    server = make_server('127.0.0.1', 0, render_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/chat"
+    generator = FactGenerator(seed=14)
+    items = questions(generator, sample, args.api_requests, args.hit_rate)
+    local = threading.local()
+    errors = []
+
+    def post(question):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        t = time.perf_counter()
+        response = session.post(url, json={'message': question}, timeout=60)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+        return time.perf_counter() - t
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = list(pool.map(post, items))
+    metrics = summarize(latencies, time.perf_counter() - started)
+    metrics.update({'concurrency': args.concurrency, 'errors': len(errors)})
+    server.shutdown()
+    return metrics
+
+
+def run_child(args):
+    # Runs one scenario in a scratch directory and prints its result as one JSON line
+    workdir = tempfile.mkdtemp(prefix='clipix-bench-')
+    try:
+        os.chdir(workdir)
+        started = time.perf_counter()
+        sample = write_knowledge_file('ai_knowledge.json', args.facts)
+        upstream = start_server(
+            google=UpstreamProfile(args.google_latency, args.jitter, args.failure_rate),
+            deepseek=UpstreamProfile(args.deepseek_latency, args.jitter, args.failure_rate),
+        )
+        os.environ.update({
+            'GOOGLE_API_KEY': 'bench', 'SEARCH_ENGINE_ID': 'bench', 'DEEPSEEK_API_KEY': 'bench',
+            'GOOGLE_API_URL': upstream.url, 'DEEPSEEK_API_URL': upstream.url,
+            'CLIPIX_STORE': args.store, 'CLIPIX_LAZY_LOAD': '0',
+        })
+        setup = time.perf_counter() - started
+        metrics = SCENARIOS[args.child](args, sample)
+        result = {
+            'metrics': metrics,
+            'setup_s': round(setup, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'upstream_requests': dict(upstream.requests),
+        }
+        print(RESULT_MARKER + json.dumps(result), flush=True)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_scenario(name, argv):
+    command = [sys.executable, os.path.abspath(__file__), '--child', name] + argv
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    print(f"❌ {name} failed (exit {completed.returncode}):")
+    print((completed.stderr or completed.stdout)[-2000:])
+    return None
+
+
+def compare(results, baseline, tolerance):
+    # Lower is better for every *_ms / *_s figure and for memory
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before or not result:
+            continue
+        pairs = [(key, value, before['metrics'].get(key)) for key, value in result['metrics'].items()
+                 if key.endswith(('_ms', '_s'))]
+        pairs.append(('peak_rss_mb', result['peak_rss_mb'], before.get('peak_rss_mb')))
+        for key, now, then in pairs:
+            if isinstance(then, (int, float)) and then > 0 and now > then * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {then} -> {now} (+{(now / then - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_report(results):
+    print(f"{'scenario':<15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'rss MB':>9}")
+    for name, result in results.items():
+        if not result:
+            print(f"{name:<15}{'failed':>10}")
+            continue
+        m = result['metrics']
+        print(f"{name:<15}{m['p50_ms']:>10}{m['p95_ms']:>10}{m['p99_ms']:>10}"
+              f"{m['throughput_per_s']:>10}{result['peak_rss_mb']:>9}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clipix benchmarks")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--facts', type=int, default=10000, help="synthetic knowledge base size (10k-5M)")
+    parser.add_argument('--store', default='json', choices=['json', 'sqlite', 'shared'])
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--chat-queries', type=int, default=200)
+    parser.add_argument('--hit-rate', type=float, default=0.7, help="share of questions about known facts")
+    parser.add_argument('--documents', type=int, default=40)
+    parser.add_argument('--paragraphs', type=int, default=50)
+    parser.add_argument('--save-rounds', type=int, default=5)
+    parser.add_argument('--save-batch', type=int, default=1000)
+    parser.add_argument('--api-requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--google-latency', type=float, default=0.05)
+    parser.add_argument('--deepseek-latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown before flagging")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--output', help="also write the results JSON here")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    return parser.parse_known_args()
+
+
+def main():
+    args, _ = parse_args()
+    if args.child:
+        random.seed(0)
+        return run_child(args)
+    # Children get the same options minus the orchestration ones
+    argv = [a for a in sys.argv[1:] if a not in ('--save-baseline',)]
+    names = [name for name in args.scenarios.split(',') if name]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"❌ Unknown scenarios: {', '.join(unknown)} (have {', '.join(SCENARIOS)})")
+        return 2
+    results = {}
+    for name in names:
+        print(f"⏱️ {name} ({args.facts} facts, {args.store} store)...", flush=True)
+        results[name] = run_scenario(name, argv)
+    print_report(results)
+
+    run = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'options': {k: v for k, v in vars(args).items() if k not in ('child', 'save_baseline', 'output')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+    if os.path.exists(BASELINE_FILE) and not args.save_baseline:
+        with open(BASELINE_FILE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('options', {}).get('facts') != args.facts:
+            print(f"⚠️ Baseline was recorded with {baseline.get('options', {}).get('facts')} facts")
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠️ Regression: {line}")
+        if not regressions:
+            print("✅ No regressions against baseline")
+        return 1 if regressions else 0
+    if args.save_baseline:
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Baseline saved to {BASELINE_FILE}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
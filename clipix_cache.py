@@ -0,0 +1,193 @@
+# clipix_cache.py - Response cache for upstream providers
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+TRAILING_PUNCTUATION = re.compile(r'[\s?!.,;:]+$')
+
+
+def normalize_query(query):
+    # Only case, spacing and trailing punctuation: '2+2' vs '2*2' and 'C++' vs 'C#' are different questions
+    return TRAILING_PUNCTUATION.sub('', ' '.join(query.lower().split()))
+
+
+class ResponseCache:
+    """Bounded LRU with per-entry TTL and an optional SQLite disk tier."""
+
+    def __init__(self, max_entries=2048, disk_file=None):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'stores': 0}
+        self.disk = None
+        if disk_file:
+            try:
+                self.disk = sqlite3.connect(disk_file, check_same_thread=False)
+                self.disk.execute('PRAGMA journal_mode=WAL')
+                self.disk.execute(
+                    'CREATE TABLE IF NOT EXISTS response_cache '
+                    '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+                )
+                self.disk.execute('DELETE FROM response_cache WHERE expires < ?', (time.time(),))
+                self.disk.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Response cache disk tier disabled: {e}")
+                self.disk = None
+
+    def _key(self, search_type, query):
+        return f"{search_type}:{normalize_query(query)}"
+
+    def get(self, search_type, query):
+        key = self._key(search_type, query)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self.entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return entry[1]
+                del self.entries[key]
+                self.counters['expired'] += 1
+            if self.disk is not None:
+                row = self.disk.execute(
+                    'SELECT value, expires FROM response_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.counters['disk_hits'] += 1
+                    return row[0]
+            self.counters['misses'] += 1
+            return None
+
+    def put(self, search_type, query, value, ttl):
+        key = self._key(search_type, query)
+        expires = time.time() + ttl
+        with self.lock:
+            self._remember(key, value, expires)
+            self.counters['stores'] += 1
+            if self.disk is not None:
+                try:
+                    self.disk.execute(
+                        'INSERT OR REPLACE INTO response_cache (key, value, expires) VALUES (?, ?, ?)',
+                        (key, value, expires),
+                    )
+                    self.disk.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Response cache write error: {e}")
+
+    def _remember(self, key, value, expires):
+        self.entries[key] = (expires, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.counters['evictions'] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['entries'] = len(self.entries)
+        lookups = stats['hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['disk'] = self.disk is not None
+        return stats
+
+    def close(self):
+        with self.lock:
+            if self.disk is not None:
+                self.disk.close()
+                self.disk = None
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent identical upstream calls into one.
+
+    The first caller for a normalized query runs the call; callers that
+    arrive while it is in flight wait for it and share its result (or its
+    exception) instead of calling upstream themselves.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.lock = threading.Lock()
+        self.counters = {'calls': 0, 'coalesced': 0}
+
+    def do(self, search_type, query, func):
+        key = f"{search_type}:{normalize_query(query)}"
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = _Flight()
+                self.counters['calls'] += 1
+                leader = True
+            else:
+                flight.waiters += 1
+                self.counters['coalesced'] += 1
+                leader = False
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['in_flight'] = len(self.flights)
+            stats['waiting'] = sum(flight.waiters for flight in self.flights.values())
+        total = stats['calls'] + stats['coalesced']
+        stats['coalesce_rate'] = round(stats['coalesced'] / total, 4) if total else 0.0
+        return stats
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop.
+
+    The upstream call runs as its own task, so a caller that disconnects
+    (and is cancelled) does not cancel it for the others sharing it.
+    """
+
+    def __init__(self):
+        self.flights = {}
+        self.counters = {'calls': 0, 'coalesced': 0}
+
+    async def do(self, search_type, query, func):
+        key = f"{search_type}:{normalize_query(query)}"
+        task = self.flights.get(key)
+        if task is None:
+            task = self.flights[key] = asyncio.ensure_future(func())
+            task.add_done_callback(lambda _: self.flights.pop(key, None))
+            self.counters['calls'] += 1
+        else:
+            self.counters['coalesced'] += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        stats = dict(self.counters, in_flight=len(self.flights))
+        total = stats['calls'] + stats['coalesced']
+        stats['coalesce_rate'] = round(stats['coalesced'] / total, 4) if total else 0.0
+        return stats
@@ -1,28 +1,218 @@
 # clipix_core.py - SECURE VERSION
+import asyncio
+import atexit
+import base64
+import codecs
+import hashlib
 import json
 import os
 import re
+import sys
+import threading
 import time
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
-import requests
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 from dotenv import load_dotenv  # ADD THIS
+from clipix_cache import AsyncSingleFlight, ResponseCache, SingleFlight
+from clipix_http import AsyncProviderClient, CircuitBreaker, ProviderClient, ProviderUnavailable, QuotaBudget
+from clipix_learning import LearningQueue
+from clipix_metrics import REGISTRY
+from clipix_query import FLAG_TIME_SENSITIVE, analyze_question, fact_flags
+from clipix_snapshot import fact_key
+from clipix_store import open_store, write_atomic
 
 # Load environment variables from .env file
 load_dotenv()
 
+STAGE_SECONDS = REGISTRY.histogram('clipix_stage_seconds', 'Time spent in each chat pipeline stage', ('stage',))
+CHAT_SECONDS = REGISTRY.histogram('clipix_chat_seconds', 'End-to-end chat latency by answer source', ('source',))
+CHAT_ANSWERS = REGISTRY.counter('clipix_chat_answers_total', 'Chat answers by source', ('source',))
+MEMORY_LOOKUPS = REGISTRY.counter('clipix_memory_lookups_total', 'Memory lookups by result (hit, miss, skipped)', ('result',))
+PROVIDER_CALLS = REGISTRY.counter('clipix_provider_calls_total', 'Upstream provider calls by outcome', ('provider', 'outcome'))
+FALLTHROUGHS = REGISTRY.counter('clipix_fallthrough_total', 'Answers rejected at a stage, moving on to the next', ('stage',))
+
+
+def parse_category_ttls(spec, defaults):
+    ttls = dict(defaults)
+    for part in spec.split(','):
+        if '=' not in part:
+            continue
+        category, days = part.split('=', 1)
+        try:
+            ttls[category.strip()] = float(days)
+        except ValueError:
+            print(f"⚠️ Ignoring TTL for {category.strip()}: {days!r} is not a number of days")
+    return {category: days for category, days in ttls.items() if days > 0}
+
+
+def is_meaningful(text):
+    return len(text) >= 20 and len(text) <= 500 and len(text.split()) >= 5
+
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'[.!?]')
+CHUNK_SIZE = 1 << 20
+# A "paragraph" with no blank line in this many characters is cut at a sentence end
+MAX_PARAGRAPH = 1 << 16
+
+
+def iter_paragraphs(chunks, max_paragraph=MAX_PARAGRAPH):
+    """Paragraphs from a stream of text chunks; a break split across two chunks is still found."""
+    pending = ''
+    for chunk in chunks:
+        pending += chunk
+        start = 0
+        for match in PARAGRAPH_BREAK.finditer(pending):
+            # A break touching the end may continue into the next chunk
+            if match.end() == len(pending):
+                break
+            yield pending[start:match.start()]
+            start = match.end()
+        pending = pending[start:]
+        while len(pending) > max_paragraph:
+            cut = max((m.end() for m in SENTENCE_END.finditer(pending, 0, max_paragraph)), default=max_paragraph)
+            yield pending[:cut]
+            pending = pending[cut:]
+    if pending:
+        yield pending
+
+
+def paragraph_facts(paragraph):
+    paragraph = paragraph.strip()
+    if len(paragraph) < 50:
+        return
+    if len(paragraph) > 200:
+        for sentence in re.split(r'[.!?]+', paragraph):
+            sentence = sentence.strip()
+            if is_meaningful(sentence):
+                yield sentence
+    elif is_meaningful(paragraph):
+        yield paragraph
+
+
+def iter_facts(chunks):
+    for paragraph in iter_paragraphs(chunks):
+        yield from paragraph_facts(paragraph)
+
+
+def extract_facts(content):
+    return list(dict.fromkeys(iter_facts([content])))
+
+
+class DocumentStream:
+    """Reads a UTF-8 document in fixed-size chunks, hashing the bytes as they pass."""
+
+    def __init__(self, file_path, chunk_size=CHUNK_SIZE):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+        self.sha1 = hashlib.sha1()
+        self.bytes_read = 0
+
+    def chunks(self):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        with open(self.file_path, 'rb') as f:
+            while True:
+                raw = f.read(self.chunk_size)
+                if not raw:
+                    break
+                self.sha1.update(raw)
+                self.bytes_read += len(raw)
+                yield decoder.decode(raw)
+        yield decoder.decode(b'', final=True)
+
+    def facts(self):
+        return iter_facts(self.chunks())
+
+    def digest(self):
+        return self.sha1.hexdigest()
+
+
+def file_sha1(file_path, chunk_size=CHUNK_SIZE):
+    # Same digest as DocumentStream, without extracting any facts
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for raw in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(raw)
+    return sha1.hexdigest()
+
+
+def pack_keys(keys):
+    # Sorted 8-byte fact keys as little-endian base64, the training manifest's form of a fact list
+    packed = array('Q', sorted(keys))
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def unpack_keys(text):
+    packed = array('Q')
+    packed.frombytes(base64.b64decode(text))
+    if sys.byteorder != 'little':
+        packed.byteswap()
+    return packed
+
+
+def read_document_facts(file_path):
+    # Runs in training worker processes, so it must stay a module-level function
+    try:
+        stream = DocumentStream(file_path)
+        facts = list(dict.fromkeys(stream.facts()))
+        return stream.digest(), facts
+    except Exception as e:
+        print(f"❌ Error processing {file_path}: {e}")
+        return None, []
+
+
 class ClipixAI:
-    def __init__(self):
+    def __init__(self, load=True):
         print("🧠 CLIPIX AI - Secure Version...")
+        started = time.time()
+        # Set once knowledge is loaded (or failed to load); see start_loading()
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.load_phases = {}
         
         # File paths
         self.knowledge_file = "ai_knowledge.json"
+        self.journal_file = "ai_knowledge.journal"
+        self.snapshot_file = os.getenv('CLIPIX_SNAPSHOT_FILE', "ai_knowledge.idx") or None
+        self.manifest_file = "training_manifest.json"
+        # Fact lists of streamed documents, one NDJSON file each, too big for the manifest
+        self.stream_facts_folder = "training_facts"
+        self.db_file = os.getenv('CLIPIX_DB_FILE', "ai_knowledge.db")
         self.documents_folder = "documents"
         
-        # Knowledge storage
-        self.knowledge_base = defaultdict(list)
-        self.fact_timestamps = {}
-        self.memory_cache = {}
+        # Knowledge storage (json: in-memory index + journal, sqlite: FTS5 on disk,
+        # shared: mmap'd snapshot + journal shared by several worker processes)
+        self.store = open_store(
+            os.getenv('CLIPIX_STORE', 'json'),
+            self.knowledge_file,
+            self.journal_file,
+            self.db_file,
+            compact_every=int(os.getenv('CLIPIX_COMPACT_EVERY', 1000)),
+            fsync_every=int(os.getenv('CLIPIX_FSYNC_EVERY', 32)),
+            fsync_interval=float(os.getenv('CLIPIX_FSYNC_INTERVAL', 1.0)),
+            dedup=os.getenv('CLIPIX_DEDUP', 'reject'),
+            dedup_threshold=float(os.getenv('CLIPIX_DEDUP_THRESHOLD', 0.8)),
+            fuzzy=os.getenv('CLIPIX_FUZZY', '1') != '0',
+            snapshot_file=self.snapshot_file,
+            poll_interval=float(os.getenv('CLIPIX_POLL_INTERVAL', 1.0)),
+        )
+        self.search_k = int(os.getenv('CLIPIX_SEARCH_K', 5))
+        self.min_match = int(os.getenv('CLIPIX_MIN_MATCH', 2))
+        self.expiring_topics = ['sports', 'news', 'current', 'technology', 'politics']
+        self.expiration_days = 30
+        # Per-category TTL in days, e.g. CLIPIX_CATEGORY_TTLS="news=2,sports=7,general=0" (0 keeps forever)
+        self.category_ttls = parse_category_ttls(
+            os.getenv('CLIPIX_CATEGORY_TTLS', ''),
+            {topic: self.expiration_days for topic in self.expiring_topics},
+        )
+        self.store.configure_expiry({category: days * 86400 for category, days in self.category_ttls.items()})
+        self.expire_interval = float(os.getenv('CLIPIX_EXPIRE_INTERVAL', 60))
+        self.train_workers = int(os.getenv('CLIPIX_TRAIN_WORKERS', os.cpu_count() or 1))
         
         # APIs - FROM ENVIRONMENT VARIABLES (SECURE)
         self.google_api_key = os.getenv('GOOGLE_API_KEY')
@@ -32,11 +222,103 @@ class ClipixAI:
         self.google_enabled = bool(self.google_api_key and self.search_engine_id)
         self.deepseek_enabled = bool(self.deepseek_api_key)
         
+        # Pooled keep-alive clients (URLs overridable to point at a local fake server)
+        self.google_client = ProviderClient(
+            'google',
+            os.getenv('GOOGLE_API_URL', "https://www.googleapis.com/customsearch/v1"),
+            max_concurrency=int(os.getenv('GOOGLE_MAX_CONCURRENCY', 8)),
+            connect_timeout=float(os.getenv('CLIPIX_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.getenv('GOOGLE_READ_TIMEOUT', 8)),
+            retries=int(os.getenv('GOOGLE_RETRIES', 2)),
+            breaker=self._breaker(),
+        )
+        self.deepseek_client = ProviderClient(
+            'deepseek',
+            os.getenv('DEEPSEEK_API_URL', "https://api.deepseek.com/v1/chat/completions"),
+            max_concurrency=int(os.getenv('DEEPSEEK_MAX_CONCURRENCY', 8)),
+            connect_timeout=float(os.getenv('CLIPIX_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.getenv('DEEPSEEK_READ_TIMEOUT', 15)),
+            retries=int(os.getenv('DEEPSEEK_RETRIES', 1)),
+            breaker=self._breaker(),
+        )
+        # Google's free tier allows 100 queries a day; part is held back for time-sensitive questions
+        self.google_quota = QuotaBudget(
+            daily_limit=int(os.getenv('GOOGLE_DAILY_QUOTA', 100)),
+            reserve=int(os.getenv('GOOGLE_QUOTA_RESERVE', 30)),
+            utc_offset_hours=float(os.getenv('GOOGLE_QUOTA_UTC_OFFSET', -8)),
+        )
+        
+        # Chat resolution: 'sequential' (memory -> Google -> DeepSeek) or 'hedged'
+        self.chat_mode = os.getenv('CLIPIX_CHAT_MODE', 'sequential')
+        self.hedge_delay = float(os.getenv('CLIPIX_HEDGE_DELAY', 1.0))
+        self.latency_budget = float(os.getenv('CLIPIX_LATENCY_BUDGET', 10))
+        self.batch_concurrency = int(os.getenv('CLIPIX_BATCH_CONCURRENCY', 8))
+        self.upstream_pool = ThreadPoolExecutor(
+            max_workers=int(os.getenv('CLIPIX_UPSTREAM_WORKERS', 16)),
+            thread_name_prefix='clipix-upstream',
+        )
+        
+        # Upstream response cache (short TTL for time-sensitive questions)
+        self.response_cache = ResponseCache(
+            max_entries=int(os.getenv('CLIPIX_CACHE_SIZE', 2048)),
+            disk_file=os.getenv('CLIPIX_CACHE_FILE'),
+        )
+        self.cache_ttl_recent = float(os.getenv('CLIPIX_CACHE_TTL_RECENT', 300))
+        self.cache_ttl = float(os.getenv('CLIPIX_CACHE_TTL', 7 * 24 * 3600))
+        # Facts learned from answers are written behind the request (CLIPIX_LEARN_QUEUE=0 writes inline)
+        learn_queue = int(os.getenv('CLIPIX_LEARN_QUEUE', 1000))
+        self.learning = LearningQueue(
+            self.store,
+            max_pending=learn_queue,
+            batch_size=int(os.getenv('CLIPIX_LEARN_BATCH', 100)),
+            flush_interval=float(os.getenv('CLIPIX_LEARN_FLUSH', 1.0)),
+            block_timeout=float(os.getenv('CLIPIX_LEARN_BLOCK', 0)),
+            ready=self.ready,
+        ) if learn_queue > 0 else None
+        
+        # Documents at least this large are streamed in chunks rather than read whole
+        self.stream_threshold = int(float(os.getenv('CLIPIX_STREAM_THRESHOLD_MB', 16)) * 1024 * 1024)
+        self.stream_chunk = int(os.getenv('CLIPIX_STREAM_CHUNK', CHUNK_SIZE))
+        
+        # Teaching limits
+        self.teach_batch = int(os.getenv('CLIPIX_TEACH_BATCH', 500))
+        self.max_fact_chars = int(os.getenv('CLIPIX_MAX_FACT_CHARS', 2000))
+        
+        # Concurrent identical upstream queries share one call
+        self.single_flight = SingleFlight()
+        # Async server state (asgi_app.py); providers are created on first use
+        self.async_flight = AsyncSingleFlight()
+        self.async_providers = None
+        
+        # Scrape-time gauges for /metrics
+        REGISTRY.gauge('clipix_knowledge_facts', 'Facts in the knowledge store',
+                       lambda: self.store.stats()['total_facts'] if self.ready.is_set() else None)
+        REGISTRY.gauge('clipix_response_cache_entries', 'Entries in the in-memory response cache',
+                       lambda: self.response_cache.stats()['entries'])
+        REGISTRY.gauge('clipix_provider_in_flight', 'Upstream requests in flight', lambda: {
+            'google': self.google_client.stats()['in_flight'],
+            'deepseek': self.deepseek_client.stats()['in_flight'],
+        }, labelnames=('provider',))
+        REGISTRY.gauge('clipix_learn_queue_depth', 'Learned facts waiting to be written',
+                       lambda: self.learning.stats()['depth'] if self.learning else None)
+        
         # Create folders
         self._setup_folders()
-        self.load_knowledge()
+        self.load_phases['init'] = round(time.time() - started, 3)
+        if load:
+            self.load_knowledge()
+        atexit.register(self.store.close)
+        atexit.register(self.stopping.set)
+        atexit.register(self.response_cache.close)
+        atexit.register(self.google_client.close)
+        atexit.register(self.deepseek_client.close)
+        atexit.register(self.upstream_pool.shutdown, wait=False, cancel_futures=True)
+        if self.learning:
+            # atexit runs last-registered first, so pending facts land before the store closes
+            atexit.register(self.learning.close)
         
-        print(f"✅ Clipix AI Ready! {len(self.knowledge_base)} topics")
+        if load:
+            print(f"✅ Clipix AI Ready! {len(self.store.stats()['topics'])} topics")
         if self.google_enabled:
             print("🔍 Google Search: Enabled (Secure)")
         else:
@@ -59,186 +341,436 @@ class ClipixAI:
                 os.makedirs(folder)
     
     def load_knowledge(self):
+        started = time.time()
         try:
-            if os.path.exists(self.knowledge_file):
-                with open(self.knowledge_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                self.knowledge_base = defaultdict(list, data.get('knowledge_base', {}))
-                self.fact_timestamps = data.get('fact_timestamps', {})
-                self._clean_old_knowledge()
-                self._build_memory_cache()
-                print(f"📚 Loaded knowledge: {len(self.knowledge_base)} topics")
+            replayed = self.store.load()
+            self.load_phases['store'] = round(time.time() - started, 3)
+            expire_started = time.time()
+            self.store.expire_due()
+            self.load_phases['expire'] = round(time.time() - expire_started, 3)
+            topics = len(self.store.stats()['topics'])
+            print(f"📚 Loaded knowledge: {topics} topics ({self.store.name} store, {replayed} journal records)")
         except Exception as e:
             print(f"❌ Knowledge load error: {e}")
-            self.knowledge_base = defaultdict(list)
-            self.fact_timestamps = {}
-    
-    def _clean_old_knowledge(self):
-        current_time = datetime.now()
-        expiration_days = 30
-        topics_to_clean = ['sports', 'news', 'current', 'technology', 'politics']
-        for category in topics_to_clean:
-            if category in self.knowledge_base:
-                updated_facts = []
-                for fact in self.knowledge_base[category]:
-                    fact_key = f"{category}_{fact[:50]}"
-                    if fact_key in self.fact_timestamps:
-                        fact_time = datetime.fromisoformat(self.fact_timestamps[fact_key])
-                        if (current_time - fact_time).days < expiration_days:
-                            updated_facts.append(fact)
-                        else:
-                            print(f"🗑️ Removed outdated fact: {fact[:50]}...")
-                    else:
-                        updated_facts.append(fact)
-                        self.fact_timestamps[fact_key] = datetime.now().isoformat()
-                self.knowledge_base[category] = updated_facts
-    
-    def _build_memory_cache(self):
-        self.memory_cache = {}
-        for category, facts in self.knowledge_base.items():
-            for fact in facts:
-                words = fact.lower().split()
-                for word in words:
-                    if len(word) > 3:
-                        if word not in self.memory_cache:
-                            self.memory_cache[word] = []
-                        self.memory_cache[word].append(fact)
+        finally:
+            self.load_phases['total'] = round(self.load_phases.get('init', 0) + time.time() - started, 3)
+            self.ready.set()
+    
+    def start_expiry_sweeper(self):
+        """Expire facts every CLIPIX_EXPIRE_INTERVAL seconds for as long as the process runs."""
+        if self.expire_interval <= 0:
+            return None
+        
+        def sweep():
+            self.ready.wait()
+            while not self.stopping.wait(self.expire_interval):
+                try:
+                    self.store.expire_due()
+                except Exception as e:
+                    print(f"❌ Expiry sweep error: {e}")
+        
+        thread = threading.Thread(target=sweep, name='clipix-expiry', daemon=True)
+        thread.start()
+        return thread
+    
+    def start_loading(self):
+        """Load knowledge on a background thread; callers wait on self.ready."""
+        thread = threading.Thread(target=self.load_knowledge, name='clipix-load', daemon=True)
+        thread.start()
+        return thread
+    
+    def analyze(self, question):
+        with STAGE_SECONDS.time(stage='classify'):
+            return analyze_question(question)
     
     def _is_time_sensitive_question(self, question):
-        question_lower = question.lower()
-        time_sensitive_keywords = [
-            'current', 'now', 'today', 'recent', 'latest', 'new', 'nowadays',
-            'who is', 'what is happening', 'breaking', 'news', 'update',
-            'coach', 'manager', 'president', 'prime minister', 'ceo',
-            'score', 'result', 'winner', 'election', 'appointed'
-        ]
-        sports_teams = [
-            'tottenham', 'spurs', 'arsenal', 'chelsea', 'manchester', 'liverpool',
-            'real madrid', 'barcelona', 'bayern', 'psg'
-        ]
-        return (any(keyword in question_lower for keyword in time_sensitive_keywords) or
-                any(team in question_lower for team in sports_teams))
+        return self.analyze(question).time_sensitive
     
     def chat(self, question):
+        if self.chat_mode == 'hedged':
+            return self._chat_hedged(question)
         start_time = time.time()
+        analysis = self.analyze(question)
         
-        if not self._is_time_sensitive_question(question):
-            memory_result = self._instant_memory_search(question)
+        if not analysis.time_sensitive:
+            memory_result = self._instant_memory_search(question, analysis)
             if memory_result:
-                memory_time = time.time() - start_time
+                memory_time = self._answered('memory', start_time)
                 return f"🤖 {memory_result} ⚡({memory_time:.3f}s)"
-        
+        return self._chat_upstream(question, start_time, analysis)
+    
+    def _breaker(self):
+        return CircuitBreaker(
+            failure_threshold=int(os.getenv('CLIPIX_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('CLIPIX_BREAKER_RESET', 30)),
+        )
+    
+    def _answered(self, source, start_time):
+        total_time = time.time() - start_time
+        CHAT_SECONDS.observe(total_time, source=source)
+        CHAT_ANSWERS.inc(source=source)
+        return total_time
+    
+    def _chat_upstream(self, question, start_time, analysis=None):
+        analysis = analysis or self.analyze(question)
         if self.google_enabled:
-            google_start = time.time()
-            if self._is_time_sensitive_question(question):
+            if analysis.time_sensitive:
                 search_query = self._get_aggressive_current_query(question)
                 result = self._fast_google_search(search_query, "recent_aggressive")
             else:
                 result = self._fast_google_search(question, "standard")
             
-            if result and "error" not in result.lower():
-                if not self._is_time_sensitive_question(question):
-                    self._learn_from_response(question, result)
-                total_time = time.time() - start_time
+            if self._is_acceptable(result):
+                if not analysis.time_sensitive:
+                    self._learn_from_response(question, result, analysis.category)
+                total_time = self._answered('google', start_time)
                 return f"🔍 {result} ⚡({total_time:.2f}s)"
+            FALLTHROUGHS.inc(stage='google')
         
         if self.deepseek_enabled:
-            deepseek_start = time.time()
-            deepseek_result = self._ask_deepseek(question)
-            deepseek_time = time.time() - deepseek_start
+            deepseek_result = self._ask_deepseek(question, analysis.time_sensitive)
             
-            if deepseek_result and "error" not in deepseek_result.lower():
-                if not self._is_time_sensitive_question(question):
-                    self._learn_from_response(question, deepseek_result)
-                total_time = time.time() - start_time
+            if self._is_acceptable(deepseek_result):
+                if not analysis.time_sensitive:
+                    self._learn_from_response(question, deepseek_result, analysis.category)
+                total_time = self._answered('deepseek', start_time)
                 return f"🧠 {deepseek_result} ⚡({total_time:.2f}s)"
+            FALLTHROUGHS.inc(stage='deepseek')
         
-        total_time = time.time() - start_time
+        total_time = self._answered('none', start_time)
         return f"🤖 I don't know about that yet. Try teaching me! ⚡({total_time:.2f}s)"
     
+    async def achat(self, question):
+        """chat() for the async server: upstream calls are awaited, store work runs on threads.
+
+        A memory search takes milliseconds on a large store, and more when it
+        corrects a typo, so it runs on a worker thread rather than the loop.
+        """
+        start_time = time.time()
+        analysis = self.analyze(question)
+        time_sensitive = analysis.time_sensitive
+        
+        if not time_sensitive:
+            memory_result = await asyncio.to_thread(self._instant_memory_search, question, analysis)
+            if memory_result:
+                return f"🤖 {memory_result} ⚡({self._answered('memory', start_time):.3f}s)"
+        
+        if self.google_enabled:
+            if time_sensitive:
+                result = await self._afast_google_search(self._get_aggressive_current_query(question), "recent_aggressive")
+            else:
+                result = await self._afast_google_search(question, "standard")
+            if self._is_acceptable(result):
+                if not time_sensitive:
+                    await self._alearn_from_response(question, result, analysis.category)
+                return f"🔍 {result} ⚡({self._answered('google', start_time):.2f}s)"
+            FALLTHROUGHS.inc(stage='google')
+        
+        if self.deepseek_enabled:
+            result = await self._aask_deepseek(question, time_sensitive)
+            if self._is_acceptable(result):
+                if not time_sensitive:
+                    await self._alearn_from_response(question, result, analysis.category)
+                return f"🧠 {result} ⚡({self._answered('deepseek', start_time):.2f}s)"
+            FALLTHROUGHS.inc(stage='deepseek')
+        
+        return f"🤖 I don't know about that yet. Try teaching me! ⚡({self._answered('none', start_time):.2f}s)"
+    
+    async def _alearn_from_response(self, question, response, category):
+        # The loop never waits on the store: a full learning queue sheds at once,
+        # and without a queue the write and its journal fsync run on a worker thread
+        if self.learning:
+            self._learn_from_response(question, response, category, block=False)
+        else:
+            await asyncio.to_thread(self._learn_from_response, question, response, category)
+    
+    def _async_providers(self):
+        # Built on first use so the WSGI server never needs httpx
+        if self.async_providers is None:
+            max_concurrency = int(os.getenv('CLIPIX_ASYNC_MAX_CONCURRENCY', 256))
+            self.async_providers = {
+                'google': AsyncProviderClient(self.google_client, max_concurrency),
+                'deepseek': AsyncProviderClient(self.deepseek_client, max_concurrency),
+            }
+        return self.async_providers
+    
+    async def _afast_google_search(self, query, search_type="standard"):
+        if not self.google_enabled:
+            return "Google Search not configured"
+        cached = self.response_cache.get(f"google_{search_type}", query)
+        if cached is not None:
+            PROVIDER_CALLS.inc(provider='google', outcome='cached')
+            return cached
+        return await self.async_flight.do(f"google_{search_type}", query, lambda: self._agoogle_request(query, search_type))
+    
+    async def _agoogle_request(self, query, search_type):
+        if not self._google_spend(search_type):
+            return "Google unavailable: daily quota spent"
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await self._async_providers()['google'].get(
+                params=self._google_params(query), retry_if=self._google_retry(search_type),
+            )
+            result, outcome = self._google_result(query, search_type, response)
+            return result
+        except ProviderUnavailable as e:
+            outcome = 'circuit_open'
+            self.google_quota.refund()
+            return f"Google unavailable: {str(e)}"
+        except Exception as e:
+            return f"Google unavailable: {str(e)}"
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='google')
+            PROVIDER_CALLS.inc(provider='google', outcome=outcome)
+    
+    async def _aask_deepseek(self, question, time_sensitive=None):
+        if not self.deepseek_enabled:
+            return "DeepSeek not configured"
+        cached = self.response_cache.get("deepseek", question)
+        if cached is not None:
+            PROVIDER_CALLS.inc(provider='deepseek', outcome='cached')
+            return cached
+        return await self.async_flight.do("deepseek", question, lambda: self._adeepseek_request(question, time_sensitive))
+    
+    async def _adeepseek_request(self, question, time_sensitive):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = await self._async_providers()['deepseek'].post(
+                headers=self._deepseek_headers(), json=self._deepseek_payload(question))
+            answer, outcome = self._deepseek_result(question, time_sensitive, response)
+            return answer
+        except ProviderUnavailable as e:
+            outcome = 'circuit_open'
+            return f"DeepSeek unavailable: {str(e)}"
+        except Exception as e:
+            return f"DeepSeek unavailable: {str(e)}"
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='deepseek')
+            PROVIDER_CALLS.inc(provider='deepseek', outcome=outcome)
+    
+    async def aclose(self):
+        if self.async_providers:
+            for client in self.async_providers.values():
+                await client.close()
+            self.async_providers = None
+    
+    def chat_many(self, questions, max_workers=None):
+        # Memory hits are answered in one batched index pass, misses fan out upstream
+        start_time = time.time()
+        results = [None] * len(questions)
+        analyses = [self.analyze(q) for q in questions]
+        lookups = [i for i, analysis in enumerate(analyses) if not analysis.time_sensitive]
+        with STAGE_SECONDS.time(stage='memory_search_batch'):
+            hits = self.store.search_many(
+                [analyses[i].terms for i in lookups], 1,
+                min_match=self.min_match, fresh_only=True,
+            )
+        memory_time = time.time() - start_time
+        MEMORY_LOOKUPS.inc(len(questions) - len(lookups), result='skipped')
+        for i, found in zip(lookups, hits):
+            MEMORY_LOOKUPS.inc(result='hit' if found else 'miss')
+            if found:
+                self._answered('memory', start_time)
+                results[i] = {
+                    'message': questions[i],
+                    'response': f"🤖 {found[0]['fact']} ⚡({memory_time:.3f}s)",
+                    'source': 'memory',
+                    'time': round(memory_time, 4),
+                }
+        
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            workers = min(max_workers or self.batch_concurrency, len(misses))
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clipix-batch') as pool:
+                futures = {pool.submit(self._answer_miss, questions[i], analyses[i]): i for i in misses}
+                for future, i in futures.items():
+                    response, elapsed = future.result()
+                    results[i] = {
+                        'message': questions[i],
+                        'response': response,
+                        'source': 'upstream',
+                        'time': round(elapsed, 4),
+                    }
+        return results
+    
+    def _answer_miss(self, question, analysis):
+        start_time = time.time()
+        try:
+            if self.chat_mode == 'hedged':
+                response = self._chat_hedged(question, analysis)
+            else:
+                response = self._chat_upstream(question, start_time, analysis)
+        except Exception as e:
+            print(f"❌ Batch item error: {e}")
+            response = '🤖 Sorry, I encountered an error'
+        return response, time.time() - start_time
+    
+    def _chat_hedged(self, question, analysis=None):
+        # Memory answers first; on a miss Google starts and DeepSeek is hedged in after
+        # hedge_delay or as soon as Google fails. The first acceptable answer wins.
+        start_time = time.time()
+        deadline = start_time + self.latency_budget
+        analysis = analysis or self.analyze(question)
+        time_sensitive = analysis.time_sensitive
+        # A running Google future can't be cancelled, so it only starts after a memory miss
+        if not time_sensitive:
+            memory_result = self._instant_memory_search(question, analysis)
+            if memory_result:
+                return f"🤖 {memory_result} ⚡({self._answered('memory', start_time):.3f}s)"
+        
+        pending = {}
+        if self.google_enabled:
+            pending[self.upstream_pool.submit(self._ask_upstream, 'google', question, time_sensitive)] = 'google'
+        
+        hedge_at = start_time + self.hedge_delay if pending else start_time
+        deepseek_started = not self.deepseek_enabled
+        while pending or not deepseek_started:
+            now = time.time()
+            if now >= deadline:
+                break
+            if not deepseek_started and (now >= hedge_at or not pending):
+                pending[self.upstream_pool.submit(self._ask_upstream, 'deepseek', question, time_sensitive)] = 'deepseek'
+                deepseek_started = True
+            wait_until = deadline if deepseek_started else min(deadline, hedge_at)
+            done, _ = wait(list(pending), timeout=max(0, wait_until - time.time()), return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = pending.pop(future)
+                result = future.result()
+                if self._is_acceptable(result):
+                    self._cancel(pending)
+                    if not time_sensitive:
+                        self._learn_from_response(question, result, analysis.category)
+                    icon = "🔍" if provider == 'google' else "🧠"
+                    return f"{icon} {result} ⚡({self._answered(provider, start_time):.2f}s)"
+                FALLTHROUGHS.inc(stage=provider)
+        
+        self._cancel(pending)
+        total_time = self._answered('none', start_time)
+        return f"🤖 I don't know about that yet. Try teaching me! ⚡({total_time:.2f}s)"
+    
+    def _ask_upstream(self, provider, question, time_sensitive):
+        try:
+            if provider == 'deepseek':
+                return self._ask_deepseek(question, time_sensitive)
+            if time_sensitive:
+                return self._fast_google_search(self._get_aggressive_current_query(question), "recent_aggressive")
+            return self._fast_google_search(question, "standard")
+        except Exception as e:
+            return f"{provider} unavailable: {e}"
+    
+    def _cancel(self, pending):
+        for future in pending:
+            future.cancel()
+    
+    def _is_acceptable(self, result):
+        if not result:
+            return False
+        result_lower = result.lower()
+        return not any(marker in result_lower for marker in ("error", "unavailable", "not configured", "no results found"))
+    
     def _get_aggressive_current_query(self, question):
         current_year = datetime.now().year
         return f"{question} {current_year} latest news update today"
     
-    def _instant_memory_search(self, question):
-        if self._is_time_sensitive_question(question):
+    def _instant_memory_search(self, question, analysis=None):
+        analysis = analysis or self.analyze(question)
+        if analysis.time_sensitive:
+            MEMORY_LOOKUPS.inc(result='skipped')
             return None
-        question_lower = question.lower()
-        question_words = set(question_lower.split())
-        best_match = None
-        best_score = 0
-        stop_words = {'what', 'is', 'the', 'a', 'an', 'how', 'why', 'when', 'where', 'tell', 'me', 'about'}
-        meaningful_words = [word for word in question_words if word not in stop_words and len(word) > 3]
-        for word in meaningful_words:
-            if word in self.memory_cache:
-                for fact in self.memory_cache[word]:
-                    if not self._is_fact_time_sensitive(fact):
-                        score = self._calculate_relevance(question_lower, fact.lower())
-                        if score > best_score:
-                            best_score = score
-                            best_match = fact
-        return best_match if best_score > 3 else None
+        with STAGE_SECONDS.time(stage='memory_search'):
+            results = self.store.search(analysis.terms, 1, min_match=self.min_match, fresh_only=True)
+        MEMORY_LOOKUPS.inc(result='hit' if results else 'miss')
+        return results[0]['fact'] if results else None
     
-    def _is_fact_time_sensitive(self, fact):
-        fact_lower = fact.lower()
-        time_sensitive_indicators = [
-            '2021', '2022', '2023', '2024', 'coach', 'manager', 'appointed',
-            'tottenham', 'conte', 'kane', 'contract'
-        ]
-        return any(indicator in fact_lower for indicator in time_sensitive_indicators)
+    def search(self, question, k=None):
+        k = self.search_k if k is None else k
+        return self.store.search(self.analyze(question).terms, k, min_match=self.min_match, fresh_only=True)
     
-    def _calculate_relevance(self, question, fact):
-        score = 0
-        q_words = set(question.split())
-        f_words = set(fact.split())
-        common_words = q_words.intersection(f_words)
-        score += len(common_words) * 2
-        return score
+    def _is_fact_time_sensitive(self, fact):
+        return bool(fact_flags(fact) & FLAG_TIME_SENSITIVE)
     
     def save_knowledge(self):
         try:
-            data = {
-                'knowledge_base': dict(self.knowledge_base),
-                'fact_timestamps': self.fact_timestamps,
-                'metadata': {
-                    'total_facts': sum(len(facts) for facts in self.knowledge_base.values()),
-                    'total_topics': len(self.knowledge_base),
-                    'last_updated': datetime.now().isoformat()
-                }
-            }
-            with open(self.knowledge_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            self._build_memory_cache()
+            if self.learning and self.ready.is_set():
+                self.learning.flush()
+            with STAGE_SECONDS.time(stage='save'):
+                self.store.save()
         except Exception as e:
             print(f"❌ Knowledge save error: {e}")
     
     def _fast_google_search(self, query, search_type="standard"):
         if not self.google_enabled:
             return "Google Search not configured"
+        cached = self.response_cache.get(f"google_{search_type}", query)
+        if cached is not None:
+            PROVIDER_CALLS.inc(provider='google', outcome='cached')
+            return cached
+        return self.single_flight.do(f"google_{search_type}", query, lambda: self._google_request(query, search_type))
+    
+    def _google_params(self, query):
+        return {
+            'key': self.google_api_key,  # FROM ENV VARIABLE
+            'cx': self.search_engine_id, # FROM ENV VARIABLE
+            'q': query,
+            'num': 5
+        }
+    
+    def _google_spend(self, search_type):
+        if self.google_quota.try_spend(priority=search_type == "recent_aggressive"):
+            return True
+        PROVIDER_CALLS.inc(provider='google', outcome='quota')
+        return False
+    
+    def _google_retry(self, search_type):
+        # Every retry is another billed call, so it needs a unit of quota of its own;
+        # a quota error will not clear on a retry
+        def retry_if(response):
+            if response is not None and self._google_quota_error(response):
+                return False
+            return self._google_spend(search_type)
+        return retry_if
+    
+    @staticmethod
+    def _google_quota_error(response):
+        return response.status_code in (403, 429) and 'quota' in response.text.lower()
+    
+    def _google_result(self, query, search_type, response):
+        # (answer, outcome) from a requests or httpx response
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('items'):
+                best_result = self._find_most_recent_result(data['items'], query) or data['items'][0]
+                result = f"{best_result['title']}: {best_result['snippet']}"
+                ttl = self.cache_ttl_recent if self._is_time_sensitive_question(query) else self.cache_ttl
+                self.response_cache.put(f"google_{search_type}", query, result, ttl)
+                return result, 'ok'
+            return "No results found", 'empty'
+        if self._google_quota_error(response):
+            self.google_quota.exhaust()
+        return f"Google Error: {response.status_code}", 'error'
+    
+    def _google_request(self, query, search_type):
+        if not self._google_spend(search_type):
+            return "Google unavailable: daily quota spent"
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            url = "https://www.googleapis.com/customsearch/v1"
-            params = {
-                'key': self.google_api_key,  # FROM ENV VARIABLE
-                'cx': self.search_engine_id, # FROM ENV VARIABLE
-                'q': query,
-                'num': 5
-            }
-            response = requests.get(url, params=params, timeout=8)
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('items'):
-                    best_result = self._find_most_recent_result(data['items'], query)
-                    if best_result:
-                        return f"{best_result['title']}: {best_result['snippet']}"
-                    else:
-                        first_item = data['items'][0]
-                        return f"{first_item['title']}: {first_item['snippet']}"
-                else:
-                    return "No results found"
-            else:
-                return f"Google Error: {response.status_code}"
+            response = self.google_client.get(
+                params=self._google_params(query), retry_if=self._google_retry(search_type),
+            )
+            result, outcome = self._google_result(query, search_type, response)
+            return result
+        except ProviderUnavailable as e:
+            outcome = 'circuit_open'
+            self.google_quota.refund()
+            return f"Google unavailable: {str(e)}"
         except Exception as e:
             return f"Google unavailable: {str(e)}"
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='google')
+            PROVIDER_CALLS.inc(provider='google', outcome=outcome)
     
     def _find_most_recent_result(self, items, query):
         current_year = datetime.now().year
@@ -257,115 +789,495 @@ class ClipixAI:
             return scored_results[0][1]
         return None
     
-    def _ask_deepseek(self, question):
+    def _ask_deepseek(self, question, time_sensitive=None):
         if not self.deepseek_enabled:
             return "DeepSeek not configured"
+        cached = self.response_cache.get("deepseek", question)
+        if cached is not None:
+            PROVIDER_CALLS.inc(provider='deepseek', outcome='cached')
+            return cached
+        return self.single_flight.do("deepseek", question, lambda: self._deepseek_request(question, time_sensitive))
+    
+    def _deepseek_headers(self):
+        return {
+            "Authorization": f"Bearer {self.deepseek_api_key}",  # FROM ENV
+            "Content-Type": "application/json"
+        }
+    
+    def _deepseek_payload(self, question):
+        return {
+            "model": "deepseek-chat",
+            "messages": [{"role": "user", "content": question}],
+            "max_tokens": 500,
+            "temperature": 0.7
+        }
+    
+    def _deepseek_result(self, question, time_sensitive, response):
+        # (answer, outcome) from a requests or httpx response
+        if response.status_code != 200:
+            return f"DeepSeek Error: {response.status_code}", 'error'
+        answer = response.json()['choices'][0]['message']['content']
+        if time_sensitive is None:
+            time_sensitive = self._is_time_sensitive_question(question)
+        ttl = self.cache_ttl_recent if time_sensitive else self.cache_ttl
+        self.response_cache.put("deepseek", question, answer, ttl)
+        return answer, 'ok'
+    
+    def _deepseek_request(self, question, time_sensitive):
+        started = time.perf_counter()
+        outcome = 'error'
         try:
-            url = "https://api.deepseek.com/v1/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.deepseek_api_key}",  # FROM ENV
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": "deepseek-chat",
-                "messages": [{"role": "user", "content": question}],
-                "max_tokens": 500,
-                "temperature": 0.7
-            }
-            response = requests.post(url, headers=headers, json=data, timeout=15)
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content']
-            else:
-                return f"DeepSeek Error: {response.status_code}"
+            response = self.deepseek_client.post(headers=self._deepseek_headers(), json=self._deepseek_payload(question))
+            answer, outcome = self._deepseek_result(question, time_sensitive, response)
+            return answer
+        except ProviderUnavailable as e:
+            outcome = 'circuit_open'
+            return f"DeepSeek unavailable: {str(e)}"
         except Exception as e:
             return f"DeepSeek unavailable: {str(e)}"
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='deepseek')
+            PROVIDER_CALLS.inc(provider='deepseek', outcome=outcome)
+    
+    def _ask_deepseek_stream(self, question, time_sensitive=False):
+        if not self.deepseek_enabled:
+            yield "DeepSeek not configured"
+            return
+        cached = self.response_cache.get("deepseek", question)
+        if cached is not None:
+            PROVIDER_CALLS.inc(provider='deepseek', outcome='cached')
+            yield cached
+            return
+        started = time.perf_counter()
+        data = dict(self._deepseek_payload(question), stream=True)
+        parts = []
+        completed = False
+        try:
+            with self.deepseek_client.stream('POST', headers=self._deepseek_headers(), json=data) as response:
+                if response.status_code != 200:
+                    raise RuntimeError(f"DeepSeek Error: {response.status_code}")
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == '[DONE]':
+                        completed = True
+                        break
+                    delta = json.loads(payload)['choices'][0].get('delta', {}).get('content')
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            if not completed:
+                raise RuntimeError("DeepSeek stream ended before [DONE]")
+        finally:
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage='deepseek_stream')
+            PROVIDER_CALLS.inc(provider='deepseek', outcome=('ok' if parts else 'empty') if completed else 'error')
+        # Only a finished answer is cached; a cut-off one would be served as if complete
+        answer = ''.join(parts)
+        if answer:
+            ttl = self.cache_ttl_recent if time_sensitive else self.cache_ttl
+            self.response_cache.put("deepseek", question, answer, ttl)
     
-    def _learn_from_response(self, question, response):
-        category = self._categorize_question(question)
+    def chat_stream(self, question):
+        # Same resolution order as chat(), but DeepSeek output is yielded as it arrives
+        start_time = time.time()
+        analysis = self.analyze(question)
+        time_sensitive = analysis.time_sensitive
+        
+        if not time_sensitive:
+            memory_result = self._instant_memory_search(question, analysis)
+            if memory_result:
+                yield f"🤖 {memory_result} ⚡({self._answered('memory', start_time):.3f}s)"
+                return
+        
+        if self.google_enabled:
+            result = self._ask_upstream('google', question, time_sensitive)
+            if self._is_acceptable(result):
+                if not time_sensitive:
+                    self._learn_from_response(question, result, analysis.category)
+                yield f"🔍 {result} ⚡({self._answered('google', start_time):.2f}s)"
+                return
+            FALLTHROUGHS.inc(stage='google')
+        
+        if self.deepseek_enabled:
+            parts = []
+            completed = False
+            try:
+                for delta in self._ask_deepseek_stream(question, time_sensitive):
+                    if not parts:
+                        yield "🧠 "
+                    parts.append(delta)
+                    yield delta
+                completed = True
+            except Exception as e:
+                print(f"❌ DeepSeek stream error: {e}")
+            if parts and not completed:
+                # The client already has the partial text; mark it and learn nothing from it
+                yield f" ⚠️ (answer interrupted) ⚡({self._answered('interrupted', start_time):.2f}s)"
+                return
+            answer = ''.join(parts)
+            if parts:
+                if self._is_acceptable(answer) and not time_sensitive:
+                    self._learn_from_response(question, answer, analysis.category)
+                yield f" ⚡({self._answered('deepseek', start_time):.2f}s)"
+                return
+            FALLTHROUGHS.inc(stage='deepseek')
+        
+        yield f"🤖 I don't know about that yet. Try teaching me! ⚡({self._answered('none', start_time):.2f}s)"
+    
+    def _learn_from_response(self, question, response, category=None, block=True):
+        category = category or self._categorize_question(question)
         if len(response) > 30 and len(response) < 500:
-            self.knowledge_base[category].append(response)
-            fact_key = f"{category}_{response[:50]}"
-            self.fact_timestamps[fact_key] = datetime.now().isoformat()
-            words = response.lower().split()
-            for word in words:
-                if len(word) > 3:
-                    if word not in self.memory_cache:
-                        self.memory_cache[word] = []
-                    self.memory_cache[word].append(response)
-            self.save_knowledge()
+            if self.learning:
+                self.learning.put(category, response, block=block)
+                return
+            with STAGE_SECONDS.time(stage='learn'):
+                self.store.add(category, response)
     
     def _categorize_question(self, question):
-        question_lower = question.lower()
-        categories = {
-            'technology': ['computer', 'programming', 'software', 'hardware', 'code', 'ai', 'tech'],
-            'science': ['physics', 'chemistry', 'biology', 'scientific', 'research', 'space'],
-            'history': ['history', 'historical', 'war', 'ancient', 'century', 'battle'],
-            'mathematics': ['math', 'calculus', 'algebra', 'equation', 'geometry', 'calculate'],
-        }
-        for category, keywords in categories.items():
-            if any(keyword in question_lower for keyword in keywords):
-                return category
-        return 'general'
+        return self.analyze(question).category
+    
+    def _teach_item(self, record):
+        # (topic, fact) from an NDJSON line, a dict or a pair; raises ValueError when unusable
+        if isinstance(record, (bytes, bytearray)):
+            record = record.decode('utf-8')
+        if isinstance(record, str):
+            try:
+                record = json.loads(record)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"invalid JSON: {e.msg}")
+        if isinstance(record, dict):
+            topic, fact = record.get('topic', 'general'), record.get('fact')
+        elif isinstance(record, (list, tuple)) and len(record) == 2:
+            topic, fact = record
+        else:
+            raise ValueError("expected an object with 'topic' and 'fact'")
+        if not isinstance(topic, str) or not isinstance(fact, str):
+            raise ValueError("'topic' and 'fact' must be strings")
+        topic, fact = topic.strip() or 'general', fact.strip()
+        if not fact:
+            raise ValueError("empty fact")
+        if len(fact) > self.max_fact_chars:
+            raise ValueError(f"fact longer than {self.max_fact_chars} characters")
+        return topic, fact
     
-    def train_from_documents(self):
+    def add_knowledge(self, topic, fact):
+        """Teach one fact; returns False when it was already known (or merged away)."""
+        return self.store.add(*self._teach_item((topic, fact)))
+    
+    def add_many(self, records, batch_size=None):
+        """Teach facts from an iterable of NDJSON lines, dicts or (topic, fact) pairs.
+        
+        Records are parsed as they are read and written to the store one batch
+        at a time, so the input is never held in memory whole and each batch is
+        journaled once.
+        """
+        batch_size = batch_size or self.teach_batch
+        report = {'accepted': 0, 'duplicates': 0, 'rejected': 0, 'errors': []}
+        batch = []
+        
+        def flush():
+            with STAGE_SECONDS.time(stage='teach_batch'):
+                added = self.store.add_many(batch)
+            report['accepted'] += added
+            report['duplicates'] += len(batch) - added
+            batch.clear()
+        
+        for line_number, record in enumerate(records, 1):
+            if isinstance(record, (str, bytes, bytearray)) and not record.strip():
+                continue
+            try:
+                batch.append(self._teach_item(record))
+            except ValueError as e:
+                report['rejected'] += 1
+                if len(report['errors']) < 20:
+                    report['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        return report
+    
+    def train_from_documents(self, workers=None):
         print("📚 Training from organized documents...")
-        all_documents = []
+        all_documents = {}
         for root, dirs, files in os.walk(self.documents_folder):
             for file in files:
                 if file.endswith(('.txt', '.md')):
                     full_path = os.path.join(root, file)
-                    all_documents.append((full_path, os.path.basename(root)))
+                    all_documents[full_path] = os.path.basename(root)
         if not all_documents:
             print("❌ No documents found. Add files to documents/ folder")
             return 0
-        total_facts = 0
-        for doc_path, folder_name in all_documents:
-            facts = self._process_document(doc_path, folder_name)
-            total_facts += len(facts)
+        
+        manifest = self._load_manifest()
+        previous = set()
+        for entry in manifest.values():
+            previous.update(unpack_keys(entry.get('keys', '')))
+        changed = []
+        touched = 0
+        for doc_path, folder_name in all_documents.items():
+            stat = os.stat(doc_path)
+            entry = manifest.get(doc_path)
+            if entry and entry['size'] == stat.st_size and entry['category'] == folder_name:
+                if entry['mtime'] == stat.st_mtime:
+                    continue
+                # Touched but not edited: hashing costs far less than extracting the facts again
+                if entry.get('sha1') == file_sha1(doc_path):
+                    entry['mtime'] = stat.st_mtime
+                    touched += 1
+                    continue
+            changed.append((doc_path, folder_name, stat))
+        # Streamed files that are gone or no longer streamed; their facts are diffed from their fact files
+        retired = []
+        for doc_path in set(manifest) - set(all_documents):
+            print(f"   🗑️ {os.path.basename(doc_path)}: removed")
+            retired.append(manifest.pop(doc_path))
+        
+        print(f"   ⏭️ {len(all_documents) - len(changed)} unchanged ({touched} touched), {len(changed)} to process")
+        started = time.time()
+        # Large files are streamed into the store in-process instead of being read whole by a worker
+        large = [item for item in changed if item[2].st_size >= self.stream_threshold]
+        changed = [item for item in changed if item[2].st_size < self.stream_threshold]
+        workers = workers or self.train_workers
+        paths = [doc_path for doc_path, _, _ in changed]
+        if len(paths) > 1 and workers > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+                extracted = list(pool.map(read_document_facts, paths, chunksize=max(1, len(paths) // (workers * 4))))
+        else:
+            extracted = [read_document_facts(path) for path in paths]
+        
+        # The manifest keeps only 8-byte keys per document; texts are needed just for the facts to add
+        found = {}
+        owners = defaultdict(list)
+        for (doc_path, folder_name, stat), (digest, facts) in zip(changed, extracted):
+            if digest is None:
+                continue
+            old = manifest.get(doc_path, {})
+            if old.get('streamed'):
+                retired.append(old)
+            keys = []
+            for fact in facts:
+                key = fact_key(folder_name, fact)
+                keys.append(key)
+                found.setdefault(key, (folder_name, fact))
+                owners[key].append(doc_path)
+            manifest[doc_path] = entry = {
+                'mtime': stat.st_mtime,
+                'size': stat.st_size,
+                'sha1': digest,
+                'category': folder_name,
+                'fact_count': len(facts),
+                'keys': pack_keys(keys),
+            }
+            # Facts kept from the old version are not added again, so their rejections carry over
+            if not old.get('streamed'):
+                provided = set(keys)
+                rejected = [pair for pair in old.get('rejected', ()) if pair[0] in provided]
+                if rejected:
+                    entry['rejected'] = rejected
             print(f"   ✅ {os.path.basename(doc_path)}: {len(facts)} facts")
+        
+        # Diff old and new key sets so the index is touched once, incrementally.
+        # A file about to be streamed no longer provides its old facts.
+        current = set()
+        streaming = {doc_path for doc_path, _, _ in large}
+        for doc_path, entry in manifest.items():
+            if doc_path not in streaming:
+                current.update(unpack_keys(entry.get('keys', '')))
+        gone = previous - current
+        removed = self.store.remove_many(self._stored_facts(gone))
+        rejections = []
+        added = self.store.add_many(sorted(fact for key, fact in found.items() if key not in previous), rejections)
+        for loser, winner in rejections:
+            for doc_path in owners[fact_key(*loser)]:
+                manifest[doc_path].setdefault('rejected', []).append([fact_key(*loser), fact_key(*winner)])
+        for entry in retired:
+            removed += self._retire_streamed(entry, current, gone=gone)
+        for doc_path, folder_name, stat in large:
+            streamed_added, streamed_removed = self._stream_document(
+                doc_path, folder_name, stat, manifest, current, gone)
+            added += streamed_added
+            removed += streamed_removed
+        added += self._readmit(manifest, gone)
         self.save_knowledge()
-        print(f"🎯 Training complete! Added {total_facts} facts")
-        return total_facts
+        write_atomic(self.manifest_file, {'files': manifest})
+        elapsed = time.time() - started
+        total_mb = sum(stat.st_size for _, _, stat in changed + large) / 1e6
+        print(f"🎯 Training complete! Added {added} facts, removed {removed} stale facts "
+              f"({total_mb:.1f} MB at {total_mb / elapsed if elapsed else 0:.1f} MB/s)")
+        return added
     
-    def _process_document(self, file_path, category):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            facts = self._extract_facts(content, category)
-            for fact in facts:
-                self.knowledge_base[category].append(fact)
-            return facts
-        except Exception as e:
-            print(f"❌ Error processing {file_path}: {e}")
+    def _stored_facts(self, keys):
+        # Stale facts are known by key only, so their texts are looked up in the store
+        if not keys:
             return []
+        return [(category, fact) for category, fact in self.store.facts() if fact_key(category, fact) in keys]
     
-    def _extract_facts(self, content, category):
-        facts = []
-        paragraphs = re.split(r'\n\s*\n', content)
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if len(paragraph) < 50:
+    def _readmit(self, manifest, gone):
+        # A near-duplicate the store rejected is kept in its document's manifest entry as
+        # [key, key of the fact it lost to]; once that fact is retired it is offered again
+        added = 0
+        for doc_path, entry in manifest.items():
+            losers = {loser for loser, winner in entry.get('rejected', ()) if winner in gone}
+            if not losers:
                 continue
-            if len(paragraph) > 200:
-                sentences = re.split(r'[.!?]+', paragraph)
-                for sentence in sentences:
-                    sentence = sentence.strip()
-                    if self._is_meaningful(sentence):
-                        facts.append(sentence)
-            else:
-                if self._is_meaningful(paragraph):
-                    facts.append(paragraph)
-        return facts
+            rejected = [pair for pair in entry.pop('rejected') if pair[0] not in losers]
+            rejections = []
+            facts = [item for item in self._document_facts(doc_path, entry) if fact_key(*item) in losers]
+            added += self.store.add_many(facts, rejections)
+            rejected += [[fact_key(*loser), fact_key(*winner)] for loser, winner in rejections]
+            if rejected:
+                entry['rejected'] = rejected
+            print(f"   ♻️ {os.path.basename(doc_path)}: {len(facts) - len(rejections)} near-duplicates readmitted")
+        return added
+    
+    def _document_facts(self, doc_path, entry):
+        # Streamed files are read back from their fact file rather than parsed again
+        if entry.get('streamed'):
+            with open(entry['facts_file'], 'r', encoding='utf-8') as f:
+                for line in f:
+                    yield tuple(json.loads(line))
+            return
+        for fact in DocumentStream(doc_path, self.stream_chunk).facts():
+            yield entry['category'], fact
+    
+    def _facts_file(self, doc_path):
+        name = hashlib.sha1(os.path.abspath(doc_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.stream_facts_folder, f"{name}.ndjson")
+    
+    def _stream_document(self, doc_path, folder_name, stat, manifest, current, gone):
+        # Facts go to the store a batch at a time, so memory does not grow with the file.
+        # They are also written to the file's fact file, and only their 8-byte keys are
+        # kept to diff against the previous version; returns (added, removed).
+        started = time.time()
+        stream = DocumentStream(doc_path, self.stream_chunk)
+        facts_file = self._facts_file(doc_path)
+        os.makedirs(self.stream_facts_folder, exist_ok=True)
+        keys = array('Q')
+        added = found = 0
+        batch = []
+        rejections = []
+        try:
+            # The journal keeps every batch durable; compaction waits for the save at the end
+            with self.store.deferred_compaction(), open(f"{facts_file}.tmp", 'w', encoding='utf-8') as out:
+                for fact in stream.facts():
+                    batch.append((folder_name, fact))
+                    keys.append(fact_key(folder_name, fact))
+                    out.write(json.dumps([folder_name, fact], ensure_ascii=False) + '\n')
+                    if len(batch) >= self.teach_batch:
+                        found += len(batch)
+                        added += self.store.add_many(batch, rejections)
+                        batch = []
+                found += len(batch)
+                added += self.store.add_many(batch, rejections) if batch else 0
+        except Exception as e:
+            # The old entry stays, so the next run retries and still diffs against the old facts
+            print(f"❌ Error streaming {doc_path}: {e}")
+            if os.path.exists(f"{facts_file}.tmp"):
+                os.remove(f"{facts_file}.tmp")
+            return added, 0
+        previous = manifest.get(doc_path)
+        removed = self._retire_streamed(previous, current, array('Q', sorted(keys)), gone) if previous else 0
+        os.replace(f"{facts_file}.tmp", facts_file)
+        elapsed = time.time() - started
+        manifest[doc_path] = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'sha1': stream.digest(),
+            'category': folder_name,
+            'streamed': True,
+            'fact_count': found,
+            'facts_file': facts_file,
+        }
+        if rejections:
+            manifest[doc_path]['rejected'] = [[fact_key(*loser), fact_key(*winner)] for loser, winner in rejections]
+        mb = stream.bytes_read / 1e6
+        print(f"   ✅ {os.path.basename(doc_path)}: {found} facts streamed, {added} new, {removed} stale "
+              f"({mb:.1f} MB at {mb / elapsed if elapsed else 0:.1f} MB/s)")
+        return added, removed
     
-    def _is_meaningful(self, text):
-        return len(text) >= 20 and len(text) <= 500 and len(text.split()) >= 5
+    def _retire_streamed(self, entry, current, keep=None, gone=None):
+        # Removes the facts a streamed file used to provide, unless a small file (keys in
+        # current) or the file's new version (sorted keys in keep) still provides them.
+        # The keys of removed facts are added to gone.
+        facts_file = entry.get('facts_file')
+        if not facts_file or not os.path.exists(facts_file):
+            return 0
+        removed = 0
+        batch = []
+        with self.store.deferred_compaction(), open(facts_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                category, fact = json.loads(line)
+                key = fact_key(category, fact)
+                if key in current:
+                    continue
+                if keep is not None:
+                    i = bisect_left(keep, key)
+                    if i < len(keep) and keep[i] == key:
+                        continue
+                batch.append((category, fact))
+                if gone is not None:
+                    gone.add(key)
+                if len(batch) >= self.teach_batch:
+                    removed += self.store.remove_many(batch)
+                    batch = []
+            removed += self.store.remove_many(batch) if batch else 0
+        if keep is None:
+            os.remove(facts_file)
+        return removed
+    
+    def _load_manifest(self):
+        try:
+            if os.path.exists(self.manifest_file):
+                with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f).get('files', {})
+                # Older manifests listed every [category, fact]; keep only their keys
+                for entry in manifest.values():
+                    if 'facts' in entry:
+                        facts = entry.pop('facts')
+                        entry['fact_count'] = len(facts)
+                        entry['keys'] = pack_keys(fact_key(category, fact) for category, fact in facts)
+                return manifest
+        except Exception as e:
+            print(f"⚠️ Training manifest unreadable, retraining everything: {e}")
+        return {}
+    
+    def get_load_phases(self, store_stats=None):
+        phases = dict(self.load_phases)
+        if store_stats and store_stats.get('load_phases'):
+            phases['store_phases'] = store_stats['load_phases']
+        return phases
+    
+    def get_provider_health(self):
+        return {
+            'google': dict(self.google_client.breaker.stats(), enabled=self.google_enabled,
+                           quota_remaining=self.google_quota.stats()['remaining']),
+            'deepseek': dict(self.deepseek_client.breaker.stats(), enabled=self.deepseek_enabled),
+        }
     
     def get_stats(self):
-        total_facts = sum(len(facts) for facts in self.knowledge_base.values())
+        store_stats = self.store.stats()
         return {
-            'total_facts': total_facts,
-            'topics': {topic: len(facts) for topic, facts in self.knowledge_base.items()},
+            'total_facts': store_stats['total_facts'],
+            'topics': store_stats['topics'],
+            'store': self.store.name,
+            'dedup': store_stats.get('dedup'),
+            'memory': store_stats.get('memory'),
+            'fuzzy_corrections': store_stats.get('fuzzy_corrections'),
+            'load_phases': self.get_load_phases(store_stats),
+            'cache': self.response_cache.stats(),
+            'coalescing': self.single_flight.stats(),
+            'async': {
+                'coalescing': self.async_flight.stats(),
+                'providers': {name: client.stats() for name, client in self.async_providers.items()},
+            } if self.async_providers else None,
+            'learning': self.learning.stats() if self.learning else None,
+            'providers': {
+                'google': dict(self.google_client.stats(), quota=self.google_quota.stats()),
+                'deepseek': self.deepseek_client.stats(),
+            },
             'deepseek_enabled': self.deepseek_enabled,
             'google_enabled': self.google_enabled
         }
\ No newline at end of file
@@ -0,0 +1,128 @@
+# clipix_dedup.py - Near-duplicate fact detection (MinHash + LSH)
+import hashlib
+import random
+import re
+import sys
+import threading
+
+
+def shingles(text, size=3):
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return {' '.join(words)} if words else set()
+    return {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex:
+    """MinHash signatures bucketed by LSH bands.
+
+    Candidates come from shared band buckets, so a lookup only touches facts
+    that agree on at least one band; candidates are then confirmed with the
+    exact shingle Jaccard similarity. Keys are opaque to the index and are
+    turned back into text with ``text_for`` during verification.
+    """
+
+    def __init__(self, text_for, threshold=0.8, num_perm=64, bands=16, seed=1):
+        self.text_for = text_for
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        # XOR masks over a 64-bit shingle hash stand in for the permutations;
+        # exact verification below makes up for their weaker independence
+        rng = random.Random(seed)
+        self.masks = [rng.getrandbits(64) for _ in range(num_perm)]
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.counters = {'checked': 0, 'duplicates': 0}
+
+    def _band_keys(self, shingle_set):
+        if not shingle_set:
+            return []
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'big')
+            for s in shingle_set
+        ]
+        signature = [min([h ^ mask for h in hashes]) for mask in self.masks]
+        return [
+            (band, hash(tuple(signature[band * self.rows:(band + 1) * self.rows])))
+            for band in range(self.bands)
+        ]
+
+    def signature(self, text):
+        # Lets a caller that runs find() then add() on the same text hash it once
+        shingle_set = shingles(text)
+        return shingle_set, self._band_keys(shingle_set)
+
+    def find(self, text, signature=None):
+        """Return the key of an indexed near-duplicate of text, or None."""
+        shingle_set, band_keys = signature or self.signature(text)
+        with self.lock:
+            self.counters['checked'] += 1
+            candidates = []
+            for band_key in band_keys:
+                for key in self.buckets.get(band_key, ()):
+                    if key not in candidates:
+                        candidates.append(key)
+        for key in candidates:
+            other = self.text_for(key)
+            if other is None:
+                continue
+            other_set = shingles(other)
+            union = len(shingle_set | other_set)
+            if union and len(shingle_set & other_set) / union >= self.threshold:
+                with self.lock:
+                    self.counters['duplicates'] += 1
+                return key
+        return None
+
+    def add(self, key, text, signature=None):
+        band_keys = (signature or self.signature(text))[1]
+        with self.lock:
+            for band_key in band_keys:
+                self.buckets.setdefault(band_key, []).append(key)
+
+    def remove(self, key, text):
+        band_keys = self._band_keys(shingles(text))
+        with self.lock:
+            for band_key in band_keys:
+                bucket = self.buckets.get(band_key)
+                if bucket and key in bucket:
+                    bucket.remove(key)
+                    if not bucket:
+                        del self.buckets[band_key]
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['buckets'] = len(self.buckets)
+        return stats
+
+
+def compact_knowledge_file(knowledge_file, journal_file, threshold=0.8):
+    # One-off cleanup: keep the first copy of each near-duplicate group
+    from clipix_store import JsonKnowledgeStore
+    store = JsonKnowledgeStore(knowledge_file, journal_file)
+    store.load()
+    seen = NearDuplicateIndex(lambda key: key[1], threshold=threshold)
+    kept = {}
+    created = {}
+    removed = 0
+    for _, record in store.index.live():
+        if seen.find(record.text) is not None:
+            removed += 1
+            continue
+        seen.add((record.category, record.text), record.text)
+        kept.setdefault(record.category, []).append(record.text)
+        # Keep creation times so category TTLs still expire old facts
+        created.setdefault(record.category, []).append(record.timestamp)
+    store.replace_all(kept, created)
+    store.close()
+    return removed, store.stats()['total_facts']
+
+
+if __name__ == '__main__':
+    knowledge_file = sys.argv[1] if len(sys.argv) > 1 else "ai_knowledge.json"
+    journal_file = sys.argv[2] if len(sys.argv) > 2 else "ai_knowledge.journal"
+    print(f"🧹 Removing near-duplicate facts from {knowledge_file} (stop the server first)...")
+    removed, remaining = compact_knowledge_file(knowledge_file, journal_file)
+    print(f"✅ Removed {removed} near-duplicates, {remaining} facts remain")
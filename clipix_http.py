@@ -0,0 +1,367 @@
+# clipix_http.py - Shared HTTP client layer for upstream providers
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # Only the async (ASGI) server needs it
+    httpx = None
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ProviderBusy(Exception):
+    pass
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probe after a cooldown.
+
+    While open every call is refused at once; once the cooldown has passed a
+    single probe call is let through and its outcome closes or reopens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.counters = {'opened': 0, 'rejected': 0}
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.counters['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.probing:
+                self.counters['rejected'] += 1
+                return False
+            self.probing = True
+            return True
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.probing = False
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.counters['opened'] += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def release(self):
+        """Give back a probe whose call ended without an outcome, e.g. because it was cancelled."""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probing = False
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters, state=self.state, failures=self.failures)
+            if self.state == self.OPEN:
+                stats['retry_in'] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return stats
+
+
+class QuotaBudget:
+    """Daily call allowance that holds back a reserve for priority calls.
+
+    The day rolls over at midnight in ``utc_offset_hours`` (Google's quota
+    resets at midnight Pacific time). A daily_limit of 0 means no limit.
+    """
+
+    def __init__(self, daily_limit=100, reserve=0, utc_offset_hours=-8):
+        self.daily_limit = daily_limit
+        self.reserve = min(reserve, daily_limit)
+        self.utc_offset = utc_offset_hours * 3600
+        self.day = None
+        self.used = 0
+        self.exhausted = False
+        self.lock = threading.Lock()
+        self.counters = {'denied': 0}
+
+    def _roll(self):
+        day = int((time.time() + self.utc_offset) // 86400)
+        if day != self.day:
+            self.day = day
+            self.used = 0
+            self.exhausted = False
+
+    def try_spend(self, priority=False):
+        if not self.daily_limit:
+            return True
+        with self.lock:
+            self._roll()
+            limit = self.daily_limit if priority else self.daily_limit - self.reserve
+            if self.exhausted or self.used >= limit:
+                self.counters['denied'] += 1
+                return False
+            self.used += 1
+            return True
+
+    def refund(self):
+        # For a call that never reached the provider
+        if not self.daily_limit:
+            return
+        with self.lock:
+            self.used = max(0, self.used - 1)
+
+    def exhaust(self):
+        # The provider says the quota is gone, whatever our own count says
+        with self.lock:
+            self._roll()
+            self.exhausted = True
+
+    def stats(self):
+        with self.lock:
+            self._roll()
+            remaining = 0 if self.exhausted else max(0, self.daily_limit - self.used)
+            return dict(
+                self.counters,
+                daily_limit=self.daily_limit,
+                reserve=self.reserve,
+                used=self.used,
+                remaining=remaining if self.daily_limit else None,
+                exhausted=self.exhausted,
+            )
+
+
+class ProviderClient:
+    """Keep-alive session for one provider with retries and a concurrency cap.
+
+    Idempotent requests are retried with jittered exponential backoff on
+    connection errors, timeouts and retryable status codes. Other methods are
+    only retried when the connection could not be established, since the
+    request never reached the server. A circuit breaker refuses calls with
+    ProviderUnavailable while the provider keeps failing.
+    """
+
+    def __init__(self, name, url, max_concurrency=8, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff=0.2, max_backoff=2.0, queue_timeout=None, breaker=None):
+        self.name = name
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue_timeout = read_timeout if queue_timeout is None else queue_timeout
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'busy': 0, 'in_flight': 0}
+        self.breaker = breaker or CircuitBreaker()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def _sleep_before_retry(self, attempt):
+        cap = min(self.max_backoff, self.backoff * (2 ** attempt))
+        time.sleep(random.uniform(0, cap))
+
+    def _acquire(self):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self._count('busy')
+            raise ProviderBusy(f"{self.name}: too many concurrent requests")
+        self._count('in_flight')
+
+    def _release(self):
+        self._count('in_flight', -1)
+        self.slots.release()
+
+    def _admit(self):
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name}: circuit open after repeated failures")
+
+    def _send(self, method, timeout=None, **kwargs):
+        self._admit()
+        try:
+            response = self._attempts(method, timeout, **kwargs)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(response.status_code not in RETRY_STATUSES)
+        return response
+
+    def _attempts(self, method, timeout=None, retry_if=None, **kwargs):
+        # retry_if(response or None) may veto a retry the policy allows, e.g. to charge a quota for it
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        timeout = timeout or self.timeout
+        try:
+            for attempt in range(self.retries + 1):
+                last_attempt = attempt == self.retries
+                self._count('requests')
+                try:
+                    response = self.session.request(method, self.url, timeout=timeout, **kwargs)
+                except requests.exceptions.ConnectTimeout:
+                    if last_attempt or (retry_if is not None and not retry_if(None)):
+                        raise
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                    if last_attempt or not idempotent or (retry_if is not None and not retry_if(None)):
+                        raise
+                else:
+                    if response.status_code not in RETRY_STATUSES or last_attempt or not idempotent:
+                        return response
+                    if retry_if is not None and not retry_if(response):
+                        return response
+                    response.close()
+                self._count('retries')
+                self._sleep_before_retry(attempt)
+        except Exception:
+            self._count('failures')
+            raise
+
+    def request(self, method, **kwargs):
+        self._acquire()
+        try:
+            return self._send(method, **kwargs)
+        finally:
+            self._release()
+
+    @contextmanager
+    def stream(self, method, **kwargs):
+        # Holds the concurrency slot until the body has been consumed
+        self._acquire()
+        try:
+            response = self._send(method, stream=True, **kwargs)
+            try:
+                yield response
+            finally:
+                response.close()
+        finally:
+            self._release()
+
+    def get(self, **kwargs):
+        return self.request('GET', **kwargs)
+
+    def post(self, **kwargs):
+        return self.request('POST', **kwargs)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats['breaker'] = self.breaker.stats()
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncProviderClient:
+    """httpx counterpart of a ProviderClient for the async server.
+
+    Shares the sync client's URL, timeouts, retry policy and circuit
+    breaker, so both servers see one health state per provider. A request
+    waiting for a connection slot is a suspended coroutine, not a blocked
+    thread, so the concurrency cap can be far higher.
+    """
+
+    def __init__(self, sync_client, max_concurrency=256):
+        if httpx is None:
+            raise RuntimeError("the async server needs httpx: pip install -r requirements-async.txt")
+        self.name = sync_client.name
+        self.url = sync_client.url
+        self.retries = sync_client.retries
+        self.backoff = sync_client.backoff
+        self.max_backoff = sync_client.max_backoff
+        self.breaker = sync_client.breaker
+        connect_timeout, read_timeout = sync_client.timeout
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        # Requests queue here rather than inside httpx, whose pool scans every waiting request per event
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.counters = {'requests': 0, 'retries': 0, 'failures': 0, 'in_flight': 0, 'waiting': 0}
+
+    async def _attempts(self, method, retry_if=None, **kwargs):
+        idempotent = method in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            self.counters['requests'] += 1
+            try:
+                response = await self.client.request(method, self.url, **kwargs)
+            except httpx.ConnectTimeout:
+                if last_attempt or (retry_if is not None and not retry_if(None)):
+                    raise
+            except (httpx.ConnectError, httpx.TimeoutException, httpx.NetworkError):
+                if last_attempt or not idempotent or (retry_if is not None and not retry_if(None)):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt or not idempotent:
+                    return response
+                if retry_if is not None and not retry_if(response):
+                    return response
+            self.counters['retries'] += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    async def _limited(self, method, **kwargs):
+        self.counters['waiting'] += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.counters['waiting'] -= 1
+        self.counters['in_flight'] += 1
+        try:
+            return await self._attempts(method, **kwargs)
+        finally:
+            self.counters['in_flight'] -= 1
+            self.slots.release()
+
+    async def request(self, method, **kwargs):
+        if not self.breaker.allow():
+            raise ProviderUnavailable(f"{self.name}: circuit open after repeated failures")
+        try:
+            response = await self._limited(method.upper(), **kwargs)
+        except asyncio.CancelledError:
+            # A lost hedge, a spent budget or a client disconnect says nothing about the provider
+            self.breaker.release()
+            raise
+        except Exception:
+            self.counters['failures'] += 1
+            self.breaker.record(False)
+            raise
+        self.breaker.record(response.status_code not in RETRY_STATUSES)
+        return response
+
+    async def get(self, **kwargs):
+        return await self.request('GET', **kwargs)
+
+    async def post(self, **kwargs):
+        return await self.request('POST', **kwargs)
+
+    def stats(self):
+        # Only touched from the event loop thread, so no lock
+        return dict(self.counters)
+
+    async def close(self):
+        await self.client.aclose()
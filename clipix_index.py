@@ -0,0 +1,771 @@
+# clipix_index.py - Ranked retrieval for Clipix memory
+import heapq
+import math
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from itertools import islice
+
+# Tables are split so a fork copies pointers to the pieces and a write copies one piece
+TABLE_CHUNK_BITS = 12
+TABLE_CHUNK_MASK = (1 << TABLE_CHUNK_BITS) - 1
+MAP_SHARD_BITS = 10
+MAP_SHARD_MASK = (1 << MAP_SHARD_BITS) - 1
+
+# A corrected term counts for this much of its BM25 weight, so typed words outrank guesses
+CORRECTED_WEIGHT = 0.5
+
+STOP_WORDS = {'what', 'is', 'the', 'a', 'an', 'how', 'why', 'when', 'where', 'tell', 'me', 'about'}
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word for word in WORD_RE.findall(text.lower()) if len(word) > 3]
+
+
+def query_terms(text):
+    terms = []
+    for word in tokenize(text):
+        if word not in STOP_WORDS and word not in terms:
+            terms.append(word)
+    return terms
+
+
+def trigrams(word):
+    padded = f"^{word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    # Optimal string alignment distance. Only cells within limit of the diagonal can
+    # stay within limit, so rows are filled across that band alone, giving up once a
+    # whole band exceeds limit; limit + 1 stands for "further than limit".
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    far = limit + 1
+    width = len(b) + 1
+    previous2 = None
+    previous = [j if j <= limit else far for j in range(width)]
+    for i in range(1, len(a) + 1):
+        current = [i if i <= limit else far] + [far] * len(b)
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cell = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cell = min(cell, previous2[j - 2] + 1)
+            current[j] = cell
+            if cell < best:
+                best = cell
+        if best > limit:
+            return far
+        previous2, previous = previous, current
+    return min(previous[-1], far)
+
+
+def resolve_with(terms, known, correct=None):
+    """(unique terms to search, the subset that came from typo corrections).
+
+    A word that is neither known nor correctable means the query is about
+    something the index lacks, so it is searched only if it also has a typed
+    known word; otherwise nothing is returned and no further word is corrected.
+    """
+    typed = [term for term in dict.fromkeys(terms) if known(term)]
+    resolved = list(typed)
+    corrected = set()
+    for term in dict.fromkeys(terms):
+        if term in typed:
+            continue
+        fixed = correct(term) if correct is not None else None
+        if fixed is None:
+            if not typed:
+                return [], set()
+            # Kept so min_match still counts it; it matches nothing
+            resolved.append(term)
+        elif fixed not in resolved:
+            resolved.append(fixed)
+            corrected.add(fixed)
+    return resolved, corrected
+
+
+class ChunkedTable:
+    """Append-mostly list (or typed array) stored as fixed-size chunks.
+
+    A fork shares every chunk with its parent and copies one only when it
+    first writes to it, so forking costs a copy of the chunk pointers.
+    """
+
+    __slots__ = ('typecode', 'chunks', 'owned', 'length')
+
+    def __init__(self, typecode=None):
+        self.typecode = typecode
+        self.chunks = []
+        # Chunks this copy may modify; None when it owns all of them
+        self.owned = None
+        self.length = 0
+
+    def _new_chunk(self):
+        return array(self.typecode) if self.typecode else []
+
+    def fork(self):
+        clone = ChunkedTable.__new__(ChunkedTable)
+        clone.typecode = self.typecode
+        clone.chunks = list(self.chunks)
+        clone.owned = set()
+        clone.length = self.length
+        return clone
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        # Ids are never negative; past the end the chunk lookup raises IndexError
+        return self.chunks[i >> TABLE_CHUNK_BITS][i & TABLE_CHUNK_MASK]
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            yield from chunk
+
+    def _writable(self, c):
+        chunk = self.chunks[c]
+        if self.owned is not None and c not in self.owned:
+            chunk = self.chunks[c] = chunk[:]
+            self.owned.add(c)
+        return chunk
+
+    def __setitem__(self, i, value):
+        if i < 0 or i >= self.length:
+            raise IndexError(i)
+        self._writable(i >> TABLE_CHUNK_BITS)[i & TABLE_CHUNK_MASK] = value
+
+    def _tail(self):
+        # Last chunk if it has room, else a new one
+        if self.length & TABLE_CHUNK_MASK:
+            return self._writable(len(self.chunks) - 1)
+        chunk = self._new_chunk()
+        self.chunks.append(chunk)
+        if self.owned is not None:
+            self.owned.add(len(self.chunks) - 1)
+        return chunk
+
+    def append(self, value):
+        self._tail().append(value)
+        self.length += 1
+
+    def extend(self, values):
+        values = iter(values)
+        size = TABLE_CHUNK_MASK + 1
+        while True:
+            chunk = self._tail()
+            before = len(chunk)
+            chunk.extend(islice(values, size - before))
+            self.length += len(chunk) - before
+            if len(chunk) < size:
+                if not chunk:
+                    self.chunks.pop()
+                return
+
+    def nbytes(self):
+        return sys.getsizeof(self.chunks) + sum(sys.getsizeof(chunk) for chunk in self.chunks)
+
+
+class ShardedMap:
+    """Dict split into hash shards that forks share until they write to one."""
+
+    __slots__ = ('shards', 'owned')
+
+    def __init__(self):
+        self.shards = [{} for _ in range(MAP_SHARD_MASK + 1)]
+        # Shards this copy may modify; None when it owns all of them
+        self.owned = None
+
+    def fork(self):
+        clone = ShardedMap.__new__(ShardedMap)
+        clone.shards = list(self.shards)
+        clone.owned = set()
+        return clone
+
+    def shard(self, key):
+        """The shard holding key, copied first if this map may share it; for batched updates."""
+        s = hash(key) & MAP_SHARD_MASK
+        owned = self.owned
+        if owned is None or s in owned:
+            return self.shards[s]
+        shard = self.shards[s] = self.shards[s].copy()
+        owned.add(s)
+        return shard
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def __contains__(self, key):
+        return key in self.shards[hash(key) & MAP_SHARD_MASK]
+
+    def __getitem__(self, key):
+        return self.shards[hash(key) & MAP_SHARD_MASK][key]
+
+    def get(self, key, default=None):
+        return self.shards[hash(key) & MAP_SHARD_MASK].get(key, default)
+
+    def __setitem__(self, key, value):
+        self.shard(key)[key] = value
+
+    def __delitem__(self, key):
+        del self.shard(key)[key]
+
+    def pop(self, key, default=None):
+        if key not in self:
+            return default
+        return self.shard(key).pop(key)
+
+    def items(self):
+        for shard in self.shards:
+            yield from shard.items()
+
+    def nbytes(self):
+        distinct = {id(shard): shard for shard in self.shards}
+        return sys.getsizeof(self.shards) + sum(sys.getsizeof(shard) for shard in distinct.values())
+
+
+class TrigramIndex:
+    """Character trigram index over the vocabulary for typo correction."""
+
+    def __init__(self, min_similarity=0.3, max_candidates=64, cache_size=4096, margin=2.0):
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates
+        self.cache_size = cache_size
+        # Among equally close candidates the most frequent wins only if it is this many times as frequent
+        self.margin = margin
+        # (gram, word length) -> set of words
+        self.grams = ShardedMap()
+        # Keys whose word set this copy may modify; None when it owns all of them
+        self.owned = None
+        # word -> correction for the current vocabulary, shared with forks until they change it
+        self.cache = None
+        self.cache_lock = threading.Lock()
+        self.counters = {'corrections': 0}
+
+    @property
+    def corrections(self):
+        return self.counters['corrections']
+
+    def fork(self):
+        """Copy for a writer; gram sets are copied the first time the fork changes them."""
+        clone = TrigramIndex(self.min_similarity, self.max_candidates, self.cache_size, self.margin)
+        clone.grams = self.grams.fork()
+        clone.owned = set()
+        clone.cache = self.cache
+        clone.cache_lock = self.cache_lock
+        clone.counters = self.counters
+        return clone
+
+    def _words(self, key):
+        words = self.grams.get(key)
+        if self.owned is not None and key not in self.owned:
+            words = self.grams[key] = set(words or ())
+            self.owned.add(key)
+        elif words is None:
+            words = self.grams[key] = set()
+        return words
+
+    def add(self, word):
+        self.cache = None
+        for gram in trigrams(word):
+            self._words((gram, len(word))).add(word)
+
+    def remove(self, word):
+        self.cache = None
+        for gram in trigrams(word):
+            key = (gram, len(word))
+            if key in self.grams:
+                words = self._words(key)
+                words.discard(word)
+                if not words:
+                    del self.grams[key]
+
+    def correct(self, word, weight=None):
+        """Closest known word, or None; results are cached until the vocabulary changes."""
+        with self.cache_lock:
+            cache = self.cache
+            if cache is None:
+                cache = self.cache = OrderedDict()
+            elif word in cache:
+                cache.move_to_end(word)
+                return cache[word]
+        fixed = self._closest(word, weight)
+        with self.cache_lock:
+            cache[word] = fixed
+            if len(cache) > self.cache_size:
+                cache.popitem(last=False)
+        return fixed
+
+    def _closest(self, word, weight):
+        # One edit for words of up to six characters, two above. One edit from
+        # 'goat' are 'boat', 'coat' and 'moat', so a tie is settled only by a
+        # clear frequency margin; otherwise any pick would be a guess.
+        if len(word) < 4:
+            return None
+        limit = 1 if len(word) <= 6 else 2
+        grams = trigrams(word)
+        # Word sets are kept per (gram, length), so only words within the edit limit in length are counted
+        shared = Counter()
+        for length in range(len(word) - limit, len(word) + limit + 1):
+            for gram in grams:
+                shared.update(self.grams.get((gram, length), ()))
+        nearest = None
+        closest = []
+        for candidate, overlap in shared.most_common(self.max_candidates):
+            # An edit touches at most four trigrams, so nothing past here is close enough
+            if overlap < len(grams) - 4 * (limit if nearest is None else nearest):
+                break
+            # Similarity also depends on length, so a low one does not end the overlap-ordered scan
+            if 2 * overlap / (len(grams) + len(candidate)) < self.min_similarity:
+                continue
+            distance = edit_distance(word, candidate, limit if nearest is None else nearest)
+            if distance > limit or (nearest is not None and distance > nearest):
+                continue
+            if nearest is None or distance < nearest:
+                nearest, closest = distance, []
+            closest.append(candidate)
+        if not closest:
+            return None
+        if len(closest) == 1:
+            return closest[0]
+        if weight is None:
+            return None
+        ranked = sorted(((weight(candidate), candidate) for candidate in closest), reverse=True)
+        if ranked[0][0] < self.margin * max(ranked[1][0], 1):
+            return None
+        return ranked[0][1]
+
+    def credit(self, corrected, texts):
+        """Count the corrections that matched one of the facts a search returned."""
+        if not corrected:
+            return
+        words = set()
+        for text in texts:
+            words.update(tokenize(text))
+        used = len(corrected & words)
+        if used:
+            self.counters['corrections'] += used
+
+
+class FactRecord:
+    __slots__ = ('text', 'category', 'timestamp', 'flags')
+
+    def __init__(self, text, category, timestamp, flags):
+        self.text = text
+        self.category = category
+        self.timestamp = timestamp
+        self.flags = flags
+
+
+class Posting:
+    __slots__ = ('ids', 'tfs')
+
+    def __init__(self):
+        self.ids = array('I')
+        self.tfs = array('H')
+
+    def copy(self):
+        posting = Posting()
+        posting.ids = self.ids[:]
+        posting.tfs = self.tfs[:]
+        return posting
+
+
+class KnowledgeIndex:
+    """BM25 inverted index over facts with MaxScore top-k retrieval.
+
+    An index that has been handed to readers is never modified again;
+    writers call fork() and publish the fork as the next generation.
+    """
+
+    def __init__(self, k1=1.2, b=0.75, fuzzy=True):
+        self.k1 = k1
+        self.b = b
+        self.generation = 0
+        self.trigrams = TrigramIndex() if fuzzy else None
+        # Words whose posting this copy may modify; None when it owns all of them
+        self.owned = None
+        # Fact table: fact id -> FactRecord, None marks a removed fact
+        self.records = ChunkedTable()
+        self.lengths = ChunkedTable('H')
+        # Text -> id for the first copy of a fact; facts repeated under another category go in extra_ids
+        self.ids_by_text = ShardedMap()
+        self.extra_ids = ShardedMap()
+        # Postings: word -> ascending fact ids with term frequencies
+        self.postings = ShardedMap()
+        self.doc_freq = ShardedMap()
+        self.category_counts = Counter()
+        self.live_count = 0
+        self.total_length = 0
+
+    def __len__(self):
+        return self.live_count
+
+    def fork(self):
+        """Writable copy for the next generation, leaving this index untouched.
+
+        Tables are chunked or sharded and shared with this index: the fork
+        copies a chunk, shard or posting list only when it first writes to
+        it, so a write costs time in proportion to the terms it touches,
+        not to the size of the corpus.
+        """
+        clone = KnowledgeIndex.__new__(KnowledgeIndex)
+        clone.k1 = self.k1
+        clone.b = self.b
+        clone.generation = self.generation + 1
+        clone.trigrams = self.trigrams.fork() if self.trigrams is not None else None
+        clone.owned = set()
+        clone.records = self.records.fork()
+        clone.lengths = self.lengths.fork()
+        clone.ids_by_text = self.ids_by_text.fork()
+        clone.extra_ids = self.extra_ids.fork()
+        clone.postings = self.postings.fork()
+        clone.doc_freq = self.doc_freq.fork()
+        clone.category_counts = Counter(self.category_counts)
+        clone.live_count = self.live_count
+        clone.total_length = self.total_length
+        return clone
+
+    def __contains__(self, key):
+        return self.lookup(*key) is not None
+
+    def lookup(self, category, fact):
+        fact_id = self.ids_by_text.get(fact)
+        if fact_id is not None and self.records[fact_id].category == category:
+            return fact_id
+        return self.extra_ids.get((category, fact))
+
+    def live(self):
+        for fact_id, record in enumerate(self.records):
+            if record is not None:
+                yield fact_id, record
+
+    def add(self, category, fact, flags=0, timestamp=None):
+        existing = self.lookup(category, fact)
+        if existing is not None:
+            return existing
+        fact_id = len(self.records)
+        category = sys.intern(category)
+        counts = Counter(tokenize(fact))
+        length = min(sum(counts.values()), 0xFFFF)
+        self.records.append(FactRecord(fact, category, timestamp if timestamp is not None else time.time(), flags))
+        self.lengths.append(length)
+        if fact in self.ids_by_text:
+            self.extra_ids[(category, fact)] = fact_id
+        else:
+            self.ids_by_text[fact] = fact_id
+        postings_shard, doc_freq_shard = self.postings.shard, self.doc_freq.shard
+        for word, tf in counts.items():
+            postings = postings_shard(word)
+            posting = postings.get(word)
+            if posting is None:
+                posting = postings[word] = Posting()
+                if self.owned is not None:
+                    self.owned.add(word)
+                if self.trigrams is not None:
+                    self.trigrams.add(word)
+            elif self.owned is not None and word not in self.owned:
+                posting = postings[word] = posting.copy()
+                self.owned.add(word)
+            posting.ids.append(fact_id)
+            posting.tfs.append(min(tf, 0xFFFF))
+            doc_freq = doc_freq_shard(word)
+            doc_freq[word] = doc_freq.get(word, 0) + 1
+        self.category_counts[category] += 1
+        self.live_count += 1
+        self.total_length += length
+        return fact_id
+
+    def remove(self, category, fact):
+        fact_id = self.lookup(category, fact)
+        if fact_id is None:
+            return None
+        return self.remove_id(fact_id)
+
+    def touch(self, fact_id, timestamp):
+        # Records may be shared with older generations, so replace rather than mutate
+        record = self.records[fact_id]
+        self.records[fact_id] = FactRecord(record.text, record.category, timestamp, record.flags)
+
+    def remove_id(self, fact_id):
+        record = self.records[fact_id]
+        if record is None:
+            return None
+        if self.ids_by_text.get(record.text) == fact_id:
+            del self.ids_by_text[record.text]
+        else:
+            self.extra_ids.pop((record.category, record.text), None)
+        # Postings keep the dead id until the word disappears entirely
+        for word in set(tokenize(record.text)):
+            self.doc_freq[word] -= 1
+            if not self.doc_freq[word]:
+                del self.doc_freq[word]
+                del self.postings[word]
+                if self.trigrams is not None:
+                    self.trigrams.remove(word)
+        self.category_counts[record.category] -= 1
+        if not self.category_counts[record.category]:
+            del self.category_counts[record.category]
+        self.live_count -= 1
+        self.total_length -= self.lengths[fact_id]
+        self.records[fact_id] = None
+        return record
+
+    def memory_usage(self, sample_size=1000):
+        """Approximate bytes held per live fact (sampled records, exact postings)."""
+        if not self.live_count:
+            return {'bytes_total': 0, 'bytes_per_fact': 0}
+        step = max(1, len(self.records) // sample_size)
+        sampled = [r for r in (self.records[i] for i in range(0, len(self.records), step)) if r is not None]
+        per_record = sum(sys.getsizeof(r) + sys.getsizeof(r.text) for r in sampled) / max(len(sampled), 1)
+        postings = sum(
+            sys.getsizeof(word) + sys.getsizeof(p) + p.ids.buffer_info()[1] * p.ids.itemsize
+            + p.tfs.buffer_info()[1] * p.tfs.itemsize
+            for word, p in self.postings.items()
+        )
+        tables = (
+            self.records.nbytes() + self.ids_by_text.nbytes() + self.extra_ids.nbytes()
+            + self.postings.nbytes() + self.doc_freq.nbytes() + self.lengths.nbytes()
+        )
+        total = int(per_record * self.live_count + postings + tables)
+        return {'bytes_total': total, 'bytes_per_fact': round(total / self.live_count, 1)}
+
+    def resolve_terms(self, terms):
+        """Swap unknown (likely misspelt) terms for their closest indexed word.
+
+        Returns the resolved terms and the set of them that are corrections;
+        see resolve_with for when a query resolves to nothing.
+        """
+        if self.trigrams is None:
+            return resolve_with(terms, self.postings.__contains__)
+        return resolve_with(terms, self.postings.__contains__,
+                            lambda term: self.trigrams.correct(term, weight=self.doc_freq.get))
+
+    def _collection(self, background):
+        # BM25 corpus statistics, pooled with another layer of the same collection if given
+        if background is None:
+            return self.live_count, self.total_length, self.doc_freq.get
+        doc_freq, other = self.doc_freq, background.doc_freq
+        return (
+            self.live_count + background.live_count,
+            self.total_length + background.total_length,
+            lambda word, default=0: doc_freq.get(word, 0) + other.get(word, 0),
+        )
+
+    @staticmethod
+    def _idf(df, count):
+        return math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def search(self, terms, k=5, min_match=1, exclude_flags=0, skip=frozenset(), background=None,
+               corrected=None):
+        """Return up to k (score, fact_id) pairs, best first.
+
+        Terms are visited MaxScore-style: once the heap is full, lists whose
+        combined upper bound cannot beat the k-th score stop producing
+        candidates and are only probed for documents already in play.
+        Ids in skip are treated as removed. Terms come already resolved when
+        corrected (the set of them that are typo corrections) is given.
+        """
+        if k <= 0:
+            return []
+        if corrected is None:
+            terms, corrected = self.resolve_terms(terms)
+        min_match = min(min_match, len(terms))
+        terms = [t for t in terms if t in self.postings]
+        if len(terms) < min_match or not terms or k <= 0:
+            return []
+        k1, b = self.k1, self.b
+        count, total_length, doc_freq = self._collection(background)
+        avg_length = total_length / max(count, 1)
+        idfs = {
+            t: self._idf(doc_freq(t, 0), count) * (CORRECTED_WEIGHT if t in corrected else 1.0)
+            for t in terms
+        }
+        terms.sort(key=lambda t: idfs[t])
+        bounds = [idfs[t] * (k1 + 1) for t in terms]
+        prefix = []
+        running = 0.0
+        for bound in bounds:
+            running += bound
+            prefix.append(running)
+        lists = [self.postings[t] for t in terms]
+        cursors = [0] * len(terms)
+
+        heap = []
+        threshold = 0.0
+        first_essential = 0
+        while True:
+            # Next candidate is the smallest current id among essential lists
+            candidate = None
+            for i in range(first_essential, len(lists)):
+                ids = lists[i].ids
+                if cursors[i] < len(ids) and (candidate is None or ids[cursors[i]] < candidate):
+                    candidate = ids[cursors[i]]
+            if candidate is None:
+                break
+
+            score = 0.0
+            matched = 0
+            norm = k1 * (1 - b + b * self.lengths[candidate] / avg_length)
+            for i in range(first_essential, len(lists)):
+                posting = lists[i]
+                pos = cursors[i]
+                if pos < len(posting.ids) and posting.ids[pos] == candidate:
+                    tf = posting.tfs[pos]
+                    score += idfs[terms[i]] * tf * (k1 + 1) / (tf + norm)
+                    matched += 1
+                    cursors[i] = pos + 1
+
+            record = self.records[candidate]
+            if record is None or record.flags & exclude_flags or candidate in skip:
+                continue
+
+            # Probe non-essential lists, highest bound first, while still useful
+            for i in range(first_essential - 1, -1, -1):
+                if len(heap) == k and score + prefix[i] <= threshold:
+                    break
+                posting = lists[i]
+                pos = bisect_left(posting.ids, candidate, cursors[i])
+                cursors[i] = pos
+                if pos < len(posting.ids) and posting.ids[pos] == candidate:
+                    tf = posting.tfs[pos]
+                    score += idfs[terms[i]] * tf * (k1 + 1) / (tf + norm)
+                    matched += 1
+
+            if matched < min_match:
+                continue
+            entry = (score, -candidate)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            else:
+                continue
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while first_essential < len(lists) and prefix[first_essential] <= threshold:
+                    first_essential += 1
+
+        results = [(score, -neg_id) for score, neg_id in sorted(heap, reverse=True)]
+        if self.trigrams is not None:
+            self.trigrams.credit(corrected, (self.records[fact_id].text for _, fact_id in results))
+        return results
+
+    def search_many(self, term_lists, k=5, min_match=1, exclude_flags=0, skip=frozenset(), background=None,
+                    corrected_lists=None):
+        """Answer a batch of queries with one term-at-a-time pass.
+
+        Each distinct term's postings are read once and scored into the
+        accumulators of every query that uses it.
+        """
+        if corrected_lists is None:
+            resolved = [self.resolve_terms(terms) for terms in term_lists]
+            queries = [terms for terms, _ in resolved]
+            corrected_lists = [corrected for _, corrected in resolved]
+        else:
+            queries = term_lists
+        users = {}
+        for query_id, terms in enumerate(queries):
+            for term in terms:
+                if term in self.postings:
+                    scale = CORRECTED_WEIGHT if term in corrected_lists[query_id] else 1.0
+                    users.setdefault(term, []).append((query_id, scale))
+        k1, b = self.k1, self.b
+        count, total_length, doc_freq = self._collection(background)
+        avg_length = total_length / max(count, 1)
+        scores = [{} for _ in queries]
+        matches = [{} for _ in queries]
+        for term, query_ids in users.items():
+            idf = self._idf(doc_freq(term, 0), count)
+            posting = self.postings[term]
+            for fact_id, tf in zip(posting.ids, posting.tfs):
+                record = self.records[fact_id]
+                if record is None or record.flags & exclude_flags or fact_id in skip:
+                    continue
+                norm = k1 * (1 - b + b * self.lengths[fact_id] / avg_length)
+                weight = idf * tf * (k1 + 1) / (tf + norm)
+                for query_id, scale in query_ids:
+                    scores[query_id][fact_id] = scores[query_id].get(fact_id, 0.0) + weight * scale
+                    matches[query_id][fact_id] = matches[query_id].get(fact_id, 0) + 1
+        results = []
+        for query_id, terms in enumerate(queries):
+            needed = min(min_match, len(terms))
+            ranked = [
+                (score, -fact_id) for fact_id, score in scores[query_id].items()
+                if matches[query_id][fact_id] >= needed
+            ]
+            hits = [(score, -neg_id) for score, neg_id in heapq.nlargest(k, ranked)]
+            if self.trigrams is not None:
+                self.trigrams.credit(corrected_lists[query_id], (self.records[fact_id].text for _, fact_id in hits))
+            results.append(hits)
+        return results
+
+
+class ExpiryIndex:
+    """Min-heap of (expires_at, fact_id) for facts whose category has a TTL.
+
+    Removing or re-stamping a fact leaves its old entry behind; pop_due
+    checks every popped entry against the current record and drops the
+    stale ones, so a sweep costs O(expired log n) amortized.
+    """
+
+    def __init__(self, ttls):
+        self.ttls = dict(ttls)
+        self.heap = []
+
+    def __len__(self):
+        return len(self.heap)
+
+    def expires_at(self, record):
+        ttl = self.ttls.get(record.category)
+        return record.timestamp + ttl if ttl is not None else None
+
+    def push(self, fact_id, record):
+        expires = self.expires_at(record)
+        if expires is not None:
+            heapq.heappush(self.heap, (expires, fact_id))
+
+    def rebuild(self, live):
+        self.heap = [
+            (expires, fact_id) for expires, fact_id in
+            ((self.expires_at(record), fact_id) for fact_id, record in live)
+            if expires is not None
+        ]
+        heapq.heapify(self.heap)
+
+    def rebuild_columns(self, timestamps, categories):
+        """Rebuild from parallel timestamp and category-name columns, e.g. a mapped snapshot's."""
+        ttls = self.ttls
+        self.heap = [
+            (timestamp + ttls[category], fact_id)
+            for fact_id, (timestamp, category) in enumerate(zip(timestamps, categories)) if category in ttls
+        ]
+        heapq.heapify(self.heap)
+
+    def pop_due(self, records, now=None, limit=None):
+        """Fact ids due at ``now`` whose record still carries the expiry they were queued with."""
+        now = time.time() if now is None else now
+        due = []
+        heap = self.heap
+        while heap and heap[0][0] <= now and (limit is None or len(due) < limit):
+            expires, fact_id = heapq.heappop(heap)
+            record = records[fact_id] if fact_id < len(records) else None
+            if record is not None and self.expires_at(record) == expires:
+                due.append(fact_id)
+        return due
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
@@ -0,0 +1,130 @@
+# clipix_learning.py - Write-behind queue for facts learned from upstream answers
+import queue
+import threading
+import time
+from clipix_metrics import REGISTRY
+
+FLUSH_SECONDS = REGISTRY.histogram('clipix_learn_flush_seconds', 'Time to write one batch of learned facts')
+LEARN_EVENTS = REGISTRY.counter('clipix_learn_events_total', 'Learned facts by outcome (queued, shed, stored)', ('outcome',))
+
+_STOP = object()
+
+
+class LearningQueue:
+    """Bounded queue drained by one worker that writes facts to the store in batches.
+
+    A batch is written when it reaches batch_size or flush_interval seconds
+    after its first fact. When the queue is full, put() waits up to
+    block_timeout seconds (backpressure) and then drops the fact (shedding);
+    learned facts are a cache of upstream answers, so losing one is cheap.
+    """
+
+    def __init__(self, store, max_pending=1000, batch_size=100, flush_interval=1.0, block_timeout=0.0, ready=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.ready = ready
+        self.queue = queue.Queue(max_pending)
+        self.lock = threading.Lock()
+        self.counters = {'queued': 0, 'shed': 0, 'stored': 0, 'duplicates': 0, 'batches': 0, 'errors': 0}
+        self.flush_times = {'last': 0.0, 'max': 0.0, 'total': 0.0}
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name='clipix-learn', daemon=True)
+        self.worker.start()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def put(self, category, fact, block=True):
+        """Queue a fact; returns False when it was shed because the queue stayed full.
+
+        With block=False a full queue sheds at once even if block_timeout is set.
+        """
+        if self.closed:
+            return False
+        try:
+            if block and self.block_timeout > 0:
+                self.queue.put((category, fact), timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait((category, fact))
+        except queue.Full:
+            self._count('shed')
+            LEARN_EVENTS.inc(outcome='shed')
+            return False
+        self._count('queued')
+        LEARN_EVENTS.inc(outcome='queued')
+        return True
+
+    def _run(self):
+        if self.ready is not None:
+            self.ready.wait()
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is _STOP:
+                self.queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self.queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            added = self.store.add_many(batch)
+            self._count('stored', added)
+            self._count('duplicates', len(batch) - added)
+            LEARN_EVENTS.inc(added, outcome='stored')
+        except Exception as e:
+            self._count('errors')
+            print(f"❌ Learning write error: {e}")
+        finally:
+            elapsed = time.perf_counter() - started
+            FLUSH_SECONDS.observe(elapsed)
+            with self.lock:
+                self.counters['batches'] += 1
+                self.flush_times['last'] = elapsed
+                self.flush_times['max'] = max(self.flush_times['max'], elapsed)
+                self.flush_times['total'] += elapsed
+            for _ in batch:
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until every fact queued so far has been written."""
+        self.queue.join()
+
+    def close(self, timeout=5.0):
+        # Stop taking facts, write what is pending, then stop the worker
+        if self.closed:
+            return
+        self.closed = True
+        if self.ready is not None and not self.ready.is_set():
+            return
+        self.queue.put(_STOP)
+        self.worker.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            batches = stats['batches']
+            stats['flush_seconds'] = {
+                'last': round(self.flush_times['last'], 4),
+                'max': round(self.flush_times['max'], 4),
+                'mean': round(self.flush_times['total'] / batches, 4) if batches else 0.0,
+            }
+        stats['depth'] = self.queue.qsize()
+        stats['capacity'] = self.queue.maxsize
+        return stats
@@ -0,0 +1,83 @@
+# clipix_query.py - Single-pass question and fact classification
+import re
+from clipix_index import query_terms
+
+TIME_SENSITIVE_KEYWORDS = [
+    'current', 'now', 'today', 'recent', 'latest', 'new', 'nowadays',
+    'who is', 'what is happening', 'breaking', 'news', 'update',
+    'coach', 'manager', 'president', 'prime minister', 'ceo',
+    'score', 'result', 'winner', 'election', 'appointed'
+]
+SPORTS_TEAMS = [
+    'tottenham', 'spurs', 'arsenal', 'chelsea', 'manchester', 'liverpool',
+    'real madrid', 'barcelona', 'bayern', 'psg'
+]
+CATEGORY_KEYWORDS = {
+    'technology': ['computer', 'programming', 'software', 'hardware', 'code', 'ai', 'tech'],
+    'science': ['physics', 'chemistry', 'biology', 'scientific', 'research', 'space'],
+    'history': ['history', 'historical', 'war', 'ancient', 'century', 'battle'],
+    'mathematics': ['math', 'calculus', 'algebra', 'equation', 'geometry', 'calculate'],
+}
+FACT_TIME_SENSITIVE_INDICATORS = [
+    '2021', '2022', '2023', '2024', 'coach', 'manager', 'appointed',
+    'tottenham', 'conte', 'kane', 'contract'
+]
+
+FLAG_TIME_SENSITIVE = 1
+
+TIME = 'time'
+
+
+class KeywordMatcher:
+    """All keyword groups compiled into one overlapping-substring regex.
+
+    Matching keeps the original ``keyword in text`` semantics: the lookahead
+    finds a keyword starting at every offset, and keywords that are a prefix
+    of the longest match at that offset are credited as well.
+    """
+
+    def __init__(self, groups):
+        self.labels = {}
+        for label, keywords in groups:
+            for keyword in keywords:
+                self.labels.setdefault(keyword, set()).add(label)
+        keywords = sorted(self.labels, key=len, reverse=True)
+        self.implied = {
+            keyword: set().union(*(self.labels[other] for other in keywords if keyword.startswith(other)))
+            for keyword in keywords
+        }
+        pattern = '|'.join(re.escape(keyword) for keyword in keywords)
+        self.regex = re.compile(f'(?=({pattern}))')
+
+    def labels_in(self, text_lower):
+        found = set()
+        for match in self.regex.finditer(text_lower):
+            found |= self.implied[match.group(1)]
+        return found
+
+
+QUESTION_MATCHER = KeywordMatcher(
+    [(TIME, TIME_SENSITIVE_KEYWORDS), (TIME, SPORTS_TEAMS)] + list(CATEGORY_KEYWORDS.items())
+)
+FACT_MATCHER = KeywordMatcher([(TIME, FACT_TIME_SENSITIVE_INDICATORS)])
+
+
+class QueryAnalysis:
+    __slots__ = ('question', 'time_sensitive', 'category', 'terms')
+
+    def __init__(self, question, time_sensitive, category, terms):
+        self.question = question
+        self.time_sensitive = time_sensitive
+        self.category = category
+        self.terms = terms
+
+
+def analyze_question(question):
+    question_lower = question.lower()
+    labels = QUESTION_MATCHER.labels_in(question_lower)
+    category = next((name for name in CATEGORY_KEYWORDS if name in labels), 'general')
+    return QueryAnalysis(question, TIME in labels, category, query_terms(question_lower))
+
+
+def fact_flags(fact):
+    return FLAG_TIME_SENSITIVE if FACT_MATCHER.labels_in(fact.lower()) else 0
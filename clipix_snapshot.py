@@ -0,0 +1,280 @@
+# clipix_snapshot.py - Read-only binary knowledge snapshot shared through mmap
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from clipix_index import FactRecord, KnowledgeIndex, Posting
+
+MAGIC = b'CLPXIDX1'
+ORDER = b'l' if sys.byteorder == 'little' else b'b'
+# magic, byte order, facts, terms, metadata bytes, generation, postings, text bytes, term bytes, total length
+HEADER = struct.Struct('<8sc3xIIIQQQQQ')
+
+
+def fact_key(category, fact):
+    digest = hashlib.blake2b(f"{category}\0{fact}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _padding(size):
+    return -size % 8
+
+
+def write_snapshot(path, index, generation):
+    """Write the live facts of a KnowledgeIndex as a snapshot file, atomically.
+
+    Fact ids are renumbered densely, so the snapshot never holds tombstones.
+    """
+    new_ids = {}
+    names = []
+    name_ids = {}
+    offsets, timestamps, lengths, categories, flags = array('Q', [0]), array('d'), array('H'), array('H'), array('B')
+    text = bytearray()
+    for fact_id, record in index.live():
+        new_ids[fact_id] = len(new_ids)
+        if record.category not in name_ids:
+            name_ids[record.category] = len(names)
+            names.append(record.category)
+        text += record.text.encode('utf-8')
+        offsets.append(len(text))
+        timestamps.append(record.timestamp)
+        lengths.append(index.lengths[fact_id])
+        categories.append(name_ids[record.category])
+        flags.append(record.flags)
+
+    keyed = sorted((fact_key(record.category, record.text), new_ids[fact_id]) for fact_id, record in index.live())
+    hashes = array('Q', (key for key, _ in keyed))
+    hash_ids = array('I', (fact_id for _, fact_id in keyed))
+
+    term_offsets, posting_offsets, doc_freq = array('Q', [0]), array('Q', [0]), array('I')
+    terms = bytearray()
+    ids, tfs = array('I'), array('H')
+    for word in sorted(index.postings):
+        posting = index.postings[word]
+        live = [(new_ids[i], tf) for i, tf in zip(posting.ids, posting.tfs) if i in new_ids]
+        if not live:
+            continue
+        ids.extend(i for i, _ in live)
+        tfs.extend(tf for _, tf in live)
+        terms += word.encode('utf-8')
+        term_offsets.append(len(terms))
+        posting_offsets.append(len(ids))
+        doc_freq.append(len(live))
+
+    meta = json.dumps({
+        'categories': names,
+        'category_counts': dict(Counter(names[c] for c in categories)),
+    }, ensure_ascii=False).encode('utf-8')
+    sections = [
+        meta, offsets.tobytes(), timestamps.tobytes(), lengths.tobytes(), categories.tobytes(), flags.tobytes(),
+        bytes(text), hashes.tobytes(), hash_ids.tobytes(), term_offsets.tobytes(), posting_offsets.tobytes(),
+        doc_freq.tobytes(), bytes(terms), ids.tobytes(), tfs.tobytes(),
+    ]
+    header = HEADER.pack(
+        MAGIC, ORDER, len(new_ids), len(doc_freq), len(meta), generation, len(ids), len(text), len(terms),
+        sum(lengths),
+    )
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+            f.write(b'\0' * _padding(len(section)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class FactTable:
+    """Sequence of FactRecords decoded on access from the mapped fact table."""
+
+    def __init__(self, offsets, timestamps, categories, flags, text, names):
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.categories = categories
+        self.flags = flags
+        self.text = text
+        self.names = names
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, fact_id):
+        text = str(self.text[self.offsets[fact_id]:self.offsets[fact_id + 1]], 'utf-8')
+        return FactRecord(text, self.names[self.categories[fact_id]], self.timestamps[fact_id], self.flags[fact_id])
+
+
+class MappedPostings:
+    """word -> Posting whose ids/tfs are views into the mapping."""
+
+    def __init__(self, slots, offsets, ids, tfs):
+        self.slots = slots
+        self.offsets = offsets
+        self.ids = ids
+        self.tfs = tfs
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __contains__(self, word):
+        return word in self.slots
+
+    def __getitem__(self, word):
+        slot = self.slots[word]
+        start, end = self.offsets[slot], self.offsets[slot + 1]
+        posting = Posting.__new__(Posting)
+        posting.ids = self.ids[start:end]
+        posting.tfs = self.tfs[start:end]
+        return posting
+
+    def get(self, word, default=None):
+        return self[word] if word in self.slots else default
+
+
+class MappedDocFreq:
+    def __init__(self, slots, doc_freq):
+        self.slots = slots
+        self.doc_freq = doc_freq
+
+    def __contains__(self, word):
+        return word in self.slots
+
+    def get(self, word, default=None):
+        slot = self.slots.get(word)
+        return self.doc_freq[slot] if slot is not None else default
+
+
+class MappedIndex(KnowledgeIndex):
+    """Read-only KnowledgeIndex over a snapshot file mapped into memory.
+
+    Fact text and postings stay in the mapping, so processes that map the
+    same file share one copy through the page cache; only the term
+    dictionary (and the trigram index when fuzzy) is built per process.
+    Raises ValueError for a file that is not a snapshot for this machine.
+    """
+
+    def __init__(self, path, k1=1.2, b=0.75, fuzzy=False):
+        super().__init__(k1=k1, b=b, fuzzy=fuzzy)
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.map)
+        if len(view) < HEADER.size:
+            raise ValueError(f"{path}: truncated snapshot")
+        (magic, order, facts, terms, meta_bytes, self.generation, postings, text_bytes, term_bytes,
+         self.total_length) = HEADER.unpack_from(view)
+        if magic != MAGIC or order != ORDER:
+            raise ValueError(f"{path}: not a Clipix snapshot for this machine")
+        cursor = HEADER.size
+
+        def section(size, fmt=None):
+            nonlocal cursor
+            start = cursor
+            cursor += size + _padding(size)
+            if cursor > len(view):
+                raise ValueError(f"{path}: truncated snapshot")
+            data = view[start:start + size]
+            return data.cast(fmt) if fmt else data
+
+        meta = json.loads(str(section(meta_bytes), 'utf-8'))
+        offsets = section(8 * (facts + 1), 'Q')
+        timestamps = section(8 * facts, 'd')
+        self.lengths = section(2 * facts, 'H')
+        categories = section(2 * facts, 'H')
+        flags = section(facts, 'B')
+        text = section(text_bytes)
+        self.hashes = section(8 * facts, 'Q')
+        self.hash_ids = section(4 * facts, 'I')
+        term_offsets = section(8 * (terms + 1), 'Q')
+        posting_offsets = section(8 * (terms + 1), 'Q')
+        doc_freq = section(4 * terms, 'I')
+        term_blob = section(term_bytes)
+        ids = section(4 * postings, 'I')
+        tfs = section(2 * postings, 'H')
+
+        names = [sys.intern(name) for name in meta['categories']]
+        self.records = FactTable(offsets, timestamps, categories, flags, text, names)
+        slots = {
+            str(term_blob[term_offsets[i]:term_offsets[i + 1]], 'utf-8'): i for i in range(terms)
+        }
+        self.postings = MappedPostings(slots, posting_offsets, ids, tfs)
+        self.doc_freq = MappedDocFreq(slots, doc_freq)
+        self.category_counts = Counter(meta['category_counts'])
+        self.live_count = facts
+        if self.trigrams is not None:
+            for word in slots:
+                self.trigrams.add(word)
+
+    def lookup(self, category, fact):
+        key = fact_key(category, fact)
+        i = bisect_left(self.hashes, key)
+        while i < len(self.hashes) and self.hashes[i] == key:
+            fact_id = self.hash_ids[i]
+            record = self.records[fact_id]
+            if record.category == category and record.text == fact:
+                return fact_id
+            i += 1
+        return None
+
+    def live(self):
+        records = self.records
+        for fact_id in range(len(records)):
+            yield fact_id, records[fact_id]
+
+    def fork(self):
+        raise TypeError("snapshot indexes are read-only")
+
+    def add(self, category, fact, flags=0, timestamp=None):
+        raise TypeError("snapshot indexes are read-only")
+
+    def remove_id(self, fact_id):
+        raise TypeError("snapshot indexes are read-only")
+
+    def touch(self, fact_id, timestamp):
+        raise TypeError("snapshot indexes are read-only")
+
+    def memory_usage(self, sample_size=1000):
+        # The mapping is shared between processes; only the term dictionary is private
+        size = len(self.map)
+        return {
+            'bytes_total': size,
+            'bytes_per_fact': round(size / self.live_count, 1) if self.live_count else 0,
+            'mapped': True,
+        }
+
+
+def read_snapshot(path, fuzzy=True):
+    """Load a snapshot into a writable KnowledgeIndex without re-tokenizing any fact."""
+    mapped = MappedIndex(path)
+    index = KnowledgeIndex(k1=mapped.k1, b=mapped.b, fuzzy=fuzzy)
+    index.generation = mapped.generation
+    table = mapped.records
+    index.records.extend(table[fact_id] for fact_id in range(len(table)))
+    index.lengths.extend(mapped.lengths)
+    for fact_id, record in enumerate(index.records):
+        record.category = sys.intern(record.category)
+        if record.text in index.ids_by_text:
+            index.extra_ids[(record.category, record.text)] = fact_id
+        else:
+            index.ids_by_text[record.text] = fact_id
+    postings = mapped.postings
+    for word, slot in postings.slots.items():
+        start, end = postings.offsets[slot], postings.offsets[slot + 1]
+        posting = index.postings[word] = Posting()
+        posting.ids.frombytes(postings.ids[start:end].cast('B'))
+        posting.tfs.frombytes(postings.tfs[start:end].cast('B'))
+        index.doc_freq[word] = end - start
+        if index.trigrams is not None:
+            index.trigrams.add(word)
+    index.category_counts = Counter(mapped.category_counts)
+    index.live_count = mapped.live_count
+    index.total_length = mapped.total_length
+    return index
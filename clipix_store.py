@@ -0,0 +1,1222 @@
+# clipix_store.py - Durable knowledge storage
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from clipix_dedup import NearDuplicateIndex
+from clipix_index import ExpiryIndex, KnowledgeIndex, TrigramIndex, resolve_with, tokenize
+from clipix_query import FLAG_TIME_SENSITIVE, fact_flags
+from clipix_snapshot import MappedIndex, read_snapshot, write_snapshot
+
+try:
+    import fcntl
+except ImportError:  # Windows: the shared store is unavailable
+    fcntl = None
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def knowledge_document(index):
+    # The ai_knowledge.json layout for the live facts of an index
+    # fact_created[category][i] is the creation time (epoch seconds) of knowledge_base[category][i]
+    knowledge_base = defaultdict(list)
+    fact_created = defaultdict(list)
+    for _, record in index.live():
+        knowledge_base[record.category].append(record.text)
+        fact_created[record.category].append(round(record.timestamp, 3))
+    return {
+        'knowledge_base': dict(knowledge_base),
+        'fact_created': dict(fact_created),
+        'metadata': {
+            'total_facts': index.live_count,
+            'total_topics': len(knowledge_base),
+            'last_updated': datetime.now().isoformat()
+        }
+    }
+
+
+class KnowledgeJournal:
+    """Append-only log of fact additions/removals with batched fsync.
+
+    A shared journal is written by several processes: it is reopened for
+    every append (another process may have replaced it) and always synced.
+    """
+
+    def __init__(self, path, fsync_every=32, fsync_interval=1.0, shared=False):
+        self.path = path
+        self.shared = shared
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.records = 0
+        self.pending = 0
+        self.last_sync = time.time()
+        self.lock = threading.Lock()
+        self._file = None
+
+    def replay(self):
+        if not os.path.exists(self.path):
+            return
+        good = 0
+        damaged = False
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError("unterminated record")
+                    record = json.loads(line)
+                except ValueError:
+                    damaged = True
+                    break
+                good += len(line)
+                self.records += 1
+                yield record
+        if damaged:
+            # Torn tail from a crash mid-write: cut it off so new appends start on a clean line
+            print(f"⚠️ Journal: dropping damaged records after byte {good} in {self.path}")
+            with self.lock:
+                os.truncate(self.path, good)
+
+    def _trim_torn_tail(self, f):
+        # f is open for reading and writing; drops a trailing partial line left by a crash
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return
+        f.seek(end - 1)
+        if f.read(1) == b'\n':
+            return
+        position = end
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline >= 0:
+                position += newline + 1
+                break
+        print(f"⚠️ Journal: dropping a torn record at byte {position} in {self.path}")
+        f.truncate(position)
+
+    def _open_append(self):
+        f = open(self.path, 'ab+')
+        self._trim_torn_tail(f)
+        return f
+
+    def append(self, op, category, fact, timestamp=None):
+        self.append_many([(op, category, fact, timestamp)])
+
+    def append_many(self, entries, sync=False):
+        lines = []
+        for op, category, fact, timestamp in entries:
+            record = {'op': op, 'category': category, 'fact': fact}
+            if timestamp:
+                record['ts'] = timestamp
+            lines.append(json.dumps(record, ensure_ascii=False) + '\n')
+        if not lines:
+            return
+        data = ''.join(lines).encode('utf-8')
+        if self.shared:
+            # Writers hold the store's exclusive flock, so a torn tail here is from a crashed process
+            with self.lock, self._open_append() as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            return
+        with self.lock:
+            if self._file is None:
+                self._file = self._open_append()
+            self._file.write(data)
+            self._file.flush()
+            self.records += len(lines)
+            self.pending += len(lines)
+            if sync or self.pending >= self.fsync_every or time.time() - self.last_sync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        if self._file is not None and self.pending:
+            os.fsync(self._file.fileno())
+        self.pending = 0
+        self.last_sync = time.time()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def reset(self):
+        with self.lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.records = 0
+            self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class KnowledgeStore:
+    """Interface shared by the knowledge backends used by ClipixAI."""
+
+    name = 'base'
+    dedup = None
+    dedup_mode = None
+    dedup_warming = False
+    ttls = {}
+    deferred = 0
+    _deferred_lock = threading.Lock()
+
+    def _init_dedup(self, mode, threshold):
+        # 'reject' drops a near-duplicate, 'merge' lets it replace the older copy
+        self.dedup_mode = mode if mode in ('reject', 'merge') else None
+        self.dedup_threshold = threshold
+        self.dedup_counters = {'rejected': 0, 'merged': 0}
+        self.load_phases = {}
+
+    def _phase(self, name, started):
+        now = time.time()
+        self.load_phases[name] = round(now - started, 3)
+        return now
+
+    def _start_dedup(self, facts):
+        # Signatures cost more than indexing, so they are built after the store starts serving;
+        # near-duplicates of facts not yet signed slip through until then
+        self.dedup = None
+        if not self.dedup_mode:
+            return
+        self.dedup = dedup = NearDuplicateIndex(self._dedup_text, threshold=self.dedup_threshold)
+        self.dedup_warming = True
+
+        def warm():
+            started = time.time()
+            for fact_id, fact in facts():
+                dedup.add(fact_id, fact)
+            self.dedup_warming = False
+            self._phase('dedup', started)
+
+        threading.Thread(target=warm, name='clipix-dedup-warmup', daemon=True).start()
+
+    def _dedup_stats(self):
+        if self.dedup is None:
+            return None
+        stats = self.dedup.stats()
+        stats.update(self.dedup_counters)
+        stats['mode'] = self.dedup_mode
+        stats['warming'] = self.dedup_warming
+        return stats
+
+    def load(self):
+        raise NotImplementedError
+
+    def add(self, category, fact):
+        return self.add_many([(category, fact)]) == 1
+
+    def add_many(self, items, rejected=None):
+        """Add (category, fact) items; returns how many were new.
+
+        When given, ``rejected`` collects ((category, fact), (category, fact)) pairs of
+        each near-duplicate turned away and the stored fact it was judged a copy of.
+        """
+        raise NotImplementedError
+
+    def remove(self, category, fact):
+        raise NotImplementedError
+
+    def remove_many(self, items):
+        return sum(1 for category, fact in items if self.remove(category, fact))
+
+    def facts(self):
+        """Iterate (category, fact) over every stored fact."""
+        raise NotImplementedError
+
+    def search(self, terms, k=5, min_match=1, fresh_only=False):
+        raise NotImplementedError
+
+    def search_many(self, term_lists, k=5, min_match=1, fresh_only=False):
+        return [self.search(terms, k, min_match=min_match, fresh_only=fresh_only) for terms in term_lists]
+
+    def expire(self, categories, max_age_days):
+        raise NotImplementedError
+
+    @contextmanager
+    def deferred_compaction(self):
+        """Hold off journal compaction during a bulk write; the caller saves once afterwards."""
+        with self._deferred_lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self._deferred_lock:
+                self.deferred -= 1
+
+    def configure_expiry(self, ttls):
+        """Set the per-category time to live, in seconds, used by expire_due."""
+        self.ttls = dict(ttls)
+
+    def expire_due(self, limit=None):
+        # Stores without an expiry index sweep one query per distinct TTL
+        groups = defaultdict(list)
+        for category, ttl in self.ttls.items():
+            groups[ttl].append(category)
+        return sum(self.expire(categories, ttl / 86400) for ttl, categories in groups.items())
+
+    def stats(self):
+        raise NotImplementedError
+
+    def save(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonKnowledgeStore(KnowledgeStore):
+    """In-memory index over ai_knowledge.json plus an append-only journal.
+
+    The index's fact records are the only in-memory copy of the knowledge;
+    the category -> facts layout of the JSON file is produced on save.
+
+    ``self.index`` is an immutable snapshot: readers take a reference and
+    search it without locking. Writers serialize on ``self.lock``, apply a
+    batch to a fork of the snapshot and publish it with a single attribute
+    assignment, bumping the generation.
+    """
+
+    name = 'json'
+
+    def __init__(self, knowledge_file, journal_file, compact_every=1000, fsync_every=32, fsync_interval=1.0,
+                 dedup=None, dedup_threshold=0.8, fuzzy=True, snapshot_file=None):
+        self.knowledge_file = knowledge_file
+        # Optional binary snapshot written on save so the next start skips parsing and tokenizing
+        self.snapshot_file = snapshot_file
+        self.compact_every = compact_every
+        self.fuzzy = fuzzy
+        self.index = KnowledgeIndex(fuzzy=fuzzy)
+        self.staged = None
+        self.lock = threading.RLock()
+        self.journal = KnowledgeJournal(journal_file, fsync_every=fsync_every, fsync_interval=fsync_interval)
+        self._init_dedup(dedup, dedup_threshold)
+        self._memory = (0, None)
+        self.expiry = ExpiryIndex({})
+
+    @property
+    def generation(self):
+        return self.index.generation
+
+    def _writable(self):
+        # Callers hold self.lock
+        if self.staged is None:
+            self.staged = self.index.fork()
+        return self.staged
+
+    def _publish(self):
+        if self.staged is not None:
+            self.index, self.staged = self.staged, None
+
+    @property
+    def knowledge_base(self):
+        knowledge_base = defaultdict(list)
+        for _, record in self.index.live():
+            knowledge_base[record.category].append(record.text)
+        return knowledge_base
+
+    def facts(self):
+        return ((record.category, record.text) for _, record in self.index.live())
+
+    def _snapshot_current(self):
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return False
+        # A snapshot older than the JSON (edited by the trainer or dedup tool) is stale
+        return (not os.path.exists(self.knowledge_file)
+                or os.stat(self.knowledge_file).st_mtime_ns <= os.stat(self.snapshot_file).st_mtime_ns)
+
+    def load(self):
+        with self.lock:
+            started = time.time()
+            self.load_phases = {}
+            from_snapshot = False
+            if self._snapshot_current():
+                try:
+                    self.staged = read_snapshot(self.snapshot_file, fuzzy=self.fuzzy)
+                    from_snapshot = True
+                    started = self._phase('snapshot', started)
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ Ignoring knowledge snapshot: {e}")
+            if not from_snapshot:
+                data = {}
+                if os.path.exists(self.knowledge_file):
+                    with open(self.knowledge_file, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                started = self._phase('read', started)
+                self._build_index(data.get('knowledge_base', {}), data.get('fact_created'), data.get('fact_timestamps'))
+                started = self._phase('index', started)
+            replayed = self._replay_journal()
+            self._publish()
+            self.expiry.rebuild(self.index.live())
+            started = self._phase('journal', started)
+            if replayed:
+                self.save()
+                self._phase('save', started)
+            elif self.snapshot_file and not from_snapshot:
+                write_snapshot(self.snapshot_file, self.index, self.index.generation)
+                self._phase('snapshot_write', started)
+            self._start_dedup(self._live_texts)
+            return replayed
+
+    def _live_texts(self):
+        return ((fact_id, record.text) for fact_id, record in self.index.live())
+
+    def _build_index(self, knowledge_base, fact_created=None, fact_timestamps=None):
+        # Files written before fact_created keyed timestamps by category and 50-character
+        # prefix, which collide; they are only consulted when fact_created is missing
+        fact_created = fact_created or {}
+        fact_timestamps = fact_timestamps or {}
+        now = time.time()
+        index = self.staged = KnowledgeIndex(fuzzy=self.fuzzy)
+        index.generation = self.index.generation + 1
+        for category, facts in knowledge_base.items():
+            created = fact_created.get(category)
+            if created is not None and len(created) != len(facts):
+                created = None
+            for i, fact in enumerate(facts):
+                if (category, fact) in index:
+                    continue
+                if created is not None:
+                    timestamp = created[i]
+                else:
+                    stamp = fact_timestamps.get(f"{category}_{fact[:50]}")
+                    timestamp = datetime.fromisoformat(stamp).timestamp() if stamp else now
+                index.add(category, fact, fact_flags(fact), timestamp)
+
+    def _replay_journal(self):
+        replayed = 0
+        index = self._writable()
+        for record in self.journal.replay():
+            category, fact = record['category'], record['fact']
+            if record['op'] == 'add':
+                timestamp = datetime.fromisoformat(record['ts']).timestamp() if record.get('ts') else None
+                fact_id = index.lookup(category, fact)
+                if fact_id is None:
+                    index.add(category, fact, fact_flags(fact), timestamp)
+                elif timestamp:
+                    index.touch(fact_id, timestamp)
+            elif record['op'] == 'remove':
+                self._drop(index, category, fact)
+            replayed += 1
+        return replayed
+
+    def _dedup_text(self, fact_id):
+        # Dedup lookups run inside writers, so ids may only exist in the staged fork
+        records = (self.staged if self.staged is not None else self.index).records
+        record = records[fact_id] if fact_id < len(records) else None
+        return record.text if record is not None else None
+
+    def add_many(self, items, rejected=None):
+        entries = []
+        added = 0
+        with self.lock:
+            # Known facts are skipped before paying for a fork
+            items = [item for item in items if item not in self.index]
+            if not items:
+                return 0
+            index = self._writable()
+            for category, fact in items:
+                if (category, fact) in index:
+                    continue
+                signature = None
+                if self.dedup is not None:
+                    signature = self.dedup.signature(fact)
+                    match = self.dedup.find(fact, signature)
+                    if match is not None:
+                        record = index.records[match]
+                        if self.dedup_mode == 'reject':
+                            self.dedup_counters['rejected'] += 1
+                            if rejected is not None:
+                                rejected.append(((category, fact), (record.category, record.text)))
+                            continue
+                        entries.append(('remove', record.category, record.text, None))
+                        self._drop(index, record.category, record.text)
+                        self.dedup_counters['merged'] += 1
+                now = datetime.now()
+                fact_id = index.add(category, fact, fact_flags(fact), now.timestamp())
+                self.expiry.push(fact_id, index.records[fact_id])
+                if self.dedup is not None:
+                    self.dedup.add(fact_id, fact, signature)
+                entries.append(('add', category, fact, now.isoformat()))
+                added += 1
+            # Journal first so a published fact is never missing after a crash
+            self.journal.append_many(entries, sync=len(entries) > 1)
+            if entries:
+                self._publish()
+            self.staged = None
+            if not self.deferred and self.journal.records >= self.compact_every:
+                self.save()
+        return added
+
+    def _drop(self, index, category, fact):
+        fact_id = index.lookup(category, fact)
+        if fact_id is None:
+            return False
+        index.remove_id(fact_id)
+        if self.dedup is not None:
+            self.dedup.remove(fact_id, fact)
+        return True
+
+    def remove(self, category, fact):
+        return self.remove_many([(category, fact)]) == 1
+
+    def remove_many(self, items):
+        removed = []
+        with self.lock:
+            index = self._writable()
+            for category, fact in items:
+                if self._drop(index, category, fact):
+                    removed.append(('remove', category, fact, None))
+            self.journal.append_many(removed, sync=True)
+            if removed:
+                self._publish()
+            self.staged = None
+        return len(removed)
+
+    def search(self, terms, k=5, min_match=1, fresh_only=False):
+        index = self.index
+        exclude = FLAG_TIME_SENSITIVE if fresh_only else 0
+        return self._results(index, index.search(terms, k, min_match=min_match, exclude_flags=exclude))
+
+    def search_many(self, term_lists, k=5, min_match=1, fresh_only=False):
+        index = self.index
+        exclude = FLAG_TIME_SENSITIVE if fresh_only else 0
+        batches = index.search_many(term_lists, k, min_match=min_match, exclude_flags=exclude)
+        return [self._results(index, hits) for hits in batches]
+
+    def _results(self, index, hits):
+        results = []
+        for score, fact_id in hits:
+            record = index.records[fact_id]
+            results.append({'fact': record.text, 'category': record.category, 'score': round(score, 4)})
+        return results
+
+    def expire(self, categories, max_age_days):
+        cutoff = time.time() - max_age_days * 86400
+        categories = set(categories)
+        with self.lock:
+            expired = [
+                (record.category, record.text) for _, record in self.index.live()
+                if record.category in categories and record.timestamp <= cutoff
+            ]
+            for category, fact in expired:
+                print(f"🗑️ Removed outdated fact: {fact[:50]}...")
+            removed = self.remove_many(expired)
+            if removed:
+                self.save()
+        return removed
+
+    def configure_expiry(self, ttls):
+        with self.lock:
+            self.ttls = dict(ttls)
+            self.expiry = ExpiryIndex(self.ttls)
+            self.expiry.rebuild(self.index.live())
+
+    def expire_due(self, limit=None):
+        """Remove the facts whose category TTL has run out, touching only those facts."""
+        with self.lock:
+            records = self.index.records
+            due = sorted(set(self.expiry.pop_due(records, limit=limit)))
+            removed = self.remove_many([(records[i].category, records[i].text) for i in due]) if due else 0
+        if removed:
+            print(f"🗑️ Expired {removed} outdated facts")
+        return removed
+
+    def stats(self):
+        index = self.index
+        return {
+            'total_facts': index.live_count,
+            'topics': dict(index.category_counts),
+            'generation': index.generation,
+            'load_phases': dict(self.load_phases),
+            'dedup': self._dedup_stats(),
+            'memory': self.memory_stats(),
+            'fuzzy_corrections': index.trigrams.corrections if index.trigrams else None,
+        }
+
+    def memory_stats(self, max_age=60):
+        # Walking every postings list is O(vocabulary), so the figure is cached briefly
+        measured_at, memory = self._memory
+        if memory is None or time.time() - measured_at > max_age:
+            memory = self.index.memory_usage()
+            self._memory = (time.time(), memory)
+        return memory
+
+    def replace_all(self, knowledge_base, fact_created=None):
+        # fact_created is laid out as in the knowledge file; facts without a time are stamped now
+        with self.lock:
+            self._build_index(knowledge_base, fact_created)
+            self._publish()
+            self.expiry.rebuild(self.index.live())
+            self.save()
+            self._start_dedup(self._live_texts)
+
+    def save(self):
+        # Compaction: fold the journal into a fresh snapshot, then start a new journal.
+        # Writers wait for it; searches keep reading the published index.
+        with self.lock:
+            index = self.index
+            write_atomic(self.knowledge_file, knowledge_document(index))
+            if self.snapshot_file:
+                write_snapshot(self.snapshot_file, index, index.generation)
+            self.journal.reset()
+
+    def close(self):
+        self.journal.close()
+
+
+class SharedKnowledgeStore(KnowledgeStore):
+    """Knowledge shared by several worker processes through a mapped snapshot.
+
+    The binary snapshot file is the common base that every worker maps
+    read-only. Facts written by any worker go to the shared journal, and
+    each worker tails it into a small private delta index plus a set of
+    removed base ids; searches read (base, delta, removed) as one published
+    view. Compaction folds the journal into a new snapshot generation and
+    ai_knowledge.json under an exclusive flock; the other workers see the
+    new file on their next poll and remap it. Until then BM25 statistics
+    still count removed base facts.
+    """
+
+    name = 'shared'
+
+    def __init__(self, knowledge_file, journal_file, snapshot_file, compact_every=1000, poll_interval=1.0,
+                 fuzzy=True, dedup=None, **options):
+        if fcntl is None:
+            raise RuntimeError("the shared knowledge store needs fcntl.flock")
+        if dedup in ('reject', 'merge'):
+            print("ℹ️ Near-duplicate detection is off with the shared store")
+        self.knowledge_file = knowledge_file
+        self.snapshot_file = snapshot_file
+        self.lock_file = f"{snapshot_file}.lock"
+        self.compact_every = compact_every
+        self.poll_interval = poll_interval
+        self.fuzzy = fuzzy
+        self.journal = KnowledgeJournal(journal_file, shared=True)
+        self.lock = threading.RLock()
+        self.view = (None, KnowledgeIndex(fuzzy=False), frozenset())
+        # Per-process expiry heaps over the base and delta ids of the current view
+        self.expiry = (ExpiryIndex({}), ExpiryIndex({}))
+        # Spelling vocabulary of base + delta, replaced as a whole like the view
+        self.spelling = None
+        self.snapshot_id = None
+        self.journal_offset = 0
+        self.tailed = 0
+        self.last_poll = 0.0
+        self._init_dedup(None, 0)
+
+    @contextmanager
+    def _flock(self, mode, blocking=True):
+        # A fresh descriptor per use, so processes forked after startup never share a lock.
+        # Non-blocking callers get BlockingIOError while another process holds it.
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f.fileno(), mode if blocking else mode | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _file_id(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _snapshot_usable(self):
+        snapshot = self._file_id(self.snapshot_file)
+        if snapshot is None:
+            return False
+        knowledge = self._file_id(self.knowledge_file)
+        # ai_knowledge.json edited behind our back (trainer, dedup tool) wins
+        return knowledge is None or knowledge[1] <= snapshot[1]
+
+    def load(self):
+        with self.lock:
+            started = time.time()
+            self.load_phases = {}
+            with self._flock(fcntl.LOCK_EX):
+                if not self._snapshot_usable():
+                    self._build_snapshot()
+                    started = self._phase('build', started)
+                try:
+                    self._remap()
+                except ValueError as e:
+                    print(f"⚠️ Rebuilding knowledge snapshot: {e}")
+                    self._build_snapshot()
+                    self._remap()
+                started = self._phase('map', started)
+                self._tail()
+                self._phase('journal', started)
+            self.last_poll = time.time()
+            return self.tailed
+
+    def _build_snapshot(self):
+        # Folds any journal into ai_knowledge.json, then derives the binary snapshot from it
+        print(f"🧱 Building knowledge snapshot {self.snapshot_file}...")
+        source = JsonKnowledgeStore(self.knowledge_file, self.journal.path, fuzzy=False)
+        source.load()
+        source.close()
+        base = self.view[0]
+        write_snapshot(self.snapshot_file, source.index, base.generation + 1 if base else 1)
+        self.journal.reset()
+
+    def _remap(self):
+        base = MappedIndex(self.snapshot_file)
+        self.snapshot_id = self._file_id(self.snapshot_file)
+        self.journal_offset = 0
+        self.tailed = 0
+        self.view = (base, KnowledgeIndex(fuzzy=False), frozenset())
+        self._rebuild_expiry()
+        if self.fuzzy:
+            self.spelling = TrigramIndex()
+            for word in base.postings:
+                self.spelling.add(word)
+
+    def _rebuild_expiry(self):
+        # Reads the snapshot's timestamp and category columns only, so no fact text is decoded
+        base, delta, _ = self.view
+        base_expiry, delta_expiry = self.expiry = (ExpiryIndex(self.ttls), ExpiryIndex(self.ttls))
+        if not self.ttls:
+            return
+        if base is not None:
+            table = base.records
+            base_expiry.rebuild_columns(table.timestamps, (table.names[c] for c in table.categories))
+        delta_expiry.rebuild(delta.live())
+
+    def _tail(self):
+        # Callers hold self.lock and a flock, so no writer is mid-append
+        journal = self._file_id(self.journal.path)
+        size = journal[2] if journal else 0
+        if size == self.journal_offset:
+            return
+        if size < self.journal_offset:
+            # Reset without a new snapshot: only a non-shared store does that
+            print("⚠️ Knowledge journal shrank; remapping snapshot")
+            self._remap()
+        with open(self.journal.path, 'rb') as f:
+            f.seek(self.journal_offset)
+            data = f.read(size - self.journal_offset)
+        complete = data[:data.rfind(b'\n') + 1]
+        entries = []
+        for line in complete.splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"⚠️ Journal: ignoring damaged record in {self.journal.path}")
+                continue
+            timestamp = datetime.fromisoformat(record['ts']).timestamp() if record.get('ts') else None
+            entries.append((record['op'], record['category'], record['fact'], timestamp))
+        self.journal_offset += len(complete)
+        self.tailed += len(entries)
+        self._apply(entries)
+
+    def _apply(self, entries):
+        base, delta, removed = self.view
+        delta = delta.fork()
+        removed = set(removed)
+        new_words = set()
+        for op, category, fact, timestamp in entries:
+            if op == 'add':
+                if self._find(base, delta, removed, category, fact) is None:
+                    fact_id = delta.add(category, fact, fact_flags(fact), timestamp)
+                    self.expiry[1].push(fact_id, delta.records[fact_id])
+                    new_words.update(tokenize(fact))
+            elif op == 'remove':
+                fact_id = delta.lookup(category, fact)
+                if fact_id is not None:
+                    delta.remove_id(fact_id)
+                else:
+                    fact_id = base.lookup(category, fact)
+                    if fact_id is not None:
+                        removed.add(fact_id)
+        if self.spelling is not None:
+            new_words = {word for word in new_words if word not in base.postings}
+            if new_words:
+                spelling = self.spelling.fork()
+                for word in new_words:
+                    spelling.add(word)
+                self.spelling = spelling
+        self.view = (base, delta, frozenset(removed))
+
+    def _find(self, base, delta, removed, category, fact):
+        fact_id = delta.lookup(category, fact)
+        if fact_id is not None:
+            return ('delta', fact_id)
+        fact_id = base.lookup(category, fact)
+        if fact_id is not None and fact_id not in removed:
+            return ('base', fact_id)
+        return None
+
+    def _catch_up(self):
+        if self._file_id(self.snapshot_file) != self.snapshot_id:
+            self._remap()
+        self._tail()
+
+    def refresh(self, force=False):
+        """Pick up other workers' writes; cheap stat calls unless something changed."""
+        if not force and time.time() - self.last_poll < self.poll_interval:
+            return
+        with self.lock:
+            self.last_poll = time.time()
+            journal = self._file_id(self.journal.path)
+            if self._file_id(self.snapshot_file) == self.snapshot_id and (journal[2] if journal else 0) == self.journal_offset:
+                return
+            with self._flock(fcntl.LOCK_SH):
+                self._catch_up()
+
+    def _write(self, entries_for, blocking=True):
+        with self.lock:
+            with self._flock(fcntl.LOCK_EX, blocking):
+                self._catch_up()
+                entries = entries_for(*self.view)
+                self.journal.append_many(entries, sync=True)
+                # Read our own entries back so the journal stays the only source of changes
+                self._tail()
+            if not self.deferred and self.tailed >= self.compact_every:
+                self.save()
+        return len(entries)
+
+    def add_many(self, items, rejected=None):
+        # No near-duplicate detection here, so nothing is ever rejected
+        def entries_for(base, delta, removed):
+            entries = []
+            seen = set()
+            now = datetime.now().isoformat()
+            for category, fact in items:
+                if (category, fact) in seen or self._find(base, delta, removed, category, fact):
+                    continue
+                seen.add((category, fact))
+                entries.append(('add', category, fact, now))
+            return entries
+        return self._write(entries_for)
+
+    def remove(self, category, fact):
+        return self.remove_many([(category, fact)]) == 1
+
+    def remove_many(self, items):
+        def entries_for(base, delta, removed):
+            entries = []
+            seen = set()
+            for category, fact in items:
+                if (category, fact) in seen or not self._find(base, delta, removed, category, fact):
+                    continue
+                seen.add((category, fact))
+                entries.append(('remove', category, fact, None))
+            return entries
+        return self._write(entries_for)
+
+    def _resolve(self, base, delta, terms):
+        # (resolved terms, the ones that are typo corrections), judged against both layers
+        spelling = self.spelling
+
+        def known(term):
+            return term in base.postings or term in delta.postings
+
+        def correct(term):
+            return spelling.correct(term, weight=lambda word: base.doc_freq.get(word, 0) + delta.doc_freq.get(word, 0))
+
+        return resolve_with(terms, known, correct if spelling is not None else None)
+
+    def _merge(self, layers, k):
+        results = []
+        for index, hits in layers:
+            for score, fact_id in hits:
+                record = index.records[fact_id]
+                results.append({'fact': record.text, 'category': record.category, 'score': round(score, 4)})
+        results.sort(key=lambda result: result['score'], reverse=True)
+        return results[:k]
+
+    def search(self, terms, k=5, min_match=1, fresh_only=False):
+        self.refresh()
+        base, delta, removed = self.view
+        terms, corrected = self._resolve(base, delta, terms)
+        exclude = FLAG_TIME_SENSITIVE if fresh_only else 0
+        results = self._merge([
+            (base, base.search(terms, k, min_match, exclude, skip=removed, background=delta, corrected=corrected)),
+            (delta, delta.search(terms, k, min_match, exclude, background=base, corrected=corrected)),
+        ], k)
+        if self.spelling is not None:
+            self.spelling.credit(corrected, (result['fact'] for result in results))
+        return results
+
+    def search_many(self, term_lists, k=5, min_match=1, fresh_only=False):
+        self.refresh()
+        base, delta, removed = self.view
+        resolved = [self._resolve(base, delta, terms) for terms in term_lists]
+        term_lists = [terms for terms, _ in resolved]
+        corrected_lists = [corrected for _, corrected in resolved]
+        exclude = FLAG_TIME_SENSITIVE if fresh_only else 0
+        base_hits = base.search_many(term_lists, k, min_match, exclude, skip=removed, background=delta,
+                                     corrected_lists=corrected_lists)
+        delta_hits = delta.search_many(term_lists, k, min_match, exclude, background=base,
+                                       corrected_lists=corrected_lists)
+        results = [self._merge([(base, b), (delta, d)], k) for b, d in zip(base_hits, delta_hits)]
+        if self.spelling is not None:
+            for corrected, hits in zip(corrected_lists, results):
+                self.spelling.credit(corrected, (result['fact'] for result in hits))
+        return results
+
+    def _live(self):
+        base, delta, removed = self.view
+        for fact_id, record in base.live():
+            if fact_id not in removed:
+                yield record
+        for _, record in delta.live():
+            yield record
+
+    def facts(self):
+        self.refresh()
+        return ((record.category, record.text) for record in self._live())
+
+    @property
+    def knowledge_base(self):
+        knowledge_base = defaultdict(list)
+        for record in self._live():
+            knowledge_base[record.category].append(record.text)
+        return knowledge_base
+
+    def expire(self, categories, max_age_days):
+        self.refresh(force=True)
+        cutoff = time.time() - max_age_days * 86400
+        categories = set(categories)
+        expired = [
+            (record.category, record.text) for record in self._live()
+            if record.category in categories and record.timestamp <= cutoff
+        ]
+        for category, fact in expired:
+            print(f"🗑️ Removed outdated fact: {fact[:50]}...")
+        return self.remove_many(expired) if expired else 0
+
+    def configure_expiry(self, ttls):
+        with self.lock:
+            self.ttls = dict(ttls)
+            self._rebuild_expiry()
+
+    def expire_due(self, limit=None):
+        """Remove the facts whose category TTL has run out, touching only those facts.
+
+        Every worker keeps the same heaps, but one sweeps at a time under the
+        exclusive flock; a worker that finds the lock taken skips this round.
+        Workers that sweep later pop the same entries and find them removed.
+        """
+        self.refresh()
+        now = time.time()
+        due_at = [expiry.next_due() for expiry in self.expiry if expiry.next_due() is not None]
+        if not due_at or min(due_at) > now:
+            return 0
+
+        def entries_for(base, delta, removed):
+            base_expiry, delta_expiry = self.expiry
+            expired = [base.records[i] for i in base_expiry.pop_due(base.records, now, limit) if i not in removed]
+            expired += [delta.records[i] for i in delta_expiry.pop_due(delta.records, now, limit)]
+            return [('remove', record.category, record.text, None) for record in expired]
+
+        try:
+            removed = self._write(entries_for, blocking=False)
+        except BlockingIOError:
+            return 0
+        if removed:
+            print(f"🗑️ Expired {removed} outdated facts")
+        return removed
+
+    def stats(self):
+        self.refresh()
+        base, delta, removed = self.view
+        topics = Counter(base.category_counts)
+        topics.subtract(base.records[fact_id].category for fact_id in removed)
+        topics.update(delta.category_counts)
+        return {
+            'total_facts': base.live_count - len(removed) + delta.live_count,
+            'topics': {category: count for category, count in topics.items() if count > 0},
+            'generation': base.generation,
+            'load_phases': dict(self.load_phases),
+            'pending': {'journal_entries': self.tailed, 'delta_facts': delta.live_count, 'removed': len(removed)},
+            'dedup': None,
+            'memory': base.memory_usage(),
+            'fuzzy_corrections': self.spelling.corrections if self.spelling is not None else None,
+        }
+
+    def save(self):
+        # Compaction: one worker folds base + journal into the next generation
+        with self.lock:
+            with self._flock(fcntl.LOCK_EX):
+                self._catch_up()
+                if not self.tailed:
+                    return
+                base = self.view[0]
+                index = KnowledgeIndex(fuzzy=False)
+                for record in self._live():
+                    index.add(record.category, record.text, record.flags, record.timestamp)
+                write_atomic(self.knowledge_file, knowledge_document(index))
+                write_snapshot(self.snapshot_file, index, base.generation + 1)
+                self.journal.reset()
+                self._remap()
+
+    def close(self):
+        self.journal.close()
+
+
+class SQLiteKnowledgeStore(KnowledgeStore):
+    """Facts in SQLite with an FTS5 index; nothing is held in process memory."""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS facts (
+            id INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            fact TEXT NOT NULL,
+            created TEXT NOT NULL,
+            time_sensitive INTEGER NOT NULL DEFAULT 0,
+            UNIQUE (category, fact)
+        );
+        CREATE INDEX IF NOT EXISTS facts_category_created ON facts (category, created);
+        CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5 (fact, content='facts', content_rowid='id');
+        CREATE VIRTUAL TABLE IF NOT EXISTS facts_vocab USING fts5vocab (facts_fts, 'row');
+        CREATE TRIGGER IF NOT EXISTS facts_ai AFTER INSERT ON facts BEGIN
+            INSERT INTO facts_fts (rowid, fact) VALUES (new.id, new.fact);
+        END;
+        CREATE TRIGGER IF NOT EXISTS facts_ad AFTER DELETE ON facts BEGIN
+            INSERT INTO facts_fts (facts_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+        END;
+    """
+
+    def __init__(self, db_file, import_file=None, dedup=None, dedup_threshold=0.8, fuzzy=True):
+        self.db_file = db_file
+        self.import_file = import_file
+        self.fuzzy = fuzzy
+        # (vocabulary, TrigramIndex), replaced as a pair so searches never see it change
+        self.spelling = (frozenset(), None)
+        self.local = threading.local()
+        self.write_lock = threading.Lock()
+        self._init_dedup(dedup, dedup_threshold)
+
+    @property
+    def db(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def load(self):
+        started = time.time()
+        self.load_phases = {}
+        with self.write_lock, self.db:
+            self.db.executescript(self.SCHEMA)
+            columns = [row[1] for row in self.db.execute('PRAGMA table_info(facts)')]
+            if 'time_sensitive' not in columns:
+                # Databases created before fact flags: add the column and backfill it once
+                self.db.execute('ALTER TABLE facts ADD COLUMN time_sensitive INTEGER NOT NULL DEFAULT 0')
+                self.db.executemany(
+                    'UPDATE facts SET time_sensitive = 1 WHERE id = ?',
+                    ((fact_id,) for fact_id, fact in self.db.execute('SELECT id, fact FROM facts').fetchall()
+                     if fact_flags(fact) & FLAG_TIME_SENSITIVE),
+                )
+        started = self._phase('schema', started)
+        if self.fuzzy:
+            # Only the vocabulary is held in memory for typo correction
+            vocabulary = frozenset(term for (term,) in self.db.execute(
+                'SELECT term FROM facts_vocab WHERE length(term) > 3'
+            ))
+            trigrams = TrigramIndex()
+            for word in vocabulary:
+                trigrams.add(word)
+            self.spelling = (vocabulary, trigrams)
+            started = self._phase('vocabulary', started)
+        # LSH buckets hold row ids only; fact text is fetched back for verification
+        self._start_dedup(lambda: self.db.execute('SELECT id, fact FROM facts'))
+        empty = self.db.execute('SELECT 1 FROM facts LIMIT 1').fetchone() is None
+        if empty and self.import_file and os.path.exists(self.import_file):
+            # One-time migration from the JSON snapshot
+            with open(self.import_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            items = [(category, fact) for category, facts in data.get('knowledge_base', {}).items() for fact in facts]
+            imported = self.add_many(items)
+            print(f"📥 Imported {imported} facts from {self.import_file}")
+            self._phase('import', started)
+        return 0
+
+    def _learn_words(self, facts):
+        # Callers hold write_lock
+        vocabulary, trigrams = self.spelling
+        if trigrams is None:
+            return
+        new_words = {word for fact in facts for word in tokenize(fact)} - vocabulary
+        if new_words:
+            trigrams = trigrams.fork()
+            for word in new_words:
+                trigrams.add(word)
+            self.spelling = (vocabulary | new_words, trigrams)
+
+    def _dedup_text(self, fact_id):
+        row = self.db.execute('SELECT fact FROM facts WHERE id = ?', (fact_id,)).fetchone()
+        return row[0] if row else None
+
+    def add_many(self, items, rejected=None):
+        items = list(items)
+        now = datetime.now().isoformat()
+        with self.write_lock, self.db:
+            self._learn_words(fact for _, fact in items)
+            if self.dedup is None:
+                cursor = self.db.executemany(
+                    'INSERT OR IGNORE INTO facts (category, fact, created, time_sensitive) VALUES (?, ?, ?, ?)',
+                    ((category, fact, now, fact_flags(fact)) for category, fact in items),
+                )
+                return max(cursor.rowcount, 0)
+            added = 0
+            for category, fact in items:
+                if self.db.execute('SELECT 1 FROM facts WHERE category = ? AND fact = ?', (category, fact)).fetchone():
+                    continue
+                signature = self.dedup.signature(fact)
+                match = self.dedup.find(fact, signature)
+                if match is not None:
+                    if self.dedup_mode == 'reject':
+                        self.dedup_counters['rejected'] += 1
+                        if rejected is not None:
+                            winner = self.db.execute('SELECT category, fact FROM facts WHERE id = ?', (match,))
+                            rejected.append(((category, fact), tuple(winner.fetchone())))
+                        continue
+                    self.dedup.remove(match, self._dedup_text(match))
+                    self.db.execute('DELETE FROM facts WHERE id = ?', (match,))
+                    self.dedup_counters['merged'] += 1
+                cursor = self.db.execute(
+                    'INSERT INTO facts (category, fact, created, time_sensitive) VALUES (?, ?, ?, ?)',
+                    (category, fact, now, fact_flags(fact)),
+                )
+                self.dedup.add(cursor.lastrowid, fact, signature)
+                added += 1
+            return added
+
+    def remove(self, category, fact):
+        return self.remove_many([(category, fact)]) == 1
+
+    def remove_many(self, items):
+        with self.write_lock, self.db:
+            if self.dedup is None:
+                cursor = self.db.executemany('DELETE FROM facts WHERE category = ? AND fact = ?', items)
+                return max(cursor.rowcount, 0)
+            removed = 0
+            for category, fact in items:
+                row = self.db.execute('SELECT id FROM facts WHERE category = ? AND fact = ?', (category, fact)).fetchone()
+                if row:
+                    self.dedup.remove(row[0], fact)
+                    self.db.execute('DELETE FROM facts WHERE id = ?', row)
+                    removed += 1
+            return removed
+
+    def facts(self):
+        return self.db.execute('SELECT category, fact FROM facts')
+
+    def search(self, terms, k=5, min_match=1, fresh_only=False):
+        if k <= 0:
+            return []
+        vocabulary, trigrams = self.spelling
+        if trigrams is None:
+            terms, corrected = list(dict.fromkeys(terms)), set()
+        else:
+            # FTS5 has no per-term weights, so corrected terms are not down-weighted here
+            terms, corrected = resolve_with(terms, vocabulary.__contains__, trigrams.correct)
+        if not terms:
+            return []
+        min_match = min(min_match, len(terms))
+        match = ' OR '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        try:
+            rows = self.db.execute(
+                'SELECT f.category, f.fact, bm25(facts_fts) AS rank FROM facts_fts '
+                'JOIN facts f ON f.id = facts_fts.rowid '
+                'WHERE facts_fts MATCH ? AND f.time_sensitive <= ? ORDER BY rank LIMIT ?',
+                (match, 0 if fresh_only else 1, max(k * 4, 20)),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"❌ FTS query error: {e}")
+            return []
+        results = []
+        for category, fact, rank in rows:
+            if min_match > 1 and len(set(terms).intersection(tokenize(fact))) < min_match:
+                continue
+            results.append({'fact': fact, 'category': category, 'score': round(-rank, 4)})
+            if len(results) == k:
+                break
+        if trigrams is not None:
+            trigrams.credit(corrected, (result['fact'] for result in results))
+        return results
+
+    def expire(self, categories, max_age_days):
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        placeholders = ', '.join('?' for _ in categories)
+        with self.write_lock, self.db:
+            if self.dedup is not None:
+                for fact_id, fact in self.db.execute(
+                    f'SELECT id, fact FROM facts WHERE category IN ({placeholders}) AND created < ?',
+                    (*categories, cutoff),
+                ).fetchall():
+                    self.dedup.remove(fact_id, fact)
+            cursor = self.db.execute(
+                f'DELETE FROM facts WHERE category IN ({placeholders}) AND created < ?',
+                (*categories, cutoff),
+            )
+            removed = cursor.rowcount
+        if removed:
+            print(f"🗑️ Removed {removed} outdated facts")
+        return removed
+
+    def stats(self):
+        topics = dict(self.db.execute('SELECT category, COUNT(*) FROM facts GROUP BY category').fetchall())
+        return {
+            'total_facts': sum(topics.values()),
+            'topics': topics,
+            'load_phases': dict(self.load_phases),
+            'dedup': self._dedup_stats(),
+            'fuzzy_corrections': self.spelling[1].corrections if self.spelling[1] else None,
+        }
+
+    def save(self):
+        with self.write_lock:
+            self.db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+def open_store(kind, knowledge_file, journal_file, db_file, **options):
+    if kind == 'sqlite':
+        return SQLiteKnowledgeStore(
+            db_file,
+            import_file=knowledge_file,
+            dedup=options.get('dedup'),
+            dedup_threshold=options.get('dedup_threshold', 0.8),
+            fuzzy=options.get('fuzzy', True),
+        )
+    if kind == 'shared':
+        return SharedKnowledgeStore(knowledge_file, journal_file, **options)
+    if kind != 'json':
+        print(f"⚠️ Unknown knowledge store '{kind}', using json")
+    options.pop('poll_interval', None)
+    return JsonKnowledgeStore(knowledge_file, journal_file, **options)
@@ -57,9 +57,11 @@ class ClipixTrainer:
         
         fact = input("Enter fact to teach: ").strip()
         if fact:
-            self.ai.add_knowledge(category, fact)
-            self.ai.save_knowledge()
-            print(f"✅ Added to '{category}': {fact}")
+            # add_knowledge journals the fact, no full save needed
+            if self.ai.add_knowledge(category, fact):
+                print(f"✅ Added to '{category}': {fact}")
+            else:
+                print(f"ℹ️ Already known in '{category}': {fact}")
         else:
             print("❌ No fact entered.")
     
@@ -133,8 +135,8 @@ class ClipixTrainer:
             self.ai.google_api_key = api_key
             self.ai.search_engine_id = search_id
             self.ai.google_enabled = True
-            self.ai.save_config()
             print("✅ Google Search configured! (100 free searches/day)")
+            print("ℹ️ For this session only; put GOOGLE_API_KEY and SEARCH_ENGINE_ID in .env to keep them")
         else:
             print("❌ Both API Key and Search Engine ID are required.")
     
@@ -147,8 +149,8 @@ class ClipixTrainer:
         if api_key:
             self.ai.deepseek_api_key = api_key
             self.ai.deepseek_enabled = True
-            self.ai.save_config()
             print("✅ DeepSeek API configured!")
+            print("ℹ️ For this session only; put DEEPSEEK_API_KEY in .env to keep it")
     
     def run(self):
         """Main training loop"""
@@ -1,56 +1,166 @@
 # render_app.py - FIXED VERSION
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from clipix_core import ClipixAI  # CHANGED FROM SmartClipixAI to ClipixAI
+from clipix_metrics import REGISTRY, SampledLog
+import json
 import os
 import time
 
+MAX_BATCH = int(os.environ.get('CLIPIX_MAX_BATCH', 50))
+READY_TIMEOUT = float(os.environ.get('CLIPIX_READY_TIMEOUT', 20))
+# Share of per-request chat lines that get printed; errors always print
+log = SampledLog(float(os.environ.get('CLIPIX_LOG_SAMPLE', 0.01)))
+
+HTTP_SECONDS = REGISTRY.histogram('clipix_http_request_seconds', 'HTTP request latency by route', ('route',))
+HTTP_REQUESTS = REGISTRY.counter('clipix_http_requests_total', 'HTTP requests by route and status', ('route', 'status'))
+
 app = Flask(__name__)
 CORS(app)
 
-# Initialize AI
+# Initialize AI - knowledge loads in the background so the port binds and /health answers at once
 print("🚀 Initializing Clipix AI for Mobile App...")
-start_time = time.time()
-ai = ClipixAI()  # CHANGED FROM SmartClipixAI() to ClipixAI()
-load_time = time.time() - start_time
+ai = ClipixAI(load=False)  # CHANGED FROM SmartClipixAI() to ClipixAI()
+if os.environ.get('CLIPIX_LAZY_LOAD', '1') == '0':
+    ai.load_knowledge()
+else:
+    ai.start_loading()
+# Long-running server: expire facts as their TTL runs out, not only at startup
+ai.start_expiry_sweeper()
+
+@app.before_request
+def start_timer():
+    request.started = time.perf_counter()
 
-# Get stats - UPDATED METHOD
-stats = ai.get_stats()
-print(f"✅ AI Ready in {load_time:.2f}s with {stats['total_facts']} facts")
+@app.after_request
+def record_request(response):
+    # Streams are timed to their first byte; the chat histograms cover the rest
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_SECONDS.observe(time.perf_counter() - request.started, route=route)
+    HTTP_REQUESTS.inc(route=route, status=response.status_code)
+    return response
+
+def not_ready(payload):
+    # Requests that need knowledge wait for the load, then give up with a 503
+    if ai.ready.wait(READY_TIMEOUT):
+        return None
+    return jsonify(dict(payload, error='Knowledge is still loading, try again shortly')), 503
 
 @app.route('/')
 def home():
+    if not ai.ready.is_set():
+        return jsonify({
+            "message": "Clipix AI Mobile API",
+            "status": "loading",
+            "load_phases": ai.get_load_phases()
+        })
     stats = ai.get_stats()
     return jsonify({
         "message": "Clipix AI Mobile API", 
         "status": "running",
         "facts": stats['total_facts'],
-        "load_time": f"{load_time:.2f}s"
+        "load_time": f"{stats['load_phases'].get('total', 0):.2f}s",
+        "load_phases": stats['load_phases']
     })
 
 @app.route('/api/chat', methods=['POST'])
 def chat():
+    busy = not_ready({'response': '🤖 Still waking up, please try again in a moment'})
+    if busy:
+        return busy
     try:
         data = request.get_json()
         user_id = data.get('userId', 'default')
         user_message = data.get('message', '')
         conversation_history = data.get('conversationHistory', [])
         
-        print(f"📨 {user_id}: {user_message}")
-        print(f"📝 History: {conversation_history[-2:] if conversation_history else 'None'}")
-        
         # Get AI response - UPDATED METHOD
         response = ai.chat(user_message)  # CHANGED FROM quick_chat_with_memory to chat
         
-        print(f"🤖 AI: {response}")
+        log.info(f"📨 {user_id}: {user_message} (history {len(conversation_history)}) -> 🤖 {response}")
         return jsonify({'response': response})
         
     except Exception as e:
-        print(f"❌ Chat error: {e}")
+        log.error(f"❌ Chat error: {e}")
         return jsonify({'response': '🤖 Sorry, I encountered an error'})
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    busy = not_ready({'response': '🤖 Still waking up, please try again in a moment'})
+    if busy:
+        return busy
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '')
+    log.info(f"📨 {data.get('userId', 'default')} (stream): {user_message}")
+    
+    def events():
+        try:
+            for chunk in ai.chat_stream(user_message):
+                yield f"data: {json.dumps({'delta': chunk}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            log.error(f"❌ Chat stream error: {e}")
+            yield f"data: {json.dumps({'delta': '🤖 Sorry, I encountered an error'})}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/chat/batch', methods=['POST'])
+def chat_batch():
+    busy = not_ready({'results': []})
+    if busy:
+        return busy
+    try:
+        data = request.get_json(silent=True) or {}
+        messages = data.get('messages', [])
+        if not isinstance(messages, list) or not messages:
+            return jsonify({'results': [], 'error': 'messages must be a non-empty list'}), 400
+        if len(messages) > MAX_BATCH:
+            return jsonify({'results': [], 'error': f'at most {MAX_BATCH} messages per batch'}), 400
+        # A malformed item gets its own error; the rest of the batch is still answered
+        results = [None] * len(messages)
+        questions = []
+        for i, m in enumerate(messages):
+            message = m.get('message') if isinstance(m, dict) else m
+            if isinstance(message, str) and message.strip():
+                questions.append((i, message))
+            else:
+                results[i] = {'message': message, 'error': 'message must be a non-empty string'}
+
+        start = time.time()
+        if questions:
+            answers = ai.chat_many([message for _, message in questions])
+            for (i, _), answer in zip(questions, answers):
+                results[i] = answer
+        log.info(f"📦 Batch of {len(questions)} answered in {time.time() - start:.2f}s ({len(messages) - len(questions)} rejected)")
+        return jsonify({'results': results, 'total_time': round(time.time() - start, 4)})
+        
+    except Exception as e:
+        print(f"❌ Batch chat error: {e}")
+        return jsonify({'results': [], 'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET', 'POST'])
+def search():
+    busy = not_ready({'query': '', 'results': []})
+    if busy:
+        return busy
+    try:
+        data = request.get_json(silent=True) or request.args
+        query = data.get('q', '') or data.get('message', '')
+        k = int(data.get('k', ai.search_k))
+        return jsonify({'query': query, 'results': ai.search(query, k)})
+    except Exception as e:
+        print(f"❌ Search error: {e}")
+        return jsonify({'query': '', 'results': [], 'error': str(e)})
+
 @app.route('/api/teach', methods=['POST'])
 def teach():
+    busy = not_ready({'success': False})
+    if busy:
+        return busy
     try:
         data = request.get_json()
         topic = data.get('topic', 'general').strip()
@@ -59,14 +169,15 @@ def teach():
         if not fact:
             return jsonify({'success': False, 'error': 'No fact provided'})
         
-        ai.add_knowledge(topic, fact)
+        added = ai.add_knowledge(topic, fact)
         
         # Get updated stats
         stats = ai.get_stats()
         
         return jsonify({
             'success': True,
-            'message': f'✅ Learned: {fact[:50]}...',
+            'added': added,
+            'message': f'✅ Learned: {fact[:50]}...' if added else f'ℹ️ Already known: {fact[:50]}...',
             'topic': topic,
             'total_facts': stats['total_facts']
         })
@@ -74,26 +185,61 @@ def teach():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+@app.route('/api/teach/bulk', methods=['POST'])
+def teach_bulk():
+    # NDJSON body, one {"topic": ..., "fact": ...} per line, read as it streams in
+    busy = not_ready({'success': False})
+    if busy:
+        return busy
+    try:
+        start = time.time()
+        report = ai.add_many(request.stream)
+        log.info(f"📥 Bulk teach: {report['accepted']} accepted, {report['rejected']} rejected in {time.time() - start:.2f}s")
+        return jsonify(dict(report, success=True, total_facts=ai.get_stats()['total_facts'],
+                            total_time=round(time.time() - start, 4)))
+    except Exception as e:
+        log.error(f"❌ Bulk teach error: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/stats', methods=['GET'])
 def stats():
+    busy = not_ready({'total_facts': 0})
+    if busy:
+        return busy
     stats = ai.get_stats()
     return jsonify({
         'total_facts': stats['total_facts'],
         'total_topics': len(stats['topics']),
         'topics': stats['topics'],
         'google_enabled': stats['google_enabled'],
-        'deepseek_enabled': stats['deepseek_enabled']
+        'deepseek_enabled': stats['deepseek_enabled'],
+        'store': stats['store'],
+        'cache': stats['cache'],
+        'coalescing': stats['coalescing'],
+        'learning': stats['learning'],
+        'load_phases': stats['load_phases']
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition; gauges that need knowledge are skipped while loading
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health():
-    stats = ai.get_stats()
-    return jsonify({
-        'status': 'healthy',
+    # Always 200 so platform health checks pass while the index is still loading
+    ready = ai.ready.is_set()
+    health = {
+        'status': 'healthy' if ready else 'starting',
         'service': 'Clipix AI Mobile API',
-        'facts': stats['total_facts'],
+        'ready': ready,
+        'load_phases': ai.get_load_phases(),
+        'providers': ai.get_provider_health(),
         'timestamp': time.time()
-    })
+    }
+    if ready:
+        health['facts'] = ai.get_stats()['total_facts']
+    return jsonify(health)
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,71 @@
+# conftest.py - Shared fixtures for the Clipix test suite
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clipix_store import open_store  # noqa: E402
+
+FACTS = {
+    'technology': [
+        'Python is a programming language created by Guido van Rossum',
+        'JavaScript runs in every web browser',
+        'Linux is an operating system kernel written by Linus Torvalds',
+    ],
+    'science': [
+        'Photosynthesis converts sunlight into chemical energy in plants',
+        'Water boils at 100 degrees Celsius at sea level',
+        'Boats float because they displace their weight in water',
+    ],
+    'geography': [
+        'The capital of France is Paris',
+        'The capital of Japan is Tokyo',
+    ],
+}
+
+
+def write_knowledge(path, knowledge_base):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'knowledge_base': knowledge_base}, f)
+
+
+@pytest.fixture(params=['json', 'shared', 'sqlite'])
+def store(request, tmp_path):
+    """Each store backend, loaded with FACTS."""
+    knowledge_file = str(tmp_path / 'ai_knowledge.json')
+    write_knowledge(knowledge_file, FACTS)
+    options = {'snapshot_file': str(tmp_path / 'ai_knowledge.snapshot')} if request.param == 'shared' else {}
+    store = open_store(request.param, knowledge_file, str(tmp_path / 'journal.ndjson'),
+                       str(tmp_path / 'ai_knowledge.db'), **options)
+    store.load()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def make_ai(tmp_path, monkeypatch):
+    """Build a ClipixAI that keeps its files in tmp_path and has no upstream keys."""
+    from clipix_core import ClipixAI
+
+    made = []
+
+    def make(knowledge_base=None, **env):
+        monkeypatch.chdir(tmp_path)
+        for key in ('GOOGLE_API_KEY', 'SEARCH_ENGINE_ID', 'DEEPSEEK_API_KEY'):
+            monkeypatch.delenv(key, raising=False)
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        write_knowledge('ai_knowledge.json', FACTS if knowledge_base is None else knowledge_base)
+        ai = ClipixAI(load=False)
+        ai.load_knowledge()
+        made.append(ai)
+        return ai
+
+    yield make
+    for ai in made:
+        if ai.learning:
+            ai.learning.close()
+        ai.store.close()
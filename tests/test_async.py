@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+from clipix_learning import LearningQueue
+
+ANSWER = 'Quokkas are small wallabies that live on Rottnest Island near Perth'
+
+
+def upstream(ai, answer=ANSWER):
+    ai.google_enabled = True
+
+    async def google(query, search_type='standard'):
+        return answer
+
+    ai._afast_google_search = google
+
+
+def test_memory_search_runs_off_the_event_loop(make_ai):
+    ai = make_ai()
+    threads = []
+    search = ai._instant_memory_search
+
+    def spy(question, analysis=None):
+        threads.append(threading.current_thread())
+        return search(question, analysis)
+
+    ai._instant_memory_search = spy
+    response = asyncio.run(ai.achat('Tell me about photosynthesys'))
+    assert 'Photosynthesis' in response
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_inline_learning_writes_off_the_event_loop(make_ai):
+    ai = make_ai(CLIPIX_LEARN_QUEUE=0)
+    upstream(ai)
+    threads = []
+    add = ai.store.add
+
+    def spy(category, fact):
+        threads.append(threading.current_thread())
+        return add(category, fact)
+
+    ai.store.add = spy
+    assert ANSWER in asyncio.run(ai.achat('What do quokkas eat?'))
+    assert threads and threads[0] is not threading.main_thread()
+    assert ai.store.search(['quokkas', 'rottnest'], 1)
+
+
+def test_full_learning_queue_sheds_instead_of_blocking_the_loop(make_ai):
+    ai = make_ai(CLIPIX_LEARN_BLOCK=5)
+    upstream(ai)
+    ai.learning.close()
+    # A worker that never starts keeps the one-slot queue full
+    ai.learning = LearningQueue(ai.store, max_pending=1, block_timeout=5, ready=threading.Event())
+    ai.learning.put('general', 'a fact that fills the queue for this test')
+    started = time.monotonic()
+    assert ANSWER in asyncio.run(ai.achat('What do quokkas eat?'))
+    assert time.monotonic() - started < 1
+    assert ai.learning.stats()['shed'] == 1
@@ -0,0 +1,94 @@
+# test_cache.py - Coalescing of identical upstream calls
+import asyncio
+import threading
+
+import pytest
+
+from clipix_cache import AsyncSingleFlight, SingleFlight
+
+
+def run_together(flight, queries, func):
+    results, errors = {}, {}
+
+    def call(i, query):
+        try:
+            results[i] = flight.do('standard', query, func)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=call, args=(i, query)) for i, query in enumerate(queries)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def test_identical_queries_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        release.wait(5)
+        return 'answer'
+
+    threads, results, errors = run_together(flight, ['Who won?'] + ['  who WON? '] * 7, upstream)
+    while flight.stats()['waiting'] < 7:
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert list(results.values()) == ['answer'] * 8 and not errors
+    assert flight.stats() == dict(calls=1, coalesced=7, in_flight=0, waiting=0, coalesce_rate=0.875)
+
+
+def test_waiters_share_the_leaders_error_and_the_next_call_retries():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise RuntimeError('upstream down')
+
+    threads, results, errors = run_together(flight, ['q'] * 3, failing)
+    while flight.stats()['waiting'] < 2:
+        release.wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 3 and all(str(e) == 'upstream down' for e in errors.values())
+    assert flight.do('standard', 'q', lambda: 'recovered') == 'recovered'
+
+
+def test_different_queries_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do('standard', 'one', lambda: 1) == 1
+    assert flight.do('standard', 'two', lambda: 2) == 2
+    assert flight.do('news', 'one', lambda: 3) == 3
+    assert flight.stats()['coalesced'] == 0
+
+
+def test_async_flight_survives_a_cancelled_caller():
+    async def main():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await release.wait()
+            return 'answer'
+
+        first = asyncio.ensure_future(flight.do('standard', 'q', upstream))
+        second = asyncio.ensure_future(flight.do('standard', 'Q', upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        assert await second == 'answer'
+        assert calls == [1]
+        assert flight.stats()['in_flight'] == 0
+
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+import random
+
+from clipix_index import KnowledgeIndex, TrigramIndex, edit_distance, query_terms, resolve_with
+
+
+def ask(store, question):
+    return store.search(query_terms(question), 1, min_match=2, fresh_only=True)
+
+
+def test_single_misspelled_word_hits_memory(store):
+    assert ask(store, 'pyhton')[0]['fact'].startswith('Python')
+    assert ask(store, 'Tell me about photosynthesys')[0]['fact'].startswith('Photosynthesis')
+
+
+def test_misspelling_beside_typed_word_hits_memory(store):
+    assert ask(store, 'What is the capital of Frnace?')[0]['fact'] == 'The capital of France is Paris'
+
+
+def test_unknown_word_without_typed_word_misses(store):
+    # 'goat' is one edit from 'boats' only by length, and 'quokka' is not correctable
+    assert ask(store, 'goat') == []
+    assert ask(store, 'quokka habitat') == []
+
+
+def test_short_typos_are_corrected():
+    spelling = TrigramIndex()
+    for word in ('python', 'hello', 'world'):
+        spelling.add(word)
+    assert spelling.correct('pythn') == 'python'
+    assert spelling.correct('helo') == 'hello'
+    assert spelling.correct('wrld') == 'world'
+
+
+def test_ambiguous_correction_needs_a_frequency_margin():
+    spelling = TrigramIndex()
+    for word in ('boat', 'coat', 'moat'):
+        spelling.add(word)
+    assert spelling.correct('goat', weight=lambda word: 1) is None
+    assert spelling.correct('goat') is None
+    frequent = TrigramIndex()
+    for word in ('boat', 'coat'):
+        frequent.add(word)
+    assert frequent.correct('goat', weight={'boat': 10, 'coat': 1}.get) == 'boat'
+
+
+def test_correction_cache_is_dropped_when_the_vocabulary_changes():
+    spelling = TrigramIndex()
+    spelling.add('pythons')
+    assert spelling.correct('pythonz') == 'pythons'
+    fork = spelling.fork()
+    fork.add('pythonz')
+    fork.remove('pythons')
+    assert fork.correct('pythonx') == 'pythonz'
+    assert spelling.correct('pythonz') == 'pythons'
+
+
+def test_resolve_with_stops_correcting_once_the_query_is_rejected():
+    calls = []
+
+    def correct(term):
+        calls.append(term)
+        return None
+
+    assert resolve_with(['zzzz', 'yyyy'], lambda term: False, correct) == ([], set())
+    assert calls == ['zzzz']
+
+
+def test_corrected_terms_rank_below_typed_terms():
+    index = KnowledgeIndex()
+    index.add('a', 'planet mercury orbits closest')
+    index.add('b', 'planets orbit the sun')
+    # 'planett' corrects to 'planet'; a typed 'planets' outranks the guess
+    hits = index.search(['planett', 'planets'], 2)
+    assert [fact_id for _, fact_id in hits][0] == 1
+
+
+def test_only_corrections_that_reach_a_result_are_counted():
+    index = KnowledgeIndex()
+    index.add('science', 'Photosynthesis converts sunlight into chemical energy')
+    index.search(['photosynthesys'], 1)
+    assert index.trigrams.corrections == 1
+    # Corrected, but the query needs both words and nothing matches both
+    index.search(['photosynthesys', 'quokka'], 1, min_match=2)
+    assert index.trigrams.corrections == 1
+
+
+def full_osa(a, b):
+    d = [[max(i, j) if not (i and j) else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+
+def test_banded_edit_distance_matches_the_full_table():
+    rng = random.Random(7)
+    for _ in range(2000):
+        a = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+        b = ''.join(rng.choice('abc') for _ in range(rng.randint(0, 7)))
+        limit = rng.randint(0, 3)
+        assert edit_distance(a, b, limit) == min(full_osa(a, b), limit + 1), (a, b, limit)
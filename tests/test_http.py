@@ -0,0 +1,126 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from clipix_http import AsyncProviderClient, CircuitBreaker, ProviderClient, ProviderUnavailable
+
+
+def async_client(handler, breaker):
+    client = AsyncProviderClient(ProviderClient('test', 'http://upstream.test/', retries=0, breaker=breaker))
+    client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_breaker_opens_after_failures_and_probes_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_and_open_breaker_rejects(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('clipix_http.time.monotonic', lambda: now[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0)
+    breaker.record(False)
+    assert not breaker.allow()
+    now[0] += 30
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.stats() == dict(opened=2, rejected=2, state='open', failures=2, retry_in=30.0)
+
+
+def test_sync_client_refuses_calls_while_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    client = ProviderClient('test', 'http://upstream.test/', retries=0, breaker=breaker)
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(method)
+        raise requests.exceptions.ConnectionError('refused')
+
+    client.session.request = request
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get()
+    with pytest.raises(ProviderUnavailable):
+        client.get()
+    assert len(calls) == 2
+    assert client.stats()['failures'] == 2
+
+
+def test_cancelled_async_request_is_not_a_breaker_failure():
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    async def slow(request):
+        await asyncio.sleep(10)
+
+    async def run():
+        client = async_client(slow, breaker)
+        task = asyncio.ensure_future(client.get())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.close()
+        return client
+
+    client = asyncio.run(run())
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert client.stats()['failures'] == 0
+
+
+def test_cancelled_probe_lets_the_next_call_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record(False)
+
+    async def slow(request):
+        await asyncio.sleep(10)
+
+    async def ok(request):
+        return httpx.Response(200, json={})
+
+    async def run():
+        client = async_client(slow, breaker)
+        task = asyncio.ensure_future(client.get())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.close()
+        client = async_client(ok, breaker)
+        response = await client.get()
+        await client.close()
+        return response
+
+    assert asyncio.run(run()).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_request_errors_count_as_failures():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+    async def broken(request):
+        raise httpx.ConnectError('refused')
+
+    async def run():
+        client = async_client(broken, breaker)
+        with pytest.raises(httpx.ConnectError):
+            await client.get()
+        with pytest.raises(ProviderUnavailable):
+            await client.get()
+        await client.close()
+
+    asyncio.run(run())
+    assert breaker.state == CircuitBreaker.OPEN
@@ -0,0 +1,124 @@
+# test_index.py - BM25 retrieval and the copy-on-write tables behind index forks
+import math
+import random
+from collections import Counter
+
+import pytest
+
+from clipix_index import TABLE_CHUNK_MASK, ChunkedTable, KnowledgeIndex, ShardedMap, tokenize
+
+WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet',
+         'kilo', 'lima', 'mike', 'november', 'oscar', 'papa', 'quebec', 'romeo', 'sierra', 'tango']
+
+
+def random_index(seed, facts=600, removed=80):
+    rng = random.Random(seed)
+    index = KnowledgeIndex(fuzzy=False)
+    texts = []
+    for i in range(facts):
+        # A skewed vocabulary gives both long and short posting lists
+        words = [rng.choice(WORDS[:rng.randint(3, len(WORDS))]) for _ in range(rng.randint(3, 14))]
+        texts.append(' '.join(words) + f' fact{i}')
+        index.add('general', texts[-1], timestamp=0)
+    for text in rng.sample(texts, removed):
+        index.remove('general', text)
+    return index
+
+
+def brute_force(index, terms, min_match=1):
+    # Every live fact scored with the BM25 formula, no pruning
+    terms = list(dict.fromkeys(t for t in terms if t in index.postings))
+    count = index.live_count
+    avg_length = index.total_length / count
+    scores = {}
+    for fact_id, record in index.live():
+        counts = Counter(tokenize(record.text))
+        matched = [t for t in terms if counts[t]]
+        if not matched or len(matched) < min(min_match, len(terms)):
+            continue
+        norm = index.k1 * (1 - index.b + index.b * index.lengths[fact_id] / avg_length)
+        scores[fact_id] = sum(
+            math.log(1 + (count - index.doc_freq[t] + 0.5) / (index.doc_freq[t] + 0.5))
+            * counts[t] * (index.k1 + 1) / (counts[t] + norm)
+            for t in matched
+        )
+    return scores
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('k, min_match', [(1, 1), (5, 1), (10, 2), (50, 1)])
+def test_maxscore_matches_brute_force(seed, k, min_match):
+    index = random_index(seed)
+    rng = random.Random(seed + 100)
+    for _ in range(20):
+        terms = rng.sample(WORDS, rng.randint(1, 5))
+        expected = brute_force(index, terms, min_match)
+        hits = index.search(terms, k, min_match=min_match)
+        best = sorted(expected.values(), reverse=True)[:k]
+        assert [score for score, _ in hits] == pytest.approx(best)
+        for score, fact_id in hits:
+            assert expected[fact_id] == pytest.approx(score)
+
+
+def test_search_many_matches_search():
+    index = random_index(7)
+    rng = random.Random(7)
+    queries = [rng.sample(WORDS, rng.randint(1, 4)) for _ in range(30)]
+    batched = index.search_many(queries, 5, min_match=2)
+    for terms, hits in zip(queries, batched):
+        single = index.search(terms, 5, min_match=2)
+        assert [fact_id for _, fact_id in hits] == [fact_id for _, fact_id in single]
+        assert [score for score, _ in hits] == pytest.approx([score for score, _ in single])
+
+
+def test_chunked_table_fork_copies_only_written_chunks():
+    parent = ChunkedTable('H')
+    parent.extend(i % 1000 for i in range(3 * (TABLE_CHUNK_MASK + 1) + 5))
+    child = parent.fork()
+    child[0] = 999
+    child.append(7)
+    assert parent[0] == 0 and len(parent) == 3 * (TABLE_CHUNK_MASK + 1) + 5
+    assert child[0] == 999 and child[len(child) - 1] == 7
+    assert child.chunks[0] is not parent.chunks[0]
+    assert child.chunks[1] is parent.chunks[1]
+    assert child.chunks[3] is not parent.chunks[3]
+    assert list(child)[1:len(parent)] == list(parent)[1:]
+
+
+def test_chunked_table_extend_fills_chunk_boundaries():
+    table = ChunkedTable()
+    table.extend(range(TABLE_CHUNK_MASK))
+    table.extend(range(3))
+    assert len(table) == TABLE_CHUNK_MASK + 3
+    assert len(table.chunks) == 2
+    with pytest.raises(IndexError):
+        table[len(table)] = 0
+
+
+def test_sharded_map_fork_copies_only_written_shards():
+    parent = ShardedMap()
+    for i in range(5000):
+        parent[f'word{i}'] = i
+    child = parent.fork()
+    child['word1'] = -1
+    del child['word2']
+    child['new'] = 1
+    assert parent['word1'] == 1 and 'word2' in parent and 'new' not in parent
+    assert child['word1'] == -1 and 'word2' not in child and child['new'] == 1
+    assert len(parent) == 5000 and len(child) == 5000
+    shared = sum(a is b for a, b in zip(parent.shards, child.shards))
+    assert shared >= len(parent.shards) - 3
+
+
+def test_index_fork_leaves_parent_searchable_as_before():
+    parent = random_index(3, facts=200, removed=0)
+    before = parent.search(['alpha', 'bravo'], 10)
+    facts = [record.text for _, record in parent.live()]
+    child = parent.fork()
+    for text in facts[:50]:
+        child.remove('general', text)
+    child.add('general', 'alpha alpha alpha bravo bravo', timestamp=0)
+    assert parent.search(['alpha', 'bravo'], 10) == before
+    assert len(parent) == 200 and len(child) == 151
+    assert child.search(['alpha', 'bravo'], 1)[0][1] == len(parent.records)
+    assert child.generation == parent.generation + 1
@@ -0,0 +1,94 @@
+import io
+
+import pytest
+import requests
+
+from clipix_http import QuotaBudget
+
+def response(status, body=b'{}'):
+    r = requests.Response()
+    r.status_code = status
+    r._content = body
+    r.raw = io.BytesIO(body)
+    return r
+
+
+@pytest.fixture
+def google(make_ai):
+    """ClipixAI with Google on, whose HTTP attempts are served from a scripted list."""
+    ai = make_ai(GOOGLE_API_KEY='key', SEARCH_ENGINE_ID='engine', GOOGLE_DAILY_QUOTA=10, GOOGLE_QUOTA_RESERVE=0)
+    ai.google_client.backoff = 0
+    script = []
+    attempts = []
+
+    def request(method, url, **kwargs):
+        attempts.append(url)
+        return script.pop(0)
+
+    ai.google_client.session.request = request
+    return ai, script, attempts
+
+
+def test_every_retry_is_charged_to_the_quota(google):
+    ai, script, attempts = google
+    script.extend([response(503), response(503), response(200, b'{"items": [{"title": "T", "snippet": "S"}]}')])
+    assert ai._google_request('who won', 'standard') == 'T: S'
+    assert len(attempts) == 3
+    assert ai.google_quota.stats()['used'] == 3
+
+
+def test_quota_error_is_not_retried(google):
+    ai, script, attempts = google
+    script.extend([response(429, b'{"error": {"message": "Quota exceeded for quota metric"}}')] * 3)
+    assert ai._google_request('who won', 'standard').startswith('Google Error: 429')
+    assert len(attempts) == 1
+    assert ai.google_quota.stats()['used'] == 1
+    assert ai.google_quota.stats()['exhausted']
+
+
+def test_retry_stops_when_the_budget_runs_out(google):
+    ai, script, attempts = google
+    ai.google_quota.daily_limit = 1
+    script.extend([response(503)] * 3)
+    assert ai._google_request('who won', 'standard').startswith('Google Error: 503')
+    assert len(attempts) == 1
+    assert ai.google_quota.stats()['used'] == 1
+
+
+def test_budget_holds_back_the_reserve_for_priority_calls():
+    budget = QuotaBudget(daily_limit=3, reserve=1)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    assert budget.try_spend(priority=True)
+    assert not budget.try_spend(priority=True)
+    assert budget.stats() == dict(denied=2, daily_limit=3, reserve=1, used=3, remaining=0, exhausted=False)
+
+
+def test_refund_gives_back_a_call_that_never_left():
+    budget = QuotaBudget(daily_limit=1)
+    assert budget.try_spend()
+    budget.refund()
+    assert budget.try_spend()
+    budget.refund()
+    budget.refund()
+    assert budget.stats()['used'] == 0
+
+
+def test_provider_exhaustion_and_the_day_rolling_over(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr('clipix_http.time.time', lambda: now[0])
+    budget = QuotaBudget(daily_limit=5)
+    assert budget.try_spend()
+    budget.exhaust()
+    assert not budget.try_spend(priority=True)
+    assert budget.stats()['remaining'] == 0
+    now[0] += 86400
+    assert budget.stats()['used'] == 0
+    assert budget.try_spend()
+    assert not budget.stats()['exhausted']
+
+
+def test_zero_limit_means_unlimited():
+    budget = QuotaBudget(daily_limit=0)
+    assert all(budget.try_spend() for _ in range(1000))
+    assert budget.stats()['remaining'] is None
@@ -0,0 +1,143 @@
+# test_store.py - Journal recovery, snapshots and the store shared between processes
+import json
+import multiprocessing
+import os
+
+from clipix_index import KnowledgeIndex
+from clipix_snapshot import MappedIndex, read_snapshot, write_snapshot
+from clipix_store import KnowledgeJournal, SharedKnowledgeStore, open_store
+
+from conftest import FACTS, write_knowledge
+
+
+def journal_lines(path):
+    with open(path, 'rb') as f:
+        return f.read().split(b'\n')
+
+
+def test_journal_replay_drops_torn_tail(tmp_path):
+    path = str(tmp_path / 'journal.ndjson')
+    journal = KnowledgeJournal(path)
+    journal.append_many([('add', 'science', 'Water is wet', None), ('add', 'science', 'Ice is cold', None)])
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'{"op": "add", "category": "sci')
+    journal = KnowledgeJournal(path)
+    assert [record['fact'] for record in journal.replay()] == ['Water is wet', 'Ice is cold']
+    assert journal_lines(path)[-1] == b''
+
+    journal.append('add', 'science', 'Steam is hot')
+    journal.close()
+    facts = [record['fact'] for record in KnowledgeJournal(path).replay()]
+    assert facts == ['Water is wet', 'Ice is cold', 'Steam is hot']
+
+
+def test_journal_replay_stops_at_garbled_record(tmp_path):
+    path = str(tmp_path / 'journal.ndjson')
+    with open(path, 'wb') as f:
+        f.write(b'{"op": "add", "category": "a", "fact": "one"}\nnot json\n')
+        f.write(b'{"op": "add", "category": "a", "fact": "two"}\n')
+    assert [record['fact'] for record in KnowledgeJournal(path).replay()] == ['one']
+    assert os.path.getsize(path) == len(b'{"op": "add", "category": "a", "fact": "one"}\n')
+
+
+def test_shared_journal_append_trims_torn_tail(tmp_path):
+    path = str(tmp_path / 'journal.ndjson')
+    with open(path, 'wb') as f:
+        f.write(b'{"op": "add", "category": "a", "fact": "one"}\n{"op": "ad')
+    KnowledgeJournal(path, shared=True).append('add', 'a', 'two')
+    assert [record['fact'] for record in KnowledgeJournal(path).replay()] == ['one', 'two']
+
+
+def test_store_recovers_journaled_facts_after_a_crash(tmp_path):
+    knowledge_file, journal_file = str(tmp_path / 'ai_knowledge.json'), str(tmp_path / 'journal.ndjson')
+    write_knowledge(knowledge_file, FACTS)
+    store = open_store('json', knowledge_file, journal_file, None, compact_every=1000)
+    store.load()
+    store.add('science', 'Sound travels faster in water than in air')
+    store.remove('geography', 'The capital of Japan is Tokyo')
+    store.journal.close()
+    # Killed mid-append: the last record is cut short and nothing was saved
+    with open(journal_file, 'ab') as f:
+        f.write(b'{"op": "add", "category": "science", "fact": "Half a fa')
+
+    recovered = open_store('json', knowledge_file, journal_file, None)
+    assert recovered.load() == 2
+    facts = set(recovered.facts())
+    assert ('science', 'Sound travels faster in water than in air') in facts
+    assert ('geography', 'The capital of Japan is Tokyo') not in facts
+    assert not any(fact.startswith('Half') for _, fact in facts)
+    recovered.close()
+
+
+def test_snapshot_round_trip(tmp_path):
+    index = KnowledgeIndex(fuzzy=False)
+    for category, facts in FACTS.items():
+        for i, fact in enumerate(facts):
+            index.add(category, fact, flags=i % 2, timestamp=1000.0 + i)
+    index.add('science', 'The capital of France is Paris')
+    index.remove('geography', 'The capital of Japan is Tokyo')
+    path = str(tmp_path / 'ai_knowledge.idx')
+    write_snapshot(path, index, generation=7)
+
+    mapped = MappedIndex(path)
+    loaded = read_snapshot(path, fuzzy=True)
+    for copy in (mapped, loaded):
+        assert copy.generation == 7
+        assert len(copy) == len(index)
+        assert sorted((r.category, r.text, r.timestamp, r.flags) for _, r in copy.live()) == \
+            sorted((r.category, r.text, r.timestamp, r.flags) for _, r in index.live())
+        assert copy.lookup('science', 'The capital of France is Paris') is not None
+        assert copy.lookup('geography', 'The capital of Japan is Tokyo') is None
+        for terms in (['capital', 'france'], ['water'], ['python', 'language']):
+            texts = [copy.records[fact_id].text for _, fact_id in copy.search(terms, 3)]
+            assert texts == [index.records[fact_id].text for _, fact_id in index.search(terms, 3)]
+
+    # The loaded copy is an ordinary index again: writable, and correcting typos
+    loaded.fork().add('science', 'Snapshots are plain files')
+    assert loaded.search(['pyhton'], 1)
+
+
+def shared_store(tmp_path, compact_every=1000):
+    return SharedKnowledgeStore(str(tmp_path / 'ai_knowledge.json'), str(tmp_path / 'journal.ndjson'),
+                                str(tmp_path / 'ai_knowledge.idx'), compact_every=compact_every, poll_interval=0)
+
+
+def teach(tmp_path, worker, count, compact_every):
+    store = shared_store(tmp_path, compact_every)
+    store.load()
+    for i in range(count):
+        store.add('workers', f'Worker {worker} learned fact number {i} today')
+    store.close()
+
+
+def test_two_processes_share_one_store(tmp_path):
+    write_knowledge(str(tmp_path / 'ai_knowledge.json'), FACTS)
+    store = shared_store(tmp_path)
+    store.load()
+    context = multiprocessing.get_context('spawn')
+    # A small compaction interval makes both workers rebuild the snapshot under each other
+    workers = [context.Process(target=teach, args=(tmp_path, worker, 40, 25)) for worker in range(2)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+
+    store.refresh(force=True)
+    facts = set(store.facts())
+    for worker in range(2):
+        for i in range(40):
+            assert ('workers', f'Worker {worker} learned fact number {i} today') in facts
+    assert ('science', 'Water boils at 100 degrees Celsius at sea level') in facts
+    assert store.search(['worker', 'learned'], 3)
+
+    # Writes from this process reach a store opened afterwards, as they would another worker
+    store.remove('science', 'Water boils at 100 degrees Celsius at sea level')
+    other = shared_store(tmp_path)
+    other.load()
+    assert ('science', 'Water boils at 100 degrees Celsius at sea level') not in set(other.facts())
+    with open(str(tmp_path / 'ai_knowledge.json'), encoding='utf-8') as f:
+        assert 'workers' in json.load(f)['knowledge_base']
+    other.close()
+    store.close()
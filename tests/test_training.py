@@ -0,0 +1,168 @@
+# test_training.py - Incremental training from the documents folder
+import json
+import os
+
+import pytest
+
+import clipix_core
+from clipix_core import unpack_keys
+from clipix_snapshot import fact_key
+
+OCEAN = 'The Pacific Ocean is the largest and deepest of the oceans on our planet Earth.'
+DESERT = 'The Sahara is the largest hot desert and covers most of North Africa today.'
+MOUNTAIN = 'Mount Everest is the highest mountain above sea level on the whole planet.'
+
+
+def write_doc(name, *paragraphs, folder='geography'):
+    path = os.path.join('documents', folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n\n'.join(paragraphs))
+    return path
+
+
+def stored(ai):
+    return set(ai.store.facts())
+
+
+def manifest():
+    with open('training_manifest.json', encoding='utf-8') as f:
+        return json.load(f)['files']
+
+
+@pytest.fixture(params=['json', 'shared', 'sqlite'])
+def ai(request, make_ai):
+    return make_ai({}, CLIPIX_STORE=request.param, CLIPIX_TRAIN_WORKERS=1)
+
+
+def test_training_adds_changes_and_removes(ai):
+    path = write_doc('earth.txt', OCEAN, DESERT)
+    assert ai.train_from_documents() == 2
+    assert stored(ai) == {('geography', OCEAN), ('geography', DESERT)}
+
+    write_doc('earth.txt', OCEAN, MOUNTAIN)
+    assert ai.train_from_documents() == 1
+    assert stored(ai) == {('geography', OCEAN), ('geography', MOUNTAIN)}
+
+    os.remove(path)
+    write_doc('other.txt', DESERT)
+    ai.train_from_documents()
+    assert stored(ai) == {('geography', DESERT)}
+    assert list(manifest()) == [os.path.join('documents', 'geography', 'other.txt')]
+
+
+def test_fact_kept_while_another_document_provides_it(ai):
+    first = write_doc('a.txt', OCEAN)
+    write_doc('b.txt', OCEAN, DESERT)
+    ai.train_from_documents()
+    os.remove(first)
+    ai.train_from_documents()
+    assert stored(ai) == {('geography', OCEAN), ('geography', DESERT)}
+
+
+def test_manifest_keeps_keys_not_facts(make_ai):
+    ai = make_ai({}, CLIPIX_TRAIN_WORKERS=1)
+    path = write_doc('earth.txt', OCEAN, DESERT)
+    ai.train_from_documents()
+    entry = manifest()[path]
+    assert 'facts' not in entry
+    assert entry['fact_count'] == 2
+    assert list(unpack_keys(entry['keys'])) == sorted([fact_key('geography', OCEAN), fact_key('geography', DESERT)])
+
+
+def test_touched_document_is_not_parsed_again(make_ai, monkeypatch):
+    ai = make_ai({}, CLIPIX_TRAIN_WORKERS=1)
+    path = write_doc('earth.txt', OCEAN)
+    ai.train_from_documents()
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+
+    def fail(file_path):
+        raise AssertionError(f"{file_path} was parsed again")
+
+    monkeypatch.setattr(clipix_core, 'read_document_facts', fail)
+    assert ai.train_from_documents() == 0
+    assert manifest()[path]['mtime'] == stat.st_mtime + 10
+    assert stored(ai) == {('geography', OCEAN)}
+
+
+def test_manifest_with_fact_lists_is_migrated(make_ai):
+    ai = make_ai({}, CLIPIX_TRAIN_WORKERS=1)
+    path = write_doc('earth.txt', OCEAN, DESERT)
+    ai.train_from_documents()
+    entry = manifest()[path]
+    del entry['keys']
+    entry['facts'] = [['geography', OCEAN], ['geography', DESERT]]
+    with open('training_manifest.json', 'w', encoding='utf-8') as f:
+        json.dump({'files': {path: entry}}, f)
+
+    write_doc('earth.txt', OCEAN)
+    ai.train_from_documents()
+    assert stored(ai) == {('geography', OCEAN)}
+    assert 'facts' not in manifest()[path]
+
+
+def test_streamed_document_is_diffed_and_retired(make_ai):
+    ai = make_ai({}, CLIPIX_TRAIN_WORKERS=1, CLIPIX_STREAM_THRESHOLD_MB=0)
+    path = write_doc('earth.txt', OCEAN, DESERT)
+    assert ai.train_from_documents() == 2
+    assert manifest()[path]['streamed']
+
+    write_doc('earth.txt', OCEAN, MOUNTAIN)
+    ai.train_from_documents()
+    assert stored(ai) == {('geography', OCEAN), ('geography', MOUNTAIN)}
+
+    os.remove(path)
+    write_doc('other.txt', MOUNTAIN)
+    ai.train_from_documents()
+    assert stored(ai) == {('geography', MOUNTAIN)}
+
+
+NEAR_OCEAN = 'The Pacific Ocean is the largest and deepest of the oceans on our planet Earth today.'
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def dedup_ai(request, make_ai):
+    def make(**env):
+        return make_ai({}, CLIPIX_STORE=request.param, CLIPIX_TRAIN_WORKERS=1, CLIPIX_DEDUP='reject', **env)
+    return make
+
+
+def winner_and_loser(ai):
+    kept = stored(ai)
+    assert len(kept & {('geography', OCEAN), ('geography', NEAR_OCEAN)}) == 1
+    return ('a.txt', 'b.txt') if ('geography', OCEAN) in kept else ('b.txt', 'a.txt')
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_rejected_near_duplicate_is_readmitted_when_its_match_is_deleted(dedup_ai, streamed):
+    ai = dedup_ai(CLIPIX_STREAM_THRESHOLD_MB=0 if streamed else 16)
+    write_doc('a.txt', OCEAN, DESERT)
+    write_doc('b.txt', NEAR_OCEAN)
+    ai.train_from_documents()
+    winner, loser = winner_and_loser(ai)
+    assert manifest()[os.path.join('documents', 'geography', loser)]['rejected']
+
+    os.remove(os.path.join('documents', 'geography', winner))
+    ai.train_from_documents()
+    survivor = NEAR_OCEAN if loser == 'b.txt' else OCEAN
+    assert ('geography', survivor) in stored(ai)
+    assert 'rejected' not in manifest()[os.path.join('documents', 'geography', loser)]
+
+
+def test_rejected_near_duplicate_is_readmitted_when_its_match_is_edited_away(dedup_ai):
+    ai = dedup_ai()
+    write_doc('a.txt', OCEAN, DESERT)
+    write_doc('b.txt', NEAR_OCEAN, MOUNTAIN)
+    ai.train_from_documents()
+    winner, loser = winner_and_loser(ai)
+
+    # An unrelated edit to the loser's document keeps its rejection on record
+    write_doc(loser, NEAR_OCEAN if loser == 'b.txt' else OCEAN)
+    ai.train_from_documents()
+    assert manifest()[os.path.join('documents', 'geography', loser)]['rejected']
+
+    write_doc(winner, DESERT if winner == 'a.txt' else MOUNTAIN)
+    ai.train_from_documents()
+    assert len(stored(ai) & {('geography', OCEAN), ('geography', NEAR_OCEAN)}) == 1
+    assert ('geography', NEAR_OCEAN if loser == 'b.txt' else OCEAN) in stored(ai)